@@ -1,69 +1,403 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Blueprint, current_app, request, jsonify, render_template, Response, stream_with_context, g, has_request_context, abort
+from urllib.parse import urlencode
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import signal
+import gc
+import logging
+import re
+import json
+import textwrap
+import csv
+import io
+import click
+import threading
+import time
+import hmac
+import hashlib
+import functools
+import importlib
+import secrets
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import generate_etag
 import sys
 import os
-import google.generativeai as genai
 from flask_cors import CORS
-from sqlalchemy import inspect 
+from sqlalchemy import inspect, event, func, or_, and_, case, literal_column, table as sa_table, column as sa_column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from jobs import BoundedExecutor, QueueFull
+from cache import create_response_cache, make_cache_key, SingleFlight, TTLCache
+from migrations import run_migrations
+from llm_client import LLMClient, CircuitBreaker, CircuitOpen, create_llm_backend
+from similarity import VerifiedAnswerIndex
+from broadcast import EventBroker
+from metrics import Registry, configure_logging
+from profiler import SQLProfiler
+from database import configure_engine, engine_options
+from writebehind import WriteBehind, IdAllocator, Insert, Update
+from idempotency import IdempotencyStore, CLAIMED, COMPLETED, IN_FLIGHT, MISMATCH
+from revocation import RevocationList, token_id
+from transcribe import BatchingTranscriber, TranscriptionError, create_transcriber, decode_audio, iter_chunks, SAMPLE_RATE
 
 def shutdown_handler(signum, frame):
-    print("\nShutting down server...")
+    log.info("Shutting down server...")
+    # Commit the chat and query writes still queued before exiting
+    if write_behind is not None:
+        write_behind.close()
     sys.exit(0)
 
-signal.signal(signal.SIGINT, shutdown_handler)
+basedir = os.path.abspath(os.path.dirname(__file__))
 
+# Settings read from the environment; create_app(config) overrides any of them
+def default_config():
+    config = {}
+
+    # Configure PostgreSQL database
+    config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'caresync.db'))
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Connection pool per worker process (pool size plus overflow bounds the connections it
+    # opens; PostgreSQL connections are recycled after DB_POOL_RECYCLE seconds), and an
+    # optional PostgreSQL statement timeout
+    config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+    config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+    # SQLite connection settings: WAL journal, NORMAL sync, how long a writer waits for
+    # the lock before "database is locked", and bytes of the file read through mmap
+    config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '10000'))
+    config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+    # Signs session tokens; set SECRET_KEY so that every worker accepts the same tokens
+    config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+    config['SESSION_TOKEN_TTL'] = int(os.getenv('SESSION_TOKEN_TTL', str(12 * 3600)))
+    # Seconds a worker may go before it picks up tokens revoked by logouts in other workers
+    config['SESSION_REVOCATION_REFRESH'] = float(os.getenv('SESSION_REVOCATION_REFRESH', '2'))
+    # Werkzeug KDF spec, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1
+    config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+
+    # Background LLM generation for async /api/ai_query requests
+    config['LLM_WORKERS'] = int(os.getenv('LLM_WORKERS', '4'))
+    config['LLM_QUEUE_DEPTH'] = int(os.getenv('LLM_QUEUE_DEPTH', '32'))
+    config['LLM_RETRY_AFTER'] = int(os.getenv('LLM_RETRY_AFTER', '5'))
+    config['LLM_MAX_WAIT'] = int(os.getenv('LLM_MAX_WAIT', '30'))
+
+    # Cache of LLM answers keyed on the normalized query plus patient context
+    config['LLM_CACHE_BACKEND'] = os.getenv('LLM_CACHE_BACKEND', 'memory')  # memory, sqlite or none
+    config['LLM_CACHE_PATH'] = os.getenv('LLM_CACHE_PATH', os.path.join(basedir, 'llm_cache.db'))
+    config['LLM_CACHE_MAX_ENTRIES'] = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1024'))
+    config['LLM_CACHE_MAX_BYTES'] = int(os.getenv('LLM_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+    config['LLM_CACHE_TTL'] = int(os.getenv('LLM_CACHE_TTL', str(24 * 3600)))
+
+    # Gemini client: one shared model, capped concurrency, quota, deadlines and a circuit breaker
+    config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')  # gemini, or fake for local testing
+    config['LLM_MODEL'] = os.getenv('LLM_MODEL', 'gemini-1.5-flash-latest')
+    config['LLM_MAX_CONCURRENCY'] = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+    config['LLM_RATE_PER_MINUTE'] = int(os.getenv('LLM_RATE_PER_MINUTE', '60'))
+    config['LLM_TIMEOUT'] = float(os.getenv('LLM_TIMEOUT', '30'))
+    config['LLM_HEDGE_AFTER'] = float(os.getenv('LLM_HEDGE_AFTER', '10'))  # 0 disables the hedged retry
+    config['LLM_STREAM_TIMEOUT'] = float(os.getenv('LLM_STREAM_TIMEOUT', '120'))
+    config['LLM_BREAKER_THRESHOLD'] = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+    config['LLM_BREAKER_RESET'] = float(os.getenv('LLM_BREAKER_RESET', '30'))
+    config['LLM_FAKE_LATENCY'] = float(os.getenv('LLM_FAKE_LATENCY', '0.5'))
+    config['LLM_FAKE_ERROR_RATE'] = float(os.getenv('LLM_FAKE_ERROR_RATE', '0'))
+    config['LLM_FAKE_JITTER'] = float(os.getenv('LLM_FAKE_JITTER', '0'))
+
+    # Rows fetched per round trip by the streaming exports
+    config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+
+    # Rows per transaction for the bulk import endpoints
+    config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+
+    # Seconds between full recounts of the /api/db-summary counters (0 disables)
+    config['COUNTER_RECONCILE_INTERVAL'] = int(os.getenv('COUNTER_RECONCILE_INTERVAL', '300'))
+
+    # Chat and query rows are written behind the request and committed in groups, at most
+    # WRITE_BEHIND_MAX_DELAY_MS after they were queued or once WRITE_BEHIND_BATCH_SIZE are
+    # waiting (0 commits every write before the request returns). Their ids come from
+    # blocks of ID_BLOCK_SIZE reserved per process, abandoned after ID_BLOCK_TTL seconds.
+    config['WRITE_BEHIND_MAX_DELAY_MS'] = float(os.getenv('WRITE_BEHIND_MAX_DELAY_MS', '20'))
+    config['WRITE_BEHIND_BATCH_SIZE'] = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '200'))
+    config['WRITE_BEHIND_MAX_PENDING'] = int(os.getenv('WRITE_BEHIND_MAX_PENDING', '5000'))
+    config['ID_BLOCK_SIZE'] = int(os.getenv('ID_BLOCK_SIZE', '50'))
+    config['ID_BLOCK_TTL'] = float(os.getenv('ID_BLOCK_TTL', '1'))
+
+    # Conversation memory: recent turns fill CHAT_CONTEXT_TOKENS, older ones are folded into a rolling summary
+    config['CHAT_CONTEXT_TOKENS'] = int(os.getenv('CHAT_CONTEXT_TOKENS', '1500'))
+    config['CHAT_SUMMARY_TOKENS'] = int(os.getenv('CHAT_SUMMARY_TOKENS', '300'))
+    config['CHAT_CONTEXT_MAX_TURNS'] = int(os.getenv('CHAT_CONTEXT_MAX_TURNS', '20'))
+    config['CHAT_SUMMARY_MODE'] = os.getenv('CHAT_SUMMARY_MODE', 'extractive')  # extractive or llm
+
+    # Idempotency-Key support: seconds a stored response is replayed to retries, seconds a
+    # claim by a request still running is honoured before another worker may take it over,
+    # and how long a retry waits for the original request to finish
+    config['IDEMPOTENCY_TTL'] = int(os.getenv('IDEMPOTENCY_TTL', str(24 * 3600)))
+    config['IDEMPOTENCY_LEASE'] = int(os.getenv('IDEMPOTENCY_LEASE', '120'))
+    config['IDEMPOTENCY_WAIT'] = float(os.getenv('IDEMPOTENCY_WAIT', '60'))
+
+    # Seconds a cached patient context snapshot may be served (local writes invalidate it at once)
+    config['PATIENT_CONTEXT_TTL'] = int(os.getenv('PATIENT_CONTEXT_TTL', '600'))
+
+    # Seconds a serialized patient or clinician profile is served from this process's cache
+    # before its updated_at is checked against the database again (local writes invalidate
+    # it once they commit, other workers' are noticed at that check)
+    config['PROFILE_CACHE_TTL'] = float(os.getenv('PROFILE_CACHE_TTL', '5'))
+
+    # Reuse of clinician-verified answers: cosine similarity (0-1) a new first-turn question
+    # needs with a verified question to be served its answer (0 disables reuse), hash
+    # buckets per question vector, and how often other workers' verifications are picked up
+    config['VERIFIED_MATCH_THRESHOLD'] = float(os.getenv('VERIFIED_MATCH_THRESHOLD', '0.75'))
+    config['VERIFIED_INDEX_DIM'] = int(os.getenv('VERIFIED_INDEX_DIM', '2048'))
+    config['VERIFIED_INDEX_REFRESH'] = float(os.getenv('VERIFIED_INDEX_REFRESH', '30'))
+
+    # Clinician review queue: seconds a claim on a pending query lasts unless renewed,
+    # and seconds between keep-alive comments on the review event stream
+    config['REVIEW_LEASE_SECONDS'] = int(os.getenv('REVIEW_LEASE_SECONDS', '300'))
+    config['REVIEW_EVENTS_HEARTBEAT'] = float(os.getenv('REVIEW_EVENTS_HEARTBEAT', '15'))
+    # Review events are rows every worker polls for, every REVIEW_EVENTS_POLL seconds while it
+    # has subscribers, kept for REVIEW_EVENTS_RETENTION seconds. Each open stream holds a server
+    # thread, so REVIEW_EVENTS_MAX_STREAMS caps them per worker process (unset for no cap, 0
+    # turns the stream off and dashboards poll instead); gunicorn.conf.py sets it from the threads.
+    config['REVIEW_EVENTS_POLL'] = float(os.getenv('REVIEW_EVENTS_POLL', '0.5'))
+    config['REVIEW_EVENTS_RETENTION'] = int(os.getenv('REVIEW_EVENTS_RETENTION', '3600'))
+    max_streams = os.getenv('REVIEW_EVENTS_MAX_STREAMS', '')
+    config['REVIEW_EVENTS_MAX_STREAMS'] = int(max_streams) if max_streams else None
+
+    # Voice queries: transcription backend (whisper, or fake for local testing), the Whisper
+    # model name or path of a local checkpoint, device, language ('' detects it) and torch
+    # CPU threads (0 keeps torch's default). Chunks from concurrent uploads are batched up to
+    # TRANSCRIBE_BATCH_SIZE, waiting at most TRANSCRIBE_BATCH_WAIT_MS for a batch to fill.
+    config['TRANSCRIBE_BACKEND'] = os.getenv('TRANSCRIBE_BACKEND', 'whisper')
+    config['TRANSCRIBE_MODEL'] = os.getenv('TRANSCRIBE_MODEL', 'base')
+    config['TRANSCRIBE_MODEL_DIR'] = os.getenv('TRANSCRIBE_MODEL_DIR') or None
+    config['TRANSCRIBE_DEVICE'] = os.getenv('TRANSCRIBE_DEVICE', 'cpu')
+    config['TRANSCRIBE_LANGUAGE'] = os.getenv('TRANSCRIBE_LANGUAGE', 'en')
+    config['TRANSCRIBE_THREADS'] = int(os.getenv('TRANSCRIBE_THREADS', '0'))
+    config['TRANSCRIBE_BATCH_SIZE'] = int(os.getenv('TRANSCRIBE_BATCH_SIZE', '8'))
+    config['TRANSCRIBE_BATCH_WAIT_MS'] = float(os.getenv('TRANSCRIBE_BATCH_WAIT_MS', '50'))
+    config['TRANSCRIBE_QUEUE_DEPTH'] = int(os.getenv('TRANSCRIBE_QUEUE_DEPTH', '64'))
+    config['TRANSCRIBE_PRELOAD'] = os.getenv('TRANSCRIBE_PRELOAD', '1') == '1'
+    config['TRANSCRIBE_FAKE_RTF'] = float(os.getenv('TRANSCRIBE_FAKE_RTF', '0.05'))
+    config['VOICE_MAX_SECONDS'] = int(os.getenv('VOICE_MAX_SECONDS', '300'))
+
+    # Page sizes for the list endpoints (?limit=)
+    config['API_PAGE_SIZE'] = int(os.getenv('API_PAGE_SIZE', '100'))
+    config['API_MAX_PAGE_SIZE'] = int(os.getenv('API_MAX_PAGE_SIZE', '1000'))
+
+    # Logging: level (DEBUG, INFO, WARNING, ...) and format (text or json, one object per line)
+    config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+    config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text')
+
+    # SQL profiler (off by default): statements slower than SQL_SLOW_MS are logged with their
+    # query plan, and a request repeating one statement SQL_REPEAT_THRESHOLD times is flagged as N+1
+    config['SQL_PROFILER'] = os.getenv('SQL_PROFILER', '0') == '1'
+    config['SQL_SLOW_MS'] = float(os.getenv('SQL_SLOW_MS', '100'))
+    config['SQL_REPEAT_THRESHOLD'] = int(os.getenv('SQL_REPEAT_THRESHOLD', '10'))
+    config['SQL_EXPLAIN'] = os.getenv('SQL_EXPLAIN', '1') == '1'
+
+    # Import heavy SDKs, load models and warm shared caches in create_app, before worker processes fork
+    config['PRELOAD'] = os.getenv('PRELOAD', '0') == '1'
+    config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
+    return config
+
+# Initialize SQLAlchemy (bound to the app in create_app)
+db = SQLAlchemy()
+
+log = logging.getLogger('caresync')
+
+# Routes, request hooks and CLI commands; create_app registers them on the app
+api = Blueprint('api', __name__, cli_group=None)
+
+# Instrumentation, exposed in Prometheus text format on /metrics. Request metrics are
+# labelled with the route template (e.g. /api/queries/<int:query_id>) so the label set
+# stays bounded; statements run outside a request are counted under "background".
+metrics = Registry()
+http_requests = metrics.counter(
+    'caresync_http_requests_total', 'HTTP requests by route, method and status.', ('endpoint', 'method', 'status'))
+http_latency = metrics.histogram(
+    'caresync_http_request_duration_seconds',
+    'Time until the response is returned to the server (the first byte for streamed responses).',
+    ('endpoint', 'method'))
+sql_statements = metrics.counter(
+    'caresync_db_statements_total', 'SQL statements executed, by route.', ('endpoint',))
+sql_seconds = metrics.counter(
+    'caresync_db_statement_seconds_total', 'Time spent executing SQL statements, by route.', ('endpoint',))
+sql_per_request = metrics.histogram(
+    'caresync_db_statements_per_request', 'SQL statements issued while handling one request.', ('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250))
+llm_latency = metrics.histogram(
+    'caresync_llm_call_duration_seconds', 'Upstream LLM calls by mode (generate or stream) and outcome.',
+    ('mode', 'outcome'))
+
+def request_endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@api.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+
+@api.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request_endpoint()
+        http_latency.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        sql_per_request.observe(g.get('sql_statements', 0), endpoint=endpoint)
+    return response
+
+# SQL profiler, built and hooked in by create_app when SQL_PROFILER=1
+sql_profiler = None
+
+def begin_profiled_request():
+    sql_profiler.begin(request_endpoint())
+
+# Teardown runs after a streamed body is finished, so its statements count too
+def end_profiled_request(exc):
+    sql_profiler.end()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+    endpoint = 'background'
+    if has_request_context():
+        endpoint = request_endpoint()
+        g.sql_statements = g.get('sql_statements', 0) + 1
+    sql_statements.inc(endpoint=endpoint)
+    sql_seconds.inc(elapsed, endpoint=endpoint)
+
+# The Gemini SDK is imported and configured on the first call (see GeminiBackend);
+# this only reports whether an API key is set
+def initialize_gemini(config):
+    if config['LLM_BACKEND'] == 'gemini' and not config['GEMINI_API_KEY']:
+        log.warning("GEMINI_API_KEY not found in environment variables")
+        return False
+    return True
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+SAFETY_BLOCKED_MESSAGE = "Sorry, I cannot provide a response to that query due to safety concerns."
+LLM_ERROR_MESSAGE = "I apologize, but I'm having trouble generating a response right now. Please try again later."
 
-# Configure PostgreSQL database
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'caresync.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Create a context-aware prompt with patient information if available
+def build_prompt(query, patient_info=None, conversation=None):
+    prompt = "You are a medical assistant. Provide helpful and safe responses."
+    if patient_info:
+        prompt += f"\nPatient context: {patient_info}"
+    if conversation:
+        prompt += f"\n{conversation}"
+    prompt += f"\nUser query: {query}"
+    return prompt
 
-# Initialize SQLAlchemy
-db = SQLAlchemy(app)
+# Check if a response (or the first streamed chunk) was blocked
+def is_blocked(response):
+    return bool(hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason)
 
-# Configure the Gemini API (place this outside routes)
-def initialize_gemini():
-    try:
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            print("Warning: GEMINI_API_KEY not found in environment variables")
-            return False
-        genai.configure(api_key=api_key)
-        return True
-    except Exception as e:
-        print(f"Error initializing Gemini: {e}")
-        return False
+# Upstream LLM client (concurrency and rate limits, timeout, hedging, circuit breaker)
+# and the answer cache; both are built by create_app
+llm_client = None
+response_cache = None
+
+# Concurrent identical prompts share one upstream Gemini call
+llm_flight = SingleFlight()
 
 # Function to generate AI responses
-def get_response_from_llm(query, patient_info=None):
+def get_response_from_llm(query, patient_info=None, conversation=None):
+    cache_key = make_cache_key(query, patient_info, conversation)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    return llm_flight.do(cache_key, generate_llm_response, query, patient_info, conversation, cache_key)
+
+def generate_llm_response(query, patient_info, conversation, cache_key):
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        # Initialize the Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        
-        # Create a context-aware prompt with patient information if available
-        prompt = "You are a medical assistant. Provide helpful and safe responses."
-        if patient_info:
-            prompt += f"\nPatient context: {patient_info}"
-        prompt += f"\nUser query: {query}"
-        
         # Generate a response
-        response = model.generate_content(prompt)
+        response = llm_client.generate(build_prompt(query, patient_info, conversation))
         
         # Check if response was blocked
-        if hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason:
-            return "Sorry, I cannot provide a response to that query due to safety concerns."
+        if is_blocked(response):
+            outcome = 'blocked'
+            return SAFETY_BLOCKED_MESSAGE
         
-        return response.text
+        # Only real answers are cached; refusals and errors are retried next time
+        text = response.text
+        response_cache.set(cache_key, text)
+        outcome = 'ok'
+        return text
+    except CircuitOpen:
+        outcome = 'circuit_open'
+        return LLM_ERROR_MESSAGE
     except Exception as e:
-        print(f"LLM Error: {e}")
-        return f"I apologize, but I'm having trouble generating a response right now. Please try again later."
-
+        log.warning("LLM call failed: %s", e)
+        return LLM_ERROR_MESSAGE
+    finally:
+        llm_latency.observe(time.perf_counter() - started, mode='generate', outcome=outcome)
+
+# Streaming variant: yields text chunks as Gemini produces them
+def stream_response_from_llm(query, patient_info=None, conversation=None):
+    cache_key = make_cache_key(query, patient_info, conversation)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    produced = False
+    parts = []
+    blocked = False
+    started = time.perf_counter()
+    outcome = 'cancelled'
+    try:
+        for chunk in llm_client.stream(build_prompt(query, patient_info, conversation)):
+            # The safety verdict arrives with the first chunk, before any text is forwarded
+            blocked = is_blocked(chunk)
+            if not produced and blocked:
+                outcome = 'blocked'
+                yield SAFETY_BLOCKED_MESSAGE
+                return
+            try:
+                text = chunk.text
+            except ValueError:
+                # The candidate stopped without text, e.g. a safety stop part-way through
+                outcome = 'blocked'
+                yield SAFETY_BLOCKED_MESSAGE if not produced else "\n\n" + SAFETY_BLOCKED_MESSAGE
+                return
+            if text:
+                produced = True
+                parts.append(text)
+                yield text
+
+        if not produced:
+            outcome = 'blocked' if blocked else 'error'
+            yield SAFETY_BLOCKED_MESSAGE if blocked else LLM_ERROR_MESSAGE
+            return
+        outcome = 'ok'
+        response_cache.set(cache_key, "".join(parts))
+    except CircuitOpen:
+        outcome = 'circuit_open'
+        yield LLM_ERROR_MESSAGE if not produced else "\n\n" + LLM_ERROR_MESSAGE
+    except Exception as e:
+        outcome = 'error'
+        log.warning("LLM stream failed: %s", e)
+        yield LLM_ERROR_MESSAGE if not produced else "\n\n" + LLM_ERROR_MESSAGE
+    finally:
+        llm_latency.observe(time.perf_counter() - started, mode='stream', outcome=outcome)
 
+# Worker pool that runs LLM generation off the request thread (built by create_app)
+llm_jobs = None
 
 
 # Define Models (Tables)
@@ -113,6 +447,7 @@ class Patient(db.Model):
     bipolar = db.Column(db.Boolean, default=False)
     other_mental_health = db.Column(db.Text)
     additional_info = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Clinician(db.Model):
     __tablename__ = 'clinicians'
@@ -127,16 +462,33 @@ class Clinician(db.Model):
     years_of_experience = db.Column(db.Integer, nullable=False)
     affiliated_hospitals = db.Column(db.Text)
     aadhar_number = db.Column(db.String(20), unique=True, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Chatbot(db.Model):
     __tablename__ = 'chatbot'
+    __table_args__ = (
+        db.Index('ix_chatbot_patient_id', 'patient_id'),
+    )
     chat_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.patient_id', ondelete='CASCADE'))
     clinician_id = db.Column(db.Integer, db.ForeignKey('clinicians.clinician_id', ondelete='SET NULL'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Rolling summary of the turns up to and including summary_through_query_id (in turn order)
+    context_summary = db.Column(db.Text)
+    summary_through_query_id = db.Column(db.Integer)
 
 class Query(db.Model):
     __tablename__ = 'queries'
+    # Matches the access paths: per-patient/clinician history and status filters paged on
+    # query_id, chat transcripts in turn order, and created_at ranges. Existing databases
+    # get them from migrations.py.
+    __table_args__ = (
+        db.Index('ix_queries_patient_id_query_id', 'patient_id', 'query_id'),
+        db.Index('ix_queries_clinician_id_query_id', 'clinician_id', 'query_id'),
+        db.Index('ix_queries_query_status_query_id', 'query_status', 'query_id'),
+        db.Index('ix_queries_chat_id_created_at_query_id', 'chat_id', 'created_at', 'query_id'),
+        db.Index('ix_queries_created_at', 'created_at'),
+    )
     query_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('chatbot.chat_id', ondelete='CASCADE'))
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.patient_id', ondelete='CASCADE'))
@@ -145,49 +497,408 @@ class Query(db.Model):
     response = db.Column(db.Text)
     query_status = db.Column(db.String(20), default='Pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 'generated' by the LLM, 'reused' from the verified answer of source_query_id, or 'edited' by a clinician
+    answer_source = db.Column(db.String(20))
+    source_query_id = db.Column(db.Integer)
+    # Review lease: the clinician working on this query, until lease_expires_at
+    claimed_by = db.Column(db.Integer)
+    lease_expires_at = db.Column(db.DateTime)
+
+# Clinician-verified answers, the corpus for answer reuse. Re-verifying a query
+# replaces its row, so a new answer_id always means new content for other workers.
+class VerifiedAnswer(db.Model):
+    __tablename__ = 'verified_answers'
+    __table_args__ = (
+        # Other workers' indexes load the rows verified since their last refresh
+        db.Index('ix_verified_answers_verified_at', 'verified_at'),
+    )
+    answer_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    query_id = db.Column(db.Integer, db.ForeignKey('queries.query_id', ondelete='CASCADE'), unique=True, nullable=False)
+    clinician_id = db.Column(db.Integer, db.ForeignKey('clinicians.clinician_id', ondelete='SET NULL'))
+    # The patient the question was asked for; the answer is only reused for them
+    patient_id = db.Column(db.Integer)
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(db.Text, nullable=False)
+    verified_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Row counters behind /api/db-summary. They are updated in the same transaction
+# as the rows they count, so reading the summary is one small SELECT however large
+# the tables grow; reconcile_counters() recounts everything to correct any drift.
+class DbCounter(db.Model):
+    __tablename__ = 'db_counters'
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# Leases on periodic jobs that only one worker process should run at a time
+class MaintenanceLock(db.Model):
+    __tablename__ = 'maintenance_locks'
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(255), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Highest id handed out per table, in blocks, to worker processes (see reserve_ids)
+class IdBlock(db.Model):
+    __tablename__ = 'id_blocks'
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False)
+
+# Responses to requests sent with an Idempotency-Key, replayed to retries until expires_at
+# (see idempotency.py). While the first request runs the row is in_flight and expires_at
+# is the end of its lease.
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+    scope = db.Column(db.String(255), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(16), nullable=False)
+    response_status = db.Column(db.Integer)
+    response_headers = db.Column(db.JSON)
+    response_body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Review queue notifications for /api/review/events, written in the same transaction as
+# the change they announce and read back by every worker (see EventBroker)
+class ReviewEvent(db.Model):
+    __tablename__ = 'review_events'
+    __table_args__ = (
+        db.Index('ix_review_events_created_at', 'created_at'),
+        # Ids are never reused after a purge, so pollers never skip a new event
+        {'sqlite_autoincrement': True},
+    )
+    event_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+# Session tokens revoked by logout, by the SHA-256 of the token, kept until the token expires
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+        db.Index('ix_revoked_tokens_expires_at', 'expires_at'),
+    )
+    token_id = db.Column(db.String(64), primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+COUNTED_MODELS = {User: 'total_users', Patient: 'total_patients', Clinician: 'total_clinicians', Query: 'total_queries'}
+
+def status_counter(status):
+    return f"status:{status}"
+
+def bump_counters(conn, deltas):
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        updated = conn.execute(
+            DbCounter.__table__.update().where(DbCounter.name == name).values(value=DbCounter.value + delta)
+        ).rowcount
+        if not updated:
+            conn.execute(DbCounter.__table__.insert().values(name=name, value=delta))
+
+@event.listens_for(db.session, 'after_flush')
+def count_flushed_rows(session, flush_context):
+    deltas = {}
+
+    def add(name, delta):
+        deltas[name] = deltas.get(name, 0) + delta
+
+    for obj in session.new:
+        if type(obj) in COUNTED_MODELS:
+            add(COUNTED_MODELS[type(obj)], 1)
+            if isinstance(obj, Query):
+                add(status_counter(obj.query_status or 'Pending'), 1)
+    for obj in session.deleted:
+        if type(obj) in COUNTED_MODELS:
+            add(COUNTED_MODELS[type(obj)], -1)
+            if isinstance(obj, Query):
+                add(status_counter(obj.query_status), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Query):
+            history = inspect(obj).attrs.query_status.history
+            if history.has_changes():
+                for old_status in history.deleted:
+                    add(status_counter(old_status), -1)
+                for new_status in history.added:
+                    add(status_counter(new_status), 1)
+
+    if deltas:
+        bump_counters(session.connection(), deltas)
+
+# Review queue notifications. Answered Pending queries and newly Verified ones are
+# recorded at flush time in the same transaction, so dashboards in every worker hear
+# about them once they commit and never about rows that were rolled back. Built by create_app.
+review_events = None
+
+@event.listens_for(db.session, 'after_flush')
+def collect_review_events(session, flush_context):
+    pending = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Query):
+            continue
+        state = inspect(obj)
+        if obj.query_status == 'Verified' and (state.attrs.query_status.history.added or obj in session.new):
+            pending.append(('verified', {"query_id": obj.query_id, "query_text": obj.query_text}))
+        elif (obj.query_status or 'Pending') == 'Pending' and obj.response is not None and (
+                obj in session.new or state.attrs.response.history.deleted == [None]):
+            pending.append(('pending', {"query_id": obj.query_id, "query_text": obj.query_text}))
+    for name, data in pending:
+        review_events.record(session.connection(), name, data)
+
+def reconcile_counters():
+    """Recount every counter from the base tables in one aggregate pass.
+
+    The counters are locked before counting and rewritten in the same transaction,
+    so a write that commits meanwhile waits and then adds to the new value instead
+    of being counted and then overwritten.
+    """
+    db.session.execute(DbCounter.__table__.update().values(value=DbCounter.value))
+    totals = db.session.execute(db.select(
+        *[db.select(func.count()).select_from(model).scalar_subquery().label(name)
+          for model, name in COUNTED_MODELS.items()]
+    )).one()
+    counts = dict(zip(COUNTED_MODELS.values(), totals))
+    for status, count in db.session.execute(db.select(Query.query_status, func.count()).group_by(Query.query_status)):
+        counts[status_counter(status)] = count
+
+    existing = set(db.session.execute(db.select(DbCounter.name)).scalars())
+    for name, value in counts.items():
+        if name in existing:
+            db.session.execute(DbCounter.__table__.update().where(DbCounter.name == name).values(value=value))
+        else:
+            db.session.execute(DbCounter.__table__.insert().values(name=name, value=value))
+    if existing - set(counts):
+        db.session.execute(DbCounter.__table__.delete().where(DbCounter.name.not_in(list(counts))))
+    db.session.commit()
+    return counts
+
+# Take or renew the lease on a maintenance job for `ttl` seconds; False while another holder has it
+def hold_maintenance_lock(name, holder, ttl):
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(MaintenanceLock.__table__.insert().values(name=name, holder=holder, expires_at=expires_at))
+        return True
+    except IntegrityError:
+        pass
+    with db.engine.begin() as conn:
+        return conn.execute(
+            MaintenanceLock.__table__.update()
+            .where(MaintenanceLock.name == name,
+                   or_(MaintenanceLock.holder == holder, MaintenanceLock.expires_at <= now))
+            .values(holder=holder, expires_at=expires_at)
+        ).rowcount > 0
+
+# Every worker runs this thread, but only the one holding the 'reconcile-counters' lock
+# recounts; the lock lapses after two intervals, so another worker takes over if it dies
+def start_counter_reconciler(app):
+    interval = app.config['COUNTER_RECONCILE_INTERVAL']
+    if not interval:
+        return None
+    holder = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    if hold_maintenance_lock('reconcile-counters', holder, 2 * interval):
+                        reconcile_counters()
+                except Exception:
+                    db.session.rollback()
+                    log.exception("Error reconciling counters")
+
+    thread = threading.Thread(target=loop, name='counter-reconciler', daemon=True)
+    thread.start()
+    return thread
+
+# Columns exposed by the list endpoints, by output name
+PATIENT_LIST_FIELDS = {
+    "patient_id": Patient.patient_id,
+    "user_id": Patient.user_id,
+    "full_name": Patient.full_name,
+    "email": Patient.email,
+    "dob": Patient.dob,
+    "gender": Patient.gender,
+    "height": Patient.height,
+    "weight": Patient.weight,
+    "phone": Patient.phone
+}
+
+CLINICIAN_LIST_FIELDS = {
+    "clinician_id": Clinician.clinician_id,
+    "user_id": Clinician.user_id,
+    "full_name": Clinician.full_name,
+    "email": Clinician.email,
+    "specialization": Clinician.specialization,
+    "years_of_experience": Clinician.years_of_experience,
+    "affiliated_hospitals": Clinician.affiliated_hospitals
+}
+
+USER_LIST_FIELDS = {
+    "user_id": User.user_id,
+    "is_patient": User.is_patient,
+    "is_clinician": User.is_clinician
+}
+
+QUERY_LIST_FIELDS = {
+    "query_id": Query.query_id,
+    "chat_id": Query.chat_id,
+    "patient_id": Query.patient_id,
+    "clinician_id": Query.clinician_id,
+    "query_text": Query.query_text,
+    "response": Query.response,
+    "query_status": Query.query_status,
+    "created_at": Query.created_at
+}
+
+REVIEW_QUEUE_FIELDS = {
+    "query_id": Query.query_id,
+    "patient_id": Query.patient_id,
+    "query_text": Query.query_text,
+    "response": Query.response,
+    "query_status": Query.query_status,
+    "answer_source": Query.answer_source,
+    "claimed_by": Query.claimed_by,
+    "lease_expires_at": Query.lease_expires_at,
+    "created_at": Query.created_at
+}
+
+# The patient dashboard's history view calls the status field "status"
+PATIENT_QUERY_FIELDS = {
+    "query_id": Query.query_id,
+    "query_text": Query.query_text,
+    "response": Query.response,
+    "status": Query.query_status,
+    "created_at": Query.created_at
+}
 
 # Create Tables
 # After all model definitions but before route definitions
-def init_db():
+def init_db(app):
     try:
         with app.app_context():
-            print("Starting database initialization...")
+            log.info("Starting database initialization...")
             db.create_all()
             
+            # Bring an existing caresync.db up to the current schema
+            applied = run_migrations(db.engine)
+            if applied:
+                log.info("Applied schema migrations: %s", applied)
+            
+            # Start the summary counters from exact values
+            reconcile_counters()
+            
+            # Drop review events older than REVIEW_EVENTS_RETENTION
+            review_events.purge()
+            
+            # Load verified answers for reuse
+            verified_answers.refresh(load_verified_answers, time.monotonic(), force=True)
+            
             # Verify tables
             inspector = inspect(db.engine)
             tables = inspector.get_table_names()
-            print(f"Successfully created tables: {tables}")
+            log.debug("Database tables: %s", tables)
             
             if not tables:
                 raise Exception("No tables were created")
                 
             return True
-    except Exception as e:
-        print(f"Database initialization failed: {e}")
+    except Exception:
+        log.exception("Database initialization failed")
         return False
 
 
 
+# Keyset pagination and column projection for the list endpoints.
+# ?limit=N caps the page, ?after=<cursor> continues from a previous page,
+# ?order=desc walks newest first and ?fields=a,b selects only those columns in SQL.
+# The cursor for the next page is returned in the X-Next-Cursor and Link headers.
+def page_limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'])
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+def keyset_page(fields, key, *criteria):
+    limit = page_limit()
+
+    order = request.args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+
+    requested = request.args.get('fields')
+    if requested:
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        names = list(fields)
+
+    stmt = db.select(*[fields[name].label(name) for name in names], key.label('_cursor')).where(*criteria)
+    after = request.args.get('after')
+    if after:
+        try:
+            after = int(after)
+        except ValueError:
+            raise ValueError("after must be a cursor returned by a previous page")
+        stmt = stmt.where(key < after if order == 'desc' else key > after)
+    stmt = stmt.order_by(key.desc() if order == 'desc' else key).limit(limit + 1)
+
+    rows = db.session.execute(stmt).all()
+    next_cursor = str(rows[limit - 1]._cursor) if len(rows) > limit else None
+    items = [{name: to_json_value(getattr(row, name)) for name in names} for row in rows[:limit]]
+    return items, next_cursor
+
+def to_json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def paged_response(body, next_cursor):
+    response = jsonify(body)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+# CLI: flask --app app migrate
+@api.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    if not init_db(current_app):
+        raise click.ClickException("Database migration failed")
+
+
 # Routes to serve HTML templates
-@app.route('/')
+@api.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/history')
+@api.route('/history')
 def history():
     return render_template('history.html')
 
-@app.route('/verification')
+@api.route('/verification')
 def verification():
     return render_template('verification.html')
 
-@app.route('/patient_dashboard')
+@api.route('/patient_dashboard')
 def patient_dashboard():
     return render_template('index2.html')
 
 
-@app.route('/clinician_dashboard')
+@api.route('/clinician_dashboard')
 def clinician_dashboard():
     # Example medical history data
     medical_history = {
@@ -207,130 +918,1038 @@ def clinician_dashboard():
     return render_template('index3.html', medical_history=medical_history)
 
 
+# Password hashing runs on a small dedicated pool so that concurrent logins and
+# signups cannot occupy every CPU with KDF work; the pool size bounds that cost (built by create_app)
+password_pool = None
+
+def is_password_hash(value):
+    return bool(value) and '$' in value and value.split('$', 1)[0].startswith(('pbkdf2:', 'scrypt:'))
+
+def hash_password(password):
+    return password_pool.submit(generate_password_hash, password, method=current_app.config['PASSWORD_HASH_METHOD']).result()
+
+def hash_passwords(passwords):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return list(password_pool.map(lambda password: generate_password_hash(password, method=method), passwords))
+
+def verify_password(stored, password):
+    if not stored or password is None:
+        return False
+    if is_password_hash(stored):
+        return password_pool.submit(check_password_hash, stored, password).result()
+    # Accounts created before hashing was introduced store the password as-is
+    return hmac.compare_digest(stored.encode('utf-8'), str(password).encode('utf-8'))
+
+def password_needs_rehash(stored):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    return not is_password_hash(stored) or not stored.startswith(method + '$')
+
+# Signed session tokens. Verified tokens are kept in an in-memory TTL cache, so
+# identifying the caller of an authenticated request needs neither the database
+# nor a signature check. Logout records the token in the revoked_tokens table, which
+# every worker reads back at most every SESSION_REVOCATION_REFRESH seconds. All three
+# are built by create_app.
+session_serializer = None
+session_cache = None
+revoked_tokens = None
+
+def issue_session_token(identity):
+    token = session_serializer.dumps(identity)
+    session_cache.set(token, identity)
+    return token
+
+def current_identity():
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    token = auth[len('Bearer '):].strip()
+    if revoked_tokens.is_revoked(token_id(token)):
+        return None
+    identity = session_cache.get(token)
+    if identity is not None:
+        return identity
+    try:
+        identity, issued_at = session_serializer.loads(
+            token, max_age=current_app.config['SESSION_TOKEN_TTL'], return_timestamp=True
+        )
+    except (SignatureExpired, BadSignature):
+        return None
+    # Cache only for the token's remaining lifetime
+    remaining = current_app.config['SESSION_TOKEN_TTL'] - (datetime.now(issued_at.tzinfo) - issued_at).total_seconds()
+    session_cache.set(token, identity, ttl=max(0, remaining))
+    return identity
+
 # API routes for authentication
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
-    data = request.json
+    data = request.json or {}
     
     # Check if we're getting email or userId
     email = data.get('email')
     user_id = data.get('userId')
     password = data.get('password')
     
-    user = None
+    # Convert user_id to int if it's a string
+    if isinstance(user_id, str) and user_id.isdigit():
+        user_id = int(user_id)
     
-    # First, try to find user by email (checking in Patient or Clinician tables)
+    # One joined lookup: the user plus its patient or clinician profile,
+    # matched by either profile email or by user_id; an email match wins
+    conditions = []
     if email:
-        # Try patient first
-        patient = Patient.query.filter_by(email=email).first()
-        if patient:
-            user = User.query.filter_by(user_id=patient.user_id).first()
-        
-        # If not found in patients, try clinicians
-        if not user:
-            clinician = Clinician.query.filter_by(email=email).first()
-            if clinician:
-                user = User.query.filter_by(user_id=clinician.user_id).first()
+        email_match = or_(Patient.email == email, Clinician.email == email)
+        conditions.append(email_match)
+    if isinstance(user_id, int):
+        conditions.append(User.user_id == user_id)
     
-    # If not found by email or no email provided, try user_id
-    if not user and user_id is not None:
-        # Convert user_id to int if it's a string
-        if isinstance(user_id, str) and user_id.isdigit():
-            user_id = int(user_id)
-            
-        user = User.query.filter_by(user_id=user_id).first()
+    account = None
+    if conditions:
+        stmt = (
+            db.select(
+                User.user_id, User.is_patient, User.is_clinician, User.password_hash,
+                Patient.patient_id, Patient.full_name.label('patient_name'),
+                Clinician.clinician_id, Clinician.full_name.label('clinician_name')
+            )
+            .outerjoin(Patient, Patient.user_id == User.user_id)
+            .outerjoin(Clinician, Clinician.user_id == User.user_id)
+            .where(or_(*conditions))
+            .limit(1)
+        )
+        if email:
+            stmt = stmt.order_by(case((email_match, 0), else_=1))
+        account = db.session.execute(stmt).first()
     
     # Check credentials and return appropriate response
-    if user and user.password_hash == password:  # In production, use proper password hashing
-        if user.is_patient:
-            patient = Patient.query.filter_by(user_id=user.user_id).first()
-            return jsonify({
+    if account and verify_password(account.password_hash, password):
+        if password_needs_rehash(account.password_hash):
+            upgrade_password_hash(account.user_id, password)
+        
+        if account.is_patient and account.patient_id is not None:
+            identity = {"user_id": account.user_id, "role": "patient", "patient_id": account.patient_id}
+            body = {
                 "success": True, 
                 "is_patient": True, 
-                "patient_id": patient.patient_id,
-                "full_name": patient.full_name,
-                "user_id": user.user_id
-            })
-        elif user.is_clinician:
-            clinician = Clinician.query.filter_by(user_id=user.user_id).first()
-            return jsonify({
+                "patient_id": account.patient_id,
+                "full_name": account.patient_name,
+                "user_id": account.user_id
+            }
+        elif account.is_clinician and account.clinician_id is not None:
+            identity = {"user_id": account.user_id, "role": "clinician", "clinician_id": account.clinician_id}
+            body = {
                 "success": True, 
                 "is_clinician": True, 
-                "clinician_id": clinician.clinician_id,
-                "full_name": clinician.full_name,
-                "user_id": user.user_id
-            })
+                "clinician_id": account.clinician_id,
+                "full_name": account.clinician_name,
+                "user_id": account.user_id
+            }
+        else:
+            body = None
+        
+        if body:
+            body["token"] = issue_session_token(identity)
+            body["expires_in"] = current_app.config['SESSION_TOKEN_TTL']
+            return jsonify(body)
     
     # Debug info
-    print(f"Login attempt - Email: {email}, UserID: {user_id}, User found: {user is not None}")
+    log.debug("Login failed", extra={"by_email": bool(email), "user_id": user_id, "account_found": account is not None})
     
     return jsonify({"success": False, "message": "Invalid credentials"}), 401
 
+# Replace a plaintext or outdated password hash after a successful login
+def upgrade_password_hash(user_id, password):
+    try:
+        password_hash = hash_password(password)
+        db.session.execute(User.__table__.update().where(User.user_id == user_id).values(password_hash=password_hash))
+        db.session.execute(Clinician.__table__.update().where(Clinician.user_id == user_id).values(password_hash=password_hash))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        log.exception("Error upgrading password hash for user %s", user_id)
+
+@api.route('/api/logout', methods=['POST'])
+def logout():
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        token = auth[len('Bearer '):].strip()
+        session_cache.delete(token)
+        try:
+            _, issued_at = session_serializer.loads(
+                token, max_age=current_app.config['SESSION_TOKEN_TTL'], return_timestamp=True
+            )
+        except (SignatureExpired, BadSignature):
+            # Not a token that would be accepted anyway
+            return jsonify({"success": True})
+        expires_at = issued_at.replace(tzinfo=None) + timedelta(seconds=current_app.config['SESSION_TOKEN_TTL'])
+        revoked_tokens.revoke(token_id(token), expires_at)
+    return jsonify({"success": True})
+
+# Identify the caller from the session token alone (no database access)
+@api.route('/api/me', methods=['GET'])
+def whoami():
+    identity = current_identity()
+    if identity is None:
+        return jsonify({"success": False, "message": "Not authenticated"}), 401
+    return jsonify({"success": True, **identity})
+
+# Idempotency keys for POST endpoints that call the LLM or insert rows. A client that
+# sends an Idempotency-Key header can retry safely: a retry while the first request is
+# still running waits for it (up to IDEMPOTENCY_WAIT), and a retry after it finished gets
+# the stored response back with Idempotent-Replayed: true instead of running again.
+# Keys are scoped to the endpoint and the caller, and reusing one for a different body
+# is a 422. Server errors and 429s are not stored, so retrying those runs the request again.
+idempotency_keys = None  # Built by create_app
+
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+def idempotency_scope():
+    identity = current_identity()
+    caller = f"{identity['role']}:{identity['user_id']}" if identity else 'anonymous'
+    return f"{request.method} {request.path} {caller}"
+
+def replay_response(row):
+    response = Response(row.response_body, status=row.response_status, headers=row.response_headers or {})
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > 255:
+            return jsonify({"success": False, "message": "Idempotency-Key must be 1 to 255 characters"}), 400
+
+        scope = idempotency_scope()
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        outcome, row = idempotency_keys.claim(scope, key, fingerprint)
+        if outcome == IN_FLIGHT:
+            outcome, row = idempotency_keys.wait(scope, key, fingerprint, current_app.config['IDEMPOTENCY_WAIT'])
+        if outcome == MISMATCH:
+            return jsonify({"success": False,
+                            "message": "Idempotency-Key was already used for a different request"}), 422
+        if outcome == COMPLETED:
+            return replay_response(row)
+        if outcome == IN_FLIGHT:
+            response = jsonify({"success": False, "message": "A request with this Idempotency-Key is still in progress"})
+            response.headers['Retry-After'] = str(current_app.config['LLM_RETRY_AFTER'])
+            return response, 409
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_keys.release(scope, key)
+            raise
+        try:
+            if response.status_code >= 500 or response.status_code == 429 or response.is_streamed:
+                idempotency_keys.release(scope, key)
+            else:
+                headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+                idempotency_keys.complete(scope, key, response.status_code, headers, response.get_data())
+        except Exception:
+            # The request itself succeeded; a retry will just run it again
+            log.exception("Could not store the outcome of Idempotency-Key %s", key)
+        return response
+    return wrapper
+
+# Patient context for the LLM prompt. A compact snapshot (demographics, flagged
+# conditions, medications, allergies, family and mental health history) is read
+# with a column projection instead of loading the whole Patient row, cached per
+# patient, and dropped from the cache whenever that patient's record changes.
+# Age is computed when the prompt is built, so a cached snapshot never goes stale on a birthday.
+patient_context_cache = None
+
+CONDITION_FLAGS = [
+    ('diabetes', 'diabetes'), ('hypertension', 'hypertension'), ('heart_disease', 'heart disease'),
+    ('asthma', 'asthma'), ('stroke', 'stroke')
+]
+MENTAL_HEALTH_FLAGS = [
+    ('anxiety', 'anxiety'), ('depression', 'depression'), ('ptsd', 'PTSD'), ('adhd', 'ADHD'), ('bipolar', 'bipolar disorder')
+]
+FAMILY_HISTORY_FIELDS = [
+    ('family_diabetes', 'diabetes'), ('family_heart_disease', 'heart disease'), ('family_stroke', 'stroke'),
+    ('family_cancer', 'cancer'), ('family_mental_health', 'mental health')
+]
+ALLERGY_FIELDS = [
+    ('medication_allergies', 'medication'), ('food_allergies', 'food'), ('environmental_allergies', 'environmental')
+]
+PATIENT_CONTEXT_COLUMNS = ['full_name', 'gender', 'dob', 'other_conditions', 'current_medications', 'no_allergies',
+                           'other_mental_health'] + [name for name, _ in
+                           CONDITION_FLAGS + MENTAL_HEALTH_FLAGS + FAMILY_HISTORY_FIELDS + ALLERGY_FIELDS]
+
+def load_patient_snapshot(patient_id):
+    row = db.session.execute(
+        db.select(*[getattr(Patient, name) for name in PATIENT_CONTEXT_COLUMNS]).where(Patient.patient_id == patient_id)
+    ).first()
+    if row is None:
+        return None
+
+    conditions = [label for name, label in CONDITION_FLAGS if getattr(row, name)]
+    if row.other_conditions:
+        conditions.append(row.other_conditions.strip())
+    mental_health = [label for name, label in MENTAL_HEALTH_FLAGS if getattr(row, name)]
+    if row.other_mental_health:
+        mental_health.append(row.other_mental_health.strip())
+    if row.no_allergies:
+        allergies = ['none known']
+    else:
+        allergies = [f"{getattr(row, name).strip()} ({label})" for name, label in ALLERGY_FIELDS if getattr(row, name)]
+    family_history = [f"{label} ({getattr(row, name).strip()})" for name, label in FAMILY_HISTORY_FIELDS
+                      if getattr(row, name) and getattr(row, name).strip().lower() not in ('no', 'none', 'false')]
+
+    return {
+        "name": row.full_name,
+        "gender": row.gender,
+        "dob": row.dob,
+        "conditions": conditions,
+        "medications": (row.current_medications or '').strip(),
+        "allergies": allergies,
+        "family_history": family_history,
+        "mental_health": mental_health
+    }
+
+def age_on(dob, today):
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+def render_patient_context(snapshot, today=None):
+    today = today or date.today()
+    parts = [f"Patient: {snapshot['name']}, {snapshot['gender']}, Age: {age_on(snapshot['dob'], today)}."]
+    if snapshot['conditions']:
+        parts.append(f"Conditions: {', '.join(snapshot['conditions'])}.")
+    if snapshot['medications']:
+        parts.append(f"Medications: {snapshot['medications']}.")
+    if snapshot['allergies']:
+        parts.append(f"Allergies: {', '.join(snapshot['allergies'])}.")
+    if snapshot['family_history']:
+        parts.append(f"Family history: {', '.join(snapshot['family_history'])}.")
+    if snapshot['mental_health']:
+        parts.append(f"Mental health: {', '.join(snapshot['mental_health'])}.")
+    return " ".join(parts)
+
+# Build the patient context string passed to the LLM
+def build_patient_context(patient_id):
+    if not patient_id:
+        return None
+    try:
+        patient_id = int(patient_id)
+    except (TypeError, ValueError):
+        return None
+    snapshot = patient_context_cache.get(patient_id)
+    if snapshot is None:
+        snapshot = load_patient_snapshot(patient_id)
+        if snapshot is None:
+            return None
+        patient_context_cache.set(patient_id, snapshot)
+    return render_patient_context(snapshot)
+
+# Patients and clinicians changed by a flush are dropped from the caches once the
+# transaction commits: dropping them at flush time would let a concurrent read re-cache
+# the old row before the commit. A rollback changes nothing, so it drops nothing.
+@event.listens_for(db.session, 'after_flush')
+def collect_profile_changes(session, flush_context):
+    changed = session.info.setdefault('changed_profiles', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Patient):
+            changed.add(('patients', obj.patient_id))
+        elif isinstance(obj, Clinician):
+            changed.add(('clinicians', obj.clinician_id))
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_profiles(session):
+    for table, row_id in session.info.pop('changed_profiles', ()):
+        if table == 'patients':
+            patient_context_cache.delete(row_id)
+        invalidate_profile((table, row_id))
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def drop_profile_changes(session, previous_transaction):
+    session.info.pop('changed_profiles', None)
+
+# Write-behind for chat and query rows (see writebehind.py). A patient message used to
+# commit a chat and a query row before the request could answer; now both are queued and
+# committed in groups by one thread per process. Ids come from blocks reserved in the
+# database, so callers get them before the rows are written, and reads that must see
+# the caller's own rows sync on them first. Built by create_app.
+write_behind = None
+row_ids = None
+
+def reserve_ids(model, count):
+    """Claim the next `count` ids of model's table for this process; returns the last one.
+
+    The block starts above both the previous block and the table's highest id, so rows
+    inserted without the allocator (e.g. by bench/seed.py) are never handed out again.
+    """
+    table = model.__table__
+    blocks = IdBlock.__table__
+    highest = db.select(func.coalesce(func.max(table.primary_key.columns[0]), 0)).scalar_subquery()
+    for attempt in range(2):
+        try:
+            with db.engine.begin() as conn:
+                last_id = conn.execute(
+                    blocks.update().where(blocks.c.name == table.name)
+                    .values(last_id=case((blocks.c.last_id > highest, blocks.c.last_id), else_=highest) + count)
+                    .returning(blocks.c.last_id)
+                ).scalar()
+                if last_id is None:
+                    last_id = conn.execute(
+                        blocks.insert().values(name=table.name, last_id=highest + count).returning(blocks.c.last_id)
+                    ).scalar()
+            return last_id
+        except IntegrityError:
+            # Another process created the table's row first
+            if attempt:
+                raise
+
+# Applies a batch of queued writes in one transaction: inserts table by table (chats
+# before the queries that refer to them), then updates in order, and the summary
+# counters that the ORM flush hook bumps for session writes
+def apply_writes(writes):
+    deltas = {}
+    with db.engine.begin() as conn:
+        for table in (Chatbot.__table__, Query.__table__):
+            rows = [write.values for write in writes if write.kind == 'insert' and write.table is table]
+            if rows:
+                conn.execute(table.insert(), rows)
+        for write in writes:
+            if write.kind == 'update':
+                row = write.table.c[write.pk] == write.id
+                if write.table is Query.__table__ and 'query_status' in write.values:
+                    # Move the row between status counters
+                    old_status = conn.execute(db.select(Query.__table__.c.query_status).where(row)).scalar()
+                    if old_status is not None and old_status != write.values['query_status']:
+                        for name, delta in ((status_counter(old_status), -1),
+                                            (status_counter(write.values['query_status']), 1)):
+                            deltas[name] = deltas.get(name, 0) + delta
+                conn.execute(write.table.update().where(row).values(write.values))
+            elif write.table is Query.__table__:
+                for name in (COUNTED_MODELS[Query], status_counter(write.values['query_status'])):
+                    deltas[name] = deltas.get(name, 0) + 1
+            for name, data in write.events:
+                review_events.record(conn, name, data)
+        if deltas:
+            bump_counters(conn, deltas)
+
+def queue_writes(*writes):
+    write_behind.start(current_app._get_current_object().app_context)  # once per process
+    write_behind.submit(*writes)
+
+# Wait until this process's queued writes to a row (or a chat's queries) are committed
+def sync_writes(model, row_id):
+    try:
+        row_id = int(row_id)
+    except (TypeError, ValueError):
+        return
+    write_behind.sync((model.__tablename__, row_id))
+
+# Reuse the given chat or start a new one for the patient
+def get_or_create_chat(chat_id, patient_id):
+    if chat_id:
+        return chat_id
+    chat_id = row_ids.next(Chatbot)
+    queue_writes(Insert(Chatbot.__table__, ('chatbot', chat_id), {
+        "chat_id": chat_id,
+        "patient_id": patient_id,
+        "clinician_id": None,
+        "created_at": datetime.utcnow(),
+        "context_summary": None,
+        "summary_through_query_id": None
+    }))
+    return chat_id
+
+# Queue a new Pending query of the chat and return its id. An answered one enters the review queue.
+# Clients poll the id on whichever worker they reach, so it is only returned once the row
+# is committed (in the writer's next group commit); the answer written later is not waited for.
+def queue_query(chat_id, patient_id, query_text, response=None, answer_source=None, source_query_id=None):
+    query_id = row_ids.next(Query)
+    queue_writes(Insert(Query.__table__, ('queries', query_id), {
+        "query_id": query_id,
+        "chat_id": chat_id,
+        "patient_id": patient_id,
+        "clinician_id": None,
+        "query_text": query_text,
+        "response": response,
+        "query_status": 'Pending',
+        "created_at": datetime.utcnow(),
+        "answer_source": answer_source,
+        "source_query_id": source_query_id,
+        "claimed_by": None,
+        "lease_expires_at": None
+    }, sync_keys=[('chatbot', chat_id)], events=[] if response is None else [
+        ('pending', {"query_id": query_id, "query_text": query_text})
+    ]))
+    write_behind.sync(('queries', query_id))
+    return query_id
+
+# Queue the answer of a query that was saved while it was still being generated
+def queue_answer(query_id, chat_id, query_text, response, **values):
+    queue_writes(Update(Query.__table__, 'query_id', query_id, {"response": response, **values},
+                        sync_keys=[('chatbot', chat_id)], events=[
+        ('pending', {"query_id": query_id, "query_text": query_text})
+    ]))
+
+# Mark a query whose answer stream the client abandoned. It keeps no response, so it
+# stays out of the chat context and the review queue.
+def queue_interrupted(query_id, chat_id):
+    queue_writes(Update(Query.__table__, 'query_id', query_id, {"query_status": 'Interrupted'},
+                        sync_keys=[('chatbot', chat_id)]))
+
+# Conversation memory for the prompt. The newest turns of the chat are included
+# verbatim while they fit the token budget; everything older is represented by a
+# rolling summary stored on the Chatbot row (and cached in memory). Each new turn
+# only folds the turns that just slid out of the window into that summary, so long
+# chats never resend or re-summarize their whole history. The cache is built by create_app.
+chat_summary_cache = None
+
+# A chat's turns are ordered by (created_at, query_id). Ids come from blocks reserved per
+# worker process (see IdAllocator), so a later turn answered by another worker can have a
+# lower id; the id only breaks ties between turns created in the same instant.
+def turns_after(created_at, query_id):
+    return or_(Query.created_at > created_at, and_(Query.created_at == created_at, Query.query_id > query_id))
+
+def turns_before(created_at, query_id):
+    return or_(Query.created_at < created_at, and_(Query.created_at == created_at, Query.query_id < query_id))
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def format_turn(query_text, response):
+    return f"Patient: {query_text}\nAssistant: {response}"
+
+def summarize_turns(summary, turns):
+    """Fold turns (rows with query_text and response) into a chat's rolling summary."""
+    budget = current_app.config['CHAT_SUMMARY_TOKENS'] * 4
+    if current_app.config['CHAT_SUMMARY_MODE'] == 'llm':
+        try:
+            prompt = (
+                "Update this summary of a patient's conversation with a medical assistant. "
+                "Keep symptoms, conditions, medications and advice given. "
+                f"Reply with the updated summary only, in at most {budget // 6} words.\n"
+                f"Current summary: {summary or 'none'}\nNew exchanges:\n"
+                + "\n".join(format_turn(turn.query_text, turn.response) for turn in turns)
+            )
+            response = llm_client.generate(prompt)
+            if not is_blocked(response) and response.text:
+                return response.text.strip()[:budget]
+        except Exception as e:
+            log.warning("Chat summary failed: %s", e)
+
+    # Extractive summary: one line per turn, keeping the most recent lines that fit
+    lines = summary.split("\n") if summary else []
+    for turn in turns:
+        answer = turn.response.split('. ')[0]
+        lines.append(f"- Asked: {textwrap.shorten(turn.query_text, 120)} Told: {textwrap.shorten(answer, 160)}")
+    kept, used = [], 0
+    for line in reversed(lines):
+        if used + len(line) + 1 > budget:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(reversed(kept))
+
+def get_chat_summary(chat_id, before):
+    """Summary covering the chat's answered turns before the (created_at, query_id) turn `before`
+    (all of them when None)."""
+    cached = chat_summary_cache.get(chat_id)
+    if cached is None:
+        chat = db.session.execute(
+            db.select(Chatbot.context_summary, Query.created_at, Query.query_id)
+            .outerjoin(Query, Query.query_id == Chatbot.summary_through_query_id)
+            .where(Chatbot.chat_id == chat_id)
+        ).first()
+        through = (chat.created_at, chat.query_id) if chat and chat.query_id is not None else None
+        cached = (through, chat.context_summary if chat else None)
+    through, summary = cached
+
+    # Only the turns that left the window since the last update are folded in;
+    # a chat summarized for the first time contributes at most one window of turns
+    criteria = [Query.chat_id == chat_id, Query.response.isnot(None)]
+    if through is not None:
+        criteria.append(turns_after(*through))
+    if before is not None:
+        criteria.append(turns_before(*before))
+    pending = db.session.execute(
+        db.select(Query.query_id, Query.query_text, Query.response, Query.created_at)
+        .where(*criteria)
+        .order_by(Query.created_at.desc(), Query.query_id.desc())
+        .limit(current_app.config['CHAT_CONTEXT_MAX_TURNS'])
+    ).all()
+    if pending:
+        pending.reverse()
+        summary = summarize_turns(summary, pending)
+        through = (pending[-1].created_at, pending[-1].query_id)
+        try:
+            db.session.execute(
+                Chatbot.__table__.update().where(Chatbot.chat_id == chat_id)
+                .values(context_summary=summary, summary_through_query_id=through[1])
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception("Error saving summary for chat %s", chat_id)
+    chat_summary_cache.set(chat_id, (through, summary))
+    return summary
+
+def build_chat_context(chat_id):
+    if not chat_id:
+        return None
+    sync_writes(Chatbot, chat_id)
+    max_turns = current_app.config['CHAT_CONTEXT_MAX_TURNS']
+    rows = db.session.execute(
+        db.select(Query.query_id, Query.query_text, Query.response, Query.created_at)
+        .where(Query.chat_id == chat_id, Query.response.isnot(None))
+        .order_by(Query.created_at.desc(), Query.query_id.desc())
+        .limit(max_turns)
+    ).all()
+    if not rows:
+        return None
+
+    # Newest turns first, while they fit next to the summary's share of the budget
+    budget = current_app.config['CHAT_CONTEXT_TOKENS'] - current_app.config['CHAT_SUMMARY_TOKENS']
+    recent, used = [], 0
+    for row in rows:
+        turn = format_turn(row.query_text, row.response)
+        cost = estimate_tokens(turn)
+        if used + cost > budget:
+            break
+        recent.append(turn)
+        used += cost
+
+    summary = None
+    if len(recent) < len(rows) or len(rows) == max_turns:
+        oldest_recent = rows[len(recent) - 1] if recent else None
+        summary = get_chat_summary(
+            chat_id, (oldest_recent.created_at, oldest_recent.query_id) if oldest_recent else None
+        )
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of earlier conversation:\n{summary}")
+    if recent:
+        parts.append("Recent conversation:\n" + "\n".join(reversed(recent)))
+    return "\n".join(parts) or None
+
+# Verified answer reuse. A first-turn question close enough to one a clinician has
+# verified is answered with that vetted answer instead of a new LLM call; follow-ups
+# depend on the conversation, so they always go to the LLM. The index is built by create_app.
+verified_answers = None
+
+def load_verified_answers(since):
+    stmt = db.select(VerifiedAnswer.answer_id, VerifiedAnswer.query_id, VerifiedAnswer.question,
+                     VerifiedAnswer.answer, VerifiedAnswer.patient_id)
+    if since is not None:
+        stmt = stmt.where(VerifiedAnswer.verified_at >= since)
+    return db.session.execute(stmt.order_by(VerifiedAnswer.answer_id)).all()
+
+# Only answers verified for the same patient (or for no patient) are candidates
+def find_verified_answer(query_text, conversation=None, patient_id=None):
+    if conversation or verified_answers.threshold <= 0:
+        return None
+    try:
+        scope = None if patient_id in (None, '') else int(patient_id)
+    except (TypeError, ValueError):
+        return None
+    try:
+        verified_answers.refresh(load_verified_answers, time.monotonic())
+        return verified_answers.match(query_text, scope=scope)
+    except Exception:
+        log.exception("Verified answer lookup failed")
+        return None
+
+# Returns (response, answer_source, source_query_id)
+def answer_query(query_text, patient_context=None, conversation=None, patient_id=None):
+    match = find_verified_answer(query_text, conversation, patient_id)
+    if match:
+        source_query_id, answer, _ = match
+        return answer, 'reused', source_query_id
+    return get_response_from_llm(query_text, patient_context, conversation), 'generated', None
+
+# The reviewing clinician: from the body, else from the caller's session token
+def request_clinician_id(data):
+    if data.get('clinician_id'):
+        return data.get('clinician_id')
+    identity = current_identity()
+    if identity and identity.get('role') == 'clinician':
+        return identity['clinician_id']
+    return None
+
+# The patient a query is for: from the body, else from the caller's session token
+def request_patient_id(data):
+    if data.get('patient_id'):
+        return data.get('patient_id')
+    identity = current_identity()
+    if identity and identity.get('role') == 'patient':
+        return identity['patient_id']
+    return None
+
+# Clients opt into async mode with {"async": true} or a "Prefer: respond-async" header
+def wants_async(data):
+    if data.get('async') is True:
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+# Runs on an llm_jobs worker thread and fills in the pending Query row
+def run_llm_job(app, query_id, chat_id, query_text, patient_context, conversation=None, patient_id=None):
+    with app.app_context():
+        try:
+            response, answer_source, source_query_id = answer_query(
+                query_text, patient_context, conversation, patient_id
+            )
+            queue_answer(query_id, chat_id, query_text, response,
+                         answer_source=answer_source, source_query_id=source_query_id)
+        except Exception:
+            db.session.rollback()
+            log.exception("Error in LLM job for query %s", query_id)
+
+def serialize_ai_query(query):
+    return {
+        "success": True,
+        "query_id": query.query_id,
+        "chat_id": query.chat_id,
+        "status": ("interrupted" if query.query_status == 'Interrupted'
+                   else "generating" if query.response is None else "completed"),
+        "query_status": query.query_status,
+        "response": query.response,
+        "answer_source": query.answer_source
+    }
+
 #Add a new endpoint to handle AI queries
-@app.route('/api/ai_query', methods=['POST'])
+@api.route('/api/ai_query', methods=['POST'])
+@idempotent
 def ai_query():
     try:
         data = request.json
         if not data or 'query_text' not in data:
             return jsonify({"success": False, "message": "Invalid request data"}), 400
 
+        if wants_async(data):
+            return ai_query_async(data)
+
         query_text = data.get('query_text')
-        patient_id = data.get('patient_id')
-
-        # Get patient information for context
-        patient_context = None
-        if patient_id:
-            patient = Patient.query.get(patient_id)
-            if patient:
-                patient_context = f"Patient: {patient.full_name}, {patient.gender}, Age: {datetime.now().year - patient.dob.year}."
-
-        # Generate AI response
-        response = get_response_from_llm(query_text, patient_context)
-
-        # Save the query to the database
-        chat_id = data.get('chat_id')
-        if not chat_id:
-            new_chat = Chatbot(patient_id=patient_id)
-            db.session.add(new_chat)
-            db.session.commit()
-            chat_id = new_chat.chat_id
-
-        new_query = Query(
-            chat_id=chat_id,
-            patient_id=patient_id,
-            query_text=query_text,
-            response=response,
-            query_status='Pending'
-        )
-        db.session.add(new_query)
-        db.session.commit()
+        patient_id = request_patient_id(data)
+
+        # Get patient information and earlier turns of this chat for context
+        patient_context = build_patient_context(patient_id)
+        conversation = build_chat_context(data.get('chat_id'))
+
+        # Reuse a verified answer or generate a new one
+        response, answer_source, source_query_id = answer_query(query_text, patient_context, conversation, patient_id)
+
+        # Save the query to the database (in the write-behind queue's next group commit)
+        chat_id = get_or_create_chat(data.get('chat_id'), patient_id)
+        query_id = queue_query(chat_id, patient_id, query_text, response, answer_source, source_query_id)
 
         return jsonify({
             "success": True,
             "response": response,
-            "query_id": new_query.query_id,
-            "chat_id": chat_id
+            "query_id": query_id,
+            "chat_id": chat_id,
+            "answer_source": answer_source
         })
 
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Error in ai_query: {e}")
+        log.exception("Error in ai_query")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
+# Persist the query straight away and leave generation to the worker pool
+def ai_query_async(data):
+    # Reserve a worker slot before writing anything so a full queue costs no DB work
+    try:
+        llm_jobs.reserve()
+    except QueueFull:
+        retry_after = current_app.config['LLM_RETRY_AFTER']
+        response = jsonify({"success": False, "message": "Too many pending AI queries, please retry later"})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+
+    try:
+        query_text = data.get('query_text')
+        patient_id = request_patient_id(data)
+        patient_context = build_patient_context(patient_id)
+        conversation = build_chat_context(data.get('chat_id'))
+        chat_id = get_or_create_chat(data.get('chat_id'), patient_id)
+        query_id = queue_query(chat_id, patient_id, query_text)
+        llm_jobs.submit(query_id, run_llm_job, current_app._get_current_object(), query_id, chat_id,
+                        query_text, patient_context, conversation, patient_id)
+    except Exception:
+        llm_jobs.release()
+        raise
+
+    response = jsonify({
+        "success": True,
+        "status": "generating",
+        "query_id": query_id,
+        "chat_id": chat_id
+    })
+    response.headers['Location'] = f"/api/ai_query/{query_id}"
+    return response, 202
+
+# Persist a pending query and return (query_id, chat_id, events); events yields the
+# newline-delimited JSON of the answer and saves the response once it ends
+def start_answer_stream(query_text, patient_id, chat_id):
+    patient_context = build_patient_context(patient_id)
+    conversation = build_chat_context(chat_id)
+    chat_id = get_or_create_chat(chat_id, patient_id)
+    match = find_verified_answer(query_text, conversation, patient_id)
+    answer_source = 'reused' if match else 'generated'
+
+    # Write the row up front so the client gets its ids with the first line
+    query_id = queue_query(chat_id, patient_id, query_text, answer_source=answer_source,
+                           source_query_id=match[0] if match else None)
+
+    def events():
+        parts = []
+        complete = False
+        try:
+            yield json.dumps({"type": "meta", "query_id": query_id, "chat_id": chat_id,
+                              "answer_source": answer_source}) + "\n"
+            chunks = [match[1]] if match else stream_response_from_llm(query_text, patient_context, conversation)
+            for text in chunks:
+                parts.append(text)
+                yield json.dumps({"type": "chunk", "text": text}) + "\n"
+            complete = True
+            yield json.dumps({"type": "done", "query_id": query_id, "chat_id": chat_id}) + "\n"
+        finally:
+            # Runs on completion and on client disconnect alike. Only a whole answer is
+            # saved and sent for review; a cut-off one would read as a complete reply.
+            try:
+                if complete:
+                    queue_answer(query_id, chat_id, query_text, "".join(parts))
+                else:
+                    queue_interrupted(query_id, chat_id)
+            except Exception:
+                log.exception("Error saving streamed response for query %s", query_id)
+
+    return query_id, chat_id, events()
+
+def ndjson_response(events):
+    response = Response(stream_with_context(events), mimetype='application/x-ndjson')
+    # Ask proxies not to buffer the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Streaming variant of /api/ai_query: newline-delimited JSON events
+# {"type": "meta", ...} first, then {"type": "chunk", "text": ...}, then {"type": "done", ...}
+@api.route('/api/ai_query/stream', methods=['POST'])
+def ai_query_stream():
+    data = request.json
+    if not data or 'query_text' not in data:
+        return jsonify({"success": False, "message": "Invalid request data"}), 400
+
+    try:
+        _, _, events = start_answer_stream(data.get('query_text'), request_patient_id(data), data.get('chat_id'))
+    except Exception:
+        db.session.rollback()
+        log.exception("Error in ai_query_stream")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+    return ndjson_response(events)
+
+# Speech-to-text for voice queries. The model is loaded once per process and kept warm;
+# a single worker thread runs it on batches of 30-second chunks from all uploads in flight.
+# Built by create_app.
+transcriber = None
+
+# Load the model in the background so startup isn't blocked and the first upload finds it warm
+def preload_transcriber():
+    def warm_up():
+        try:
+            transcriber.warm_up()
+            log.info("Transcription model loaded in %.1fs", transcriber.backend.load_seconds or 0)
+        except Exception as e:
+            log.warning("Transcription model not loaded: %s", e)
+
+    threading.Thread(target=warm_up, name='transcribe-warmup', daemon=True).start()
+
+# Voice query: the audio is uploaded as the "audio" field of a multipart form (with
+# patient_id and chat_id as form fields) or as the raw request body (with them in the
+# query string), in any format ffmpeg can read. The answer is newline-delimited JSON:
+# {"type": "transcript", "final": false, ...} as each chunk of audio is transcribed,
+# {"type": "transcript", "final": true, "text": ...} with the whole transcript, and then
+# the same meta/chunk/done events as /api/ai_query/stream.
+@api.route('/api/voice_query', methods=['POST'])
+def voice_query():
+    upload = request.files.get('audio')
+    if upload is None and request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        return jsonify({"success": False, "message": "Missing audio file"}), 400
+    if transcriber.saturated():
+        response = jsonify({"success": False, "message": "Too many voice queries in progress, please retry later"})
+        response.headers['Retry-After'] = str(current_app.config['LLM_RETRY_AFTER'])
+        return response, 429
+
+    data = {**request.args.to_dict(), **request.form.to_dict()}
+    patient_id = request_patient_id(data)
+    audio = upload.stream if upload is not None else request.stream
+
+    def generate():
+        started = time.perf_counter()
+        pending, texts = [], []
+        audio_seconds = 0.0
+
+        def transcript_event(text):
+            texts.append(text)
+            return json.dumps({"type": "transcript", "final": False, "index": len(texts) - 1, "text": text}) + "\n"
+
+        try:
+            # Decoding of the next chunk overlaps with transcription of the earlier ones
+            for chunk in iter_chunks(decode_audio(audio), max_seconds=current_app.config['VOICE_MAX_SECONDS']):
+                audio_seconds += len(chunk) / SAMPLE_RATE
+                pending.append(transcriber.submit(chunk, timeout=current_app.config['LLM_MAX_WAIT']))
+                while pending and pending[0].done():
+                    yield transcript_event(pending.pop(0).result())
+            while pending:
+                yield transcript_event(pending.pop(0).result())
+        except (TranscriptionError, QueueFull) as e:
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+            return
+        except Exception:
+            log.exception("Error transcribing voice query")
+            yield json.dumps({"type": "error", "message": "Could not transcribe the audio"}) + "\n"
+            return
+        finally:
+            for future in pending:
+                future.cancel()
+
+        query_text = " ".join(text for text in texts if text)
+        yield json.dumps({"type": "transcript", "final": True, "text": query_text,
+                          "audio_seconds": round(audio_seconds, 2),
+                          "transcribe_seconds": round(time.perf_counter() - started, 3)}) + "\n"
+        if not query_text:
+            yield json.dumps({"type": "error", "message": "No speech was recognized"}) + "\n"
+            return
+
+        try:
+            _, _, events = start_answer_stream(query_text, patient_id, data.get('chat_id'))
+        except Exception:
+            db.session.rollback()
+            log.exception("Error in voice_query")
+            yield json.dumps({"type": "error", "message": "Internal server error"}) + "\n"
+            return
+        yield from events
+
+    return ndjson_response(generate())
+
+# Poll an async AI query; ?wait=N long-polls up to N seconds for the answer
+@api.route('/api/ai_query/<int:query_id>', methods=['GET'])
+def get_ai_query(query_id):
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['LLM_MAX_WAIT'])
+    if wait > 0:
+        llm_jobs.wait(query_id, wait)
+    sync_writes(Query, query_id)
+
+    query = Query.query.get_or_404(query_id)
+    return jsonify(serialize_ai_query(query))
+
+# LLM pipeline statistics (response cache, request coalescing, upstream client and async job pool)
+@api.route('/api/llm-stats', methods=['GET'])
+def get_llm_stats():
+    return jsonify({
+        "cache": response_cache.stats(),
+        "coalescing": llm_flight.stats(),
+        "upstream": llm_client.stats(),
+        "verified_reuse": verified_answers.stats(),
+        "jobs": {
+            "in_flight": llm_jobs.in_flight(),
+            "workers": llm_jobs.max_workers,
+            "queue_depth": llm_jobs.max_queue
+        }
+    })
+
+# Values kept by the caches and the LLM client, read when /metrics is scraped
+@metrics.register_collector
+def collect_llm_pipeline():
+    cache_stats = response_cache.stats()
+    client_stats = llm_client.stats()
+    reuse_stats = verified_answers.stats()
+    transcribe_stats = transcriber.stats()
+    write_stats = write_behind.stats()
+    idempotency_stats = idempotency_keys.stats()
+    return [
+        ('caresync_llm_cache_requests_total', 'counter', 'LLM response cache lookups by result.',
+         [({"result": "hit"}, cache_stats['hits']), ({"result": "miss"}, cache_stats['misses'])]),
+        ('caresync_llm_cache_evictions_total', 'counter', 'LLM response cache evictions.',
+         [({}, cache_stats['evictions'])]),
+        ('caresync_llm_coalesced_calls_total', 'counter', 'LLM calls saved by joining an identical call in flight.',
+         [({}, llm_flight.stats()['saved_calls'])]),
+        ('caresync_llm_upstream_calls_total', 'counter', 'Upstream LLM calls by outcome.',
+         [({"outcome": name}, client_stats[name]) for name in ('succeeded', 'failed', 'timed_out', 'hedged')]),
+        ('caresync_llm_circuit_open', 'gauge', '1 while the LLM circuit breaker is not closed.',
+         [({}, int(client_stats['circuit']['state'] != 'closed'))]),
+        ('caresync_verified_answer_lookups_total', 'counter', 'Verified answer lookups by result.',
+         [({"result": "reused"}, reuse_stats['reused']), ({"result": "not_matched"}, reuse_stats['not_matched'])]),
+        ('caresync_llm_jobs_in_flight', 'gauge', 'Async LLM jobs queued or running.',
+         [({}, llm_jobs.in_flight())]),
+        ('caresync_transcription_chunks_total', 'counter', 'Audio chunks transcribed.',
+         [({}, transcribe_stats['chunks'])]),
+        ('caresync_transcription_batches_total', 'counter', 'Transcription model runs, by result.',
+         [({"result": "ok"}, transcribe_stats['batches']), ({"result": "failed"}, transcribe_stats['failed_batches'])]),
+        ('caresync_transcription_audio_seconds_total', 'counter', 'Seconds of audio transcribed.',
+         [({}, transcribe_stats['audio_seconds'])]),
+        ('caresync_transcription_compute_seconds_total', 'counter', 'Seconds spent running the transcription model.',
+         [({}, transcribe_stats['compute_seconds'])]),
+        ('caresync_transcription_queued_chunks', 'gauge', 'Audio chunks waiting for the transcription worker.',
+         [({}, transcribe_stats['queued'])]),
+        ('caresync_write_behind_pending', 'gauge', 'Chat and query writes waiting for a group commit.',
+         [({}, write_stats['pending'])]),
+        ('caresync_write_behind_writes_total', 'counter', 'Chat and query writes queued, merged into a queued insert, '
+         'or dropped after failing.',
+         [({"result": name}, write_stats[name]) for name in ('writes', 'merged', 'dropped')]),
+        ('caresync_write_behind_commits_total', 'counter', 'Write-behind group commits, by result.',
+         [({"result": "ok"}, write_stats['batches']), ({"result": "failed"}, write_stats['failed_batches'])]),
+        ('caresync_write_behind_commit_seconds_total', 'counter', 'Seconds spent applying write-behind batches.',
+         [({}, write_stats['commit_seconds'])]),
+        ('caresync_idempotency_lookups_total', 'counter', 'Idempotency-Key lookups by outcome: run the request, '
+         'replay a stored response, still in flight, or key reused for another request.',
+         [({"outcome": label}, idempotency_stats[name]) for label, name in
+          (("run", CLAIMED), ("replayed", COMPLETED), ("in_flight", IN_FLIGHT), ("mismatch", MISMATCH))]),
+        ('caresync_session_cache_entries', 'gauge', 'Session tokens cached in this process.',
+         [({}, len(session_cache))]),
+        ('caresync_revoked_session_tokens', 'gauge', 'Unexpired revoked session tokens known to this process.',
+         [({}, len(revoked_tokens))]),
+        ('caresync_patient_context_cache_entries', 'gauge', 'Patient context snapshots cached in this process.',
+         [({}, len(patient_context_cache))]),
+        ('caresync_profile_cache_entries', 'gauge', 'Serialized patient and clinician profiles cached in this process.',
+         [({}, len(profile_cache))]),
+        ('caresync_review_event_streams', 'gauge', 'Review event streams open on this process.',
+         [({}, review_events.subscriber_count())]),
+    ]
+
+# SQL profiler report: per-route statement counts and time, N+1 suspects, and slow
+# statements with their captured plans (enable with SQL_PROFILER=1)
+@api.route('/api/profiler', methods=['GET'])
+def get_profiler_report():
+    if sql_profiler is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **sql_profiler.report()})
+
+@api.route('/api/profiler/reset', methods=['POST'])
+def reset_profiler():
+    if sql_profiler is None:
+        return jsonify({"enabled": False})
+    sql_profiler.reset()
+    return jsonify({"enabled": True, "reset": True})
+
+# Prometheus scrape endpoint
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # API routes for patient signup
-@app.route('/api/patient/signup', methods=['POST'])
+@api.route('/api/patient/signup', methods=['POST'])
 def patient_signup():
     try:
         data = request.form  # If using form data
         # data = request.json  # If using JSON data
         
-        print("Received signup data:", data)  # Debug log
+        log.debug("Patient signup received", extra={"fields": sorted(data.keys())})
         
         # Create user first
         new_user = User(
             is_patient=True,
             is_clinician=False,
-            password_hash=data.get('password')
+            password_hash=hash_password(data.get('password'))
         )
         db.session.add(new_user)
         db.session.flush()  # Get the user_id before committing
@@ -349,25 +1968,26 @@ def patient_signup():
         db.session.add(new_patient)
         db.session.commit()
         
-        print(f"Successfully created patient with ID: {new_patient.patient_id}")  # Debug log
+        log.info("Created patient %s", new_patient.patient_id)
         return jsonify({"success": True, "patient_id": new_patient.patient_id})
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error in patient_signup: {str(e)}")  # Debug log
+        log.exception("Error in patient_signup")
         return jsonify({"error": str(e)}), 500
 
 # # API routes for clinician signup
-@app.route('/api/clinician/signup', methods=['POST'])
+@api.route('/api/clinician/signup', methods=['POST'])
 def clinician_signup():
     data = request.json
     
     try:
         # Create a new user
+        password_hash = hash_password(data.get('password'))
         new_user = User(
             is_patient=False,
             is_clinician=True,
-            password_hash=data.get('password')
+            password_hash=password_hash
         )
         db.session.add(new_user)
         db.session.commit()
@@ -378,7 +1998,7 @@ def clinician_signup():
             full_name=f"{data.get('firstName', '')} {data.get('lastName', '')}",
             email=data.get('email', ''),
             phone=data.get('phone', ''),
-            password_hash=data.get('password'),
+            password_hash=password_hash,
             medical_reg_number=data.get('medicalRegNumber', ''),
             specialization=data.get('specialization', ''),
             years_of_experience=int(data.get('yearsOfExperience', 0)),
@@ -400,69 +2020,357 @@ def clinician_signup():
     
 
 # API routes for chat functionality
-@app.route('/api/chat_history', methods=['GET'])
+# Turns of one chat, oldest first, paged with ?limit= and ?after=<query_id cursor>
+@api.route('/api/chat_history', methods=['GET'])
 def get_chat_history():
-    session_id = request.args.get('session_id')
-    # For demo purposes, return mock data
-    mock_history = [
-        {
-            "role": "user",
-            "parts": [{"text": "I've been having severe headaches lately, what could it be?"}]
-        },
-        {
-            "role": "assistant",
-            "parts": [{"text": "Headaches can be caused by various factors including stress, dehydration, lack of sleep, eye strain, or more serious conditions. If the headaches are severe or persistent, it's important to consult with a healthcare professional for proper diagnosis. In the meantime, ensure you're staying hydrated, getting adequate rest, and managing stress levels."}]
-        },
-        {
-            "role": "user",
-            "parts": [{"text": "What medications can help with migraines?"}]
-        },
-        {
-            "role": "assistant", 
-            "parts": [{"text": "Common medications for migraines include over-the-counter pain relievers like ibuprofen or aspirin, triptans (such as sumatriptan), anti-nausea medications, and preventive medications for those with frequent migraines. It's important to consult with a healthcare provider before starting any medication regimen for proper diagnosis and personalized treatment."}]
-        }
-    ]
-    return jsonify({"history": mock_history})
-
-@app.route('/api/verify_response', methods=['POST'])
+    chat_id = request.args.get('chat_id') or request.args.get('session_id')
+    if not chat_id:
+        return jsonify({"error": "chat_id required"}), 400
+    sync_writes(Chatbot, chat_id)
+    try:
+        limit = page_limit()
+        after = request.args.get('after', type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    criteria = [Query.chat_id == chat_id]
+    if after is not None:
+        # The cursor is the last turn's id; pages continue in turn order from its created_at
+        cursor = db.session.execute(
+            db.select(Query.created_at, Query.query_id).where(Query.query_id == after, Query.chat_id == chat_id)
+        ).first()
+        if cursor is None:
+            return jsonify({"error": "after must be a cursor returned by a previous page"}), 400
+        criteria.append(turns_after(*cursor))
+    rows = db.session.execute(
+        db.select(Query.query_id, Query.query_text, Query.response)
+        .where(*criteria)
+        .order_by(Query.created_at, Query.query_id)
+        .limit(limit + 1)
+    ).all()
+    next_cursor = str(rows[limit - 1].query_id) if len(rows) > limit else None
+
+    history = []
+    for row in rows[:limit]:
+        history.append({"role": "user", "query_id": row.query_id, "parts": [{"text": row.query_text}]})
+        if row.response is not None:
+            history.append({"role": "assistant", "query_id": row.query_id, "parts": [{"text": row.response}]})
+    return paged_response({"history": history, "next_cursor": next_cursor}, next_cursor)
+
+# Clinician review: verify a query's answer as is, or replace it with an edited one.
+# Either way the query becomes Verified and the answer joins the reuse corpus.
+@api.route('/api/verify_response', methods=['POST'])
 def verify_response():
-    data = request.json
-    response = data.get('response')
-    # In a real app, save the verified response to database
-    return jsonify({"success": True})
+    return save_reviewed_response(request.json or {}, edited=False)
 
-@app.route('/api/edit_response', methods=['POST'])
+@api.route('/api/edit_response', methods=['POST'])
 def edit_response():
-    data = request.json
-    response = data.get('response')
-    # In a real app, save the edited response to database
-    return jsonify({"success": True})
+    return save_reviewed_response(request.json or {}, edited=True)
+
+def save_reviewed_response(data, edited):
+    query_id = data.get('query_id')
+    if not query_id:
+        return jsonify({"success": False, "error": "query_id is required"}), 400
+    sync_writes(Query, query_id)
+    query = db.session.get(Query, query_id)
+    if query is None:
+        return jsonify({"success": False, "error": "Query not found"}), 404
+
+    response = (data.get('response') or '').strip() or (None if edited else query.response)
+    if not response:
+        return jsonify({"success": False, "error": "response is required"}), 400
+    if response in (SAFETY_BLOCKED_MESSAGE, LLM_ERROR_MESSAGE):
+        return jsonify({"success": False, "error": "An error message cannot be verified"}), 400
+
+    clinician_id = request_clinician_id(data)
+    if lease_held_by_other(query, clinician_id):
+        return jsonify({"success": False, "error": "Query is claimed by another clinician"}), 409
 
-# API routes for patient query history
-@app.route('/api/queries', methods=['GET'])
-def get_patient_queries():
-    patient_id = request.args.get('patientId')
-    
-    if not patient_id:
-        return jsonify({"error": "Patient ID required"}), 400
-    
-    queries = Query.query.filter_by(patient_id=patient_id).all()
-    
-    result = []
-    for query in queries:
-        result.append({
-            "query_id": query.query_id,
-            "query_text": query.query_text,
-            "response": query.response,
-            "status": query.query_status,
-            "created_at": query.created_at.isoformat()
-        })
-    
-    return jsonify(result)
+    try:
+        if response != query.response:
+            query.answer_source = 'edited'
+            query.source_query_id = None
+        query.response = response
+        query.query_status = 'Verified'
+        query.claimed_by = None
+        query.lease_expires_at = None
+        if clinician_id:
+            query.clinician_id = clinician_id
+
+        db.session.execute(db.delete(VerifiedAnswer).where(VerifiedAnswer.query_id == query.query_id))
+        verified = VerifiedAnswer(
+            query_id=query.query_id, clinician_id=clinician_id, patient_id=query.patient_id,
+            question=query.query_text, answer=response
+        )
+        db.session.add(verified)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        log.exception("Error saving reviewed response for query %s", query_id)
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+    verified_answers.add(verified.answer_id, verified.query_id, verified.question, verified.answer, verified.patient_id)
+    return jsonify({"success": True, "query_id": query.query_id, "query_status": query.query_status})
+
+# Clinician review queue over answered Pending queries. A clinician claims a query
+# under a lease of REVIEW_LEASE_SECONDS; while the lease runs nobody else can claim,
+# verify or edit it, and once it lapses without renewal the query is claimable again.
+# Claims are a single conditional UPDATE, so two clinicians can never win the same row.
+def lease_held_by_other(query, clinician_id):
+    return (query.claimed_by is not None and query.lease_expires_at is not None
+            and query.lease_expires_at > datetime.utcnow() and str(query.claimed_by) != str(clinician_id))
+
+def claimable_criteria(now):
+    return (
+        Query.query_status == 'Pending',
+        Query.response.isnot(None),
+        or_(Query.lease_expires_at.is_(None), Query.lease_expires_at <= now)
+    )
 
+def serialize_claim(row):
+    return {name: to_json_value(getattr(row, name)) for name in REVIEW_QUEUE_FIELDS}
+
+# Pending queries waiting for review (status=Verified lists reviewed ones); paged like the list endpoints
+@api.route('/api/review/queue', methods=['GET'])
+def get_review_queue():
+    status = request.args.get('status', 'Pending')
+    if status not in ('Pending', 'Verified'):
+        return jsonify({"error": "status must be Pending or Verified"}), 400
+    criteria = [Query.query_status == status]
+    if status == 'Pending':
+        criteria = list(claimable_criteria(datetime.utcnow()))
+    try:
+        result, next_cursor = keyset_page(REVIEW_QUEUE_FIELDS, Query.query_id, *criteria)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
+
+# Claim the oldest claimable query, or a specific one with {"query_id": ...}; 204 when there is none
+@api.route('/api/review/claim', methods=['POST'])
+def claim_review():
+    data = request.json or {}
+    clinician_id = request_clinician_id(data)
+    if not clinician_id:
+        return jsonify({"error": "clinician_id is required"}), 400
+
+    now = datetime.utcnow()
+    criteria = claimable_criteria(now)
+    if data.get('query_id'):
+        sync_writes(Query, data.get('query_id'))
+        target = Query.query_id == data.get('query_id')
+    else:
+        # Answers this process has queued are claimable as soon as they are committed
+        write_behind.sync()
+        target = Query.query_id == (
+            db.select(Query.query_id).where(*criteria).order_by(Query.query_id).limit(1)
+            .with_for_update(skip_locked=True).scalar_subquery()
+        )
+    lease_expires_at = now + timedelta(seconds=current_app.config['REVIEW_LEASE_SECONDS'])
+    try:
+        claimed = db.session.execute(
+            db.update(Query).where(target, *criteria)
+            .values(claimed_by=clinician_id, lease_expires_at=lease_expires_at)
+            .returning(*REVIEW_QUEUE_FIELDS.values()),
+            execution_options={"synchronize_session": False}
+        ).first()
+        if claimed is not None:
+            review_events.record(db.session, 'claimed', {"query_id": claimed.query_id, "claimed_by": clinician_id})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        log.exception("Error claiming review")
+        return jsonify({"error": "Internal server error"}), 500
+
+    if claimed is None:
+        if data.get('query_id'):
+            return jsonify({"error": "Query is not available for review"}), 409
+        return '', 204
+    return jsonify(serialize_claim(claimed))
+
+# Extend a lease the caller holds
+@api.route('/api/review/<int:query_id>/renew', methods=['POST'])
+def renew_review(query_id):
+    data = request.json or {}
+    clinician_id = request_clinician_id(data)
+    if not clinician_id:
+        return jsonify({"error": "clinician_id is required"}), 400
+    lease_expires_at = datetime.utcnow() + timedelta(seconds=current_app.config['REVIEW_LEASE_SECONDS'])
+    renewed = db.session.execute(
+        db.update(Query)
+        .where(Query.query_id == query_id, Query.query_status == 'Pending', Query.claimed_by == clinician_id,
+               Query.lease_expires_at > datetime.utcnow())
+        .values(lease_expires_at=lease_expires_at),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.session.commit()
+    if not renewed:
+        return jsonify({"error": "Lease not held or already expired"}), 409
+    return jsonify({"query_id": query_id, "lease_expires_at": lease_expires_at.isoformat()})
+
+# Give a query the caller has claimed back to the queue
+@api.route('/api/review/<int:query_id>/release', methods=['POST'])
+def release_review(query_id):
+    data = request.json or {}
+    clinician_id = request_clinician_id(data)
+    if not clinician_id:
+        return jsonify({"error": "clinician_id is required"}), 400
+    released = db.session.execute(
+        db.update(Query)
+        .where(Query.query_id == query_id, Query.query_status == 'Pending', Query.claimed_by == clinician_id,
+               Query.lease_expires_at > datetime.utcnow())
+        .values(claimed_by=None, lease_expires_at=None),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if released:
+        review_events.record(db.session, 'released', {"query_id": query_id})
+    db.session.commit()
+    if not released:
+        return jsonify({"error": "Lease not held"}), 409
+    return jsonify({"query_id": query_id, "released": True})
+
+# Server-Sent Events for review dashboards: "pending" when an answered query enters
+# the queue, "claimed"/"released" as leases change hands, "verified" once reviewed.
+# Expired leases are not announced; clients reload the queue on "resync" or reconnect.
+# A worker already serving REVIEW_EVENTS_MAX_STREAMS streams answers 503, and the
+# dashboard polls the queue instead.
+@api.route('/api/review/events', methods=['GET'])
+def review_event_stream():
+    review_events.start(current_app._get_current_object().app_context)  # once per process
+    subscriber = review_events.subscribe()
+    if subscriber is None:
+        response = jsonify({"error": "Too many event streams on this worker, poll /api/review/queue instead"})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    response = Response(
+        stream_with_context(review_events.stream(subscriber, current_app.config['REVIEW_EVENTS_HEARTBEAT'])),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Patient and clinician profiles. The serialized body is cached per process along with
+# a strong ETag (a hash of the body) and Last-Modified (the row's updated_at), so a client
+# revalidating with If-None-Match or If-Modified-Since gets a 304 with no body. For
+# PROFILE_CACHE_TTL seconds after it was loaded or checked an entry is served without
+# touching the database; after that one primary-key lookup of updated_at confirms it (or
+# reloads the row when another worker changed it). Committed ORM writes in this process
+# drop the entry at once (see invalidate_changed_profiles). Built by create_app.
+profile_cache = None
+# Bumped by every invalidation; a load that raced with one is not cached
+profile_generation = 0
+profile_lock = threading.Lock()
+
+def invalidate_profile(key):
+    global profile_generation
+    with profile_lock:
+        profile_generation += 1
+        profile_cache.delete(key)
+
+PATIENT_PROFILE_FIELDS = {
+    "patient_id": Patient.patient_id,
+    "full_name": Patient.full_name,
+    "dob": Patient.dob,
+    "gender": Patient.gender,
+    "height": Patient.height,
+    "weight": Patient.weight,
+    "phone": Patient.phone,
+    "email": Patient.email,
+    "aadhar_number": Patient.aadhar_number,
+    "diabetes": Patient.diabetes,
+    "hypertension": Patient.hypertension,
+    "heart_disease": Patient.heart_disease,
+    "asthma": Patient.asthma,
+    "stroke": Patient.stroke,
+    "other_conditions": Patient.other_conditions,
+    "current_medications": Patient.current_medications,
+    "no_allergies": Patient.no_allergies,
+    "medication_allergies": Patient.medication_allergies,
+    "food_allergies": Patient.food_allergies,
+    "environmental_allergies": Patient.environmental_allergies,
+    "family_diabetes": Patient.family_diabetes,
+    "family_heart_disease": Patient.family_heart_disease,
+    "family_stroke": Patient.family_stroke,
+    "family_cancer": Patient.family_cancer,
+    "family_mental_health": Patient.family_mental_health,
+    "smoking_status": Patient.smoking_status,
+    "alcohol_use": Patient.alcohol_use,
+    "exercise_frequency": Patient.exercise_frequency,
+    "diet": Patient.diet,
+    "anxiety": Patient.anxiety,
+    "depression": Patient.depression,
+    "ptsd": Patient.ptsd,
+    "adhd": Patient.adhd,
+    "bipolar": Patient.bipolar,
+    "other_mental_health": Patient.other_mental_health,
+    "additional_info": Patient.additional_info
+}
+
+CLINICIAN_PROFILE_FIELDS = {
+    "clinician_id": Clinician.clinician_id,
+    "user_id": Clinician.user_id,
+    "full_name": Clinician.full_name,
+    "email": Clinician.email,
+    "phone": Clinician.phone,
+    "medical_reg_number": Clinician.medical_reg_number,
+    "specialization": Clinician.specialization,
+    "years_of_experience": Clinician.years_of_experience,
+    "affiliated_hospitals": Clinician.affiliated_hospitals,
+    "aadhar_number": Clinician.aadhar_number
+}
+
+# Returns (body, etag, last_modified) of the profile, or None when there is no such row
+def load_profile(model, fields, row_id):
+    row = db.session.execute(
+        db.select(*fields.values(), model.updated_at).where(inspect(model).primary_key[0] == row_id)
+    ).first()
+    if row is None:
+        return None
+    body = jsonify({name: to_json_value(value) for name, value in zip(fields, row)}).get_data()
+    return body, generate_etag(body), row.updated_at
+
+# Returns the cached (body, etag, last_modified) of a profile, loading or revalidating it as needed
+def cached_profile(model, fields, row_id):
+    key = (model.__tablename__, row_id)
+    now = time.monotonic()
+    entry = profile_cache.get(key)
+    if entry is not None and now - entry[3] < current_app.config['PROFILE_CACHE_TTL']:
+        return entry[:3]
+
+    generation = profile_generation
+    if entry is not None:
+        updated_at = db.session.execute(
+            db.select(model.updated_at).where(inspect(model).primary_key[0] == row_id)
+        ).first()
+        if updated_at is not None and updated_at[0] == entry[2]:
+            profile = entry[:3]
+        else:
+            profile = load_profile(model, fields, row_id) if updated_at is not None else None
+    else:
+        profile = load_profile(model, fields, row_id)
+    with profile_lock:
+        if profile is None:
+            profile_cache.delete(key)
+        elif generation == profile_generation:
+            profile_cache.set(key, (*profile, now))
+    return profile
+
+def profile_response(model, fields, row_id):
+    profile = cached_profile(model, fields, row_id)
+    if profile is None:
+        abort(404)
+    body, etag, last_modified = profile
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep the profile but must revalidate it before every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 # Routes for Patients
-@app.route('/api/patients', methods=['POST'])
+@api.route('/api/patients', methods=['POST'])
+@idempotent
 def create_patient():
     data = request.json
 
@@ -471,7 +2379,7 @@ def create_patient():
         new_user = User(
             is_patient=True,
             is_clinician=False,
-            password_hash=data.get('password')  # Ensure password is hashed in production
+            password_hash=hash_password(data.get('password'))
         )
         db.session.add(new_user)
         db.session.commit()
@@ -532,59 +2440,22 @@ def create_patient():
             "message": f"Error during patient creation: {str(e)}"
         }), 500
 
-@app.route('/api/patients/<int:patient_id>', methods=['GET'])
+@api.route('/api/patients/<int:patient_id>', methods=['GET'])
 def get_patient(patient_id):
-    patient = Patient.query.get_or_404(patient_id)
-    return jsonify({
-        "patient_id": patient.patient_id,
-        "full_name": patient.full_name,
-        "dob": patient.dob.isoformat(),
-        "gender": patient.gender,
-        "height": patient.height,
-        "weight": patient.weight,
-        "phone": patient.phone,
-        "email": patient.email,
-        "aadhar_number": patient.aadhar_number,
-        "diabetes": patient.diabetes,
-        "hypertension": patient.hypertension,
-        "heart_disease": patient.heart_disease,
-        "asthma": patient.asthma,
-        "stroke": patient.stroke,
-        "other_conditions": patient.other_conditions,
-        "current_medications": patient.current_medications,
-        "no_allergies": patient.no_allergies,
-        "medication_allergies": patient.medication_allergies,
-        "food_allergies": patient.food_allergies,
-        "environmental_allergies": patient.environmental_allergies,
-        "family_diabetes": patient.family_diabetes,
-        "family_heart_disease": patient.family_heart_disease,
-        "family_stroke": patient.family_stroke,
-        "family_cancer": patient.family_cancer,
-        "family_mental_health": patient.family_mental_health,
-        "smoking_status": patient.smoking_status,
-        "alcohol_use": patient.alcohol_use,
-        "exercise_frequency": patient.exercise_frequency,
-        "diet": patient.diet,
-        "anxiety": patient.anxiety,
-        "depression": patient.depression,
-        "ptsd": patient.ptsd,
-        "adhd": patient.adhd,
-        "bipolar": patient.bipolar,
-        "other_mental_health": patient.other_mental_health,
-        "additional_info": patient.additional_info
-    })
+    return profile_response(Patient, PATIENT_PROFILE_FIELDS, patient_id)
 
 # Routes for Clinicians
-@app.route('/api/clinicians', methods=['POST'])
+@api.route('/api/clinicians', methods=['POST'])
 def create_clinician():
     data = request.json
 
     try:
         # Create a new user (if not already created)
+        password_hash = hash_password(data.get('password'))
         new_user = User(
             is_patient=False,
             is_clinician=True,
-            password_hash=data.get('password')  # Ensure password is hashed in production
+            password_hash=password_hash
         )
         db.session.add(new_user)
         db.session.commit()
@@ -595,7 +2466,7 @@ def create_clinician():
             full_name=data.get('full_name'),
             email=data.get('email'),
             phone=data.get('phone'),
-            password_hash=data.get('password'),  # Ensure password is hashed in production
+            password_hash=password_hash,
             medical_reg_number=data.get('medical_reg_number'),
             specialization=data.get('specialization'),
             years_of_experience=int(data.get('years_of_experience', 0)),
@@ -621,25 +2492,13 @@ def create_clinician():
 
 
     # Get a specific clinician by ID
-@app.route('/api/clinicians/<int:clinician_id>', methods=['GET'])
+@api.route('/api/clinicians/<int:clinician_id>', methods=['GET'])
 def get_clinician(clinician_id):
-    clinician = Clinician.query.get_or_404(clinician_id)
-    
-    return jsonify({
-        "clinician_id": clinician.clinician_id,
-        "user_id": clinician.user_id,
-        "full_name": clinician.full_name,
-        "email": clinician.email,
-        "phone": clinician.phone,
-        "medical_reg_number": clinician.medical_reg_number,
-        "specialization": clinician.specialization,
-        "years_of_experience": clinician.years_of_experience,
-        "affiliated_hospitals": clinician.affiliated_hospitals,
-        "aadhar_number": clinician.aadhar_number
-    })
+    return profile_response(Clinician, CLINICIAN_PROFILE_FIELDS, clinician_id)
 
 # Routes for Queries
-@app.route('/api/queries', methods=['POST'])
+@api.route('/api/queries', methods=['POST'])
+@idempotent
 def create_query():
     data = request.json
     
@@ -650,6 +2509,7 @@ def create_query():
     
     # Create the query
     new_query = Query(
+        query_id=row_ids.next(Query),
         chat_id=data['chat_id'],
         patient_id=data['patient_id'],
         clinician_id=data.get('clinician_id'),
@@ -666,8 +2526,9 @@ def create_query():
         "chat_id": new_query.chat_id
     }), 201
 
-@app.route('/api/queries/<int:query_id>', methods=['GET'])
+@api.route('/api/queries/<int:query_id>', methods=['GET'])
 def get_query(query_id):
+    sync_writes(Query, query_id)
     query = Query.query.get_or_404(query_id)
     return jsonify({
         "query_id": query.query_id,
@@ -682,154 +2543,674 @@ def get_query(query_id):
 
 
 # Get all patients
-@app.route('/api/patients', methods=['GET'])
+@api.route('/api/patients', methods=['GET'])
 def get_all_patients():
     try:
-        print("Fetching all patients...")  # Debug log
-        patients = Patient.query.all()
-        print(f"Found {len(patients)} patients")  # Debug log
+        result, next_cursor = keyset_page(PATIENT_LIST_FIELDS, Patient.patient_id)
         
-        if not patients:
+        if not result and not request.args.get('after'):
             return jsonify({"message": "No patients found", "patients": []}), 200
             
-        result = []
-        for patient in patients:
-            result.append({
-                "patient_id": patient.patient_id,
-                "user_id": patient.user_id,
-                "full_name": patient.full_name,
-                "email": patient.email,
-                "dob": patient.dob.isoformat() if patient.dob else None,
-                "gender": patient.gender,
-                "height": patient.height,
-                "weight": patient.weight,
-                "phone": patient.phone
-            })
-        print(f"Returning {len(result)} patients")  # Debug log
-        return jsonify({"patients": result})
+        return paged_response({"patients": result, "next_cursor": next_cursor}, next_cursor)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in get_all_patients: {str(e)}")  # Debug log
+        log.exception("Error in get_all_patients")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 # Get all clinicians
-@app.route('/api/clinicians', methods=['GET'])
+@api.route('/api/clinicians', methods=['GET'])
 def get_all_clinicians():
-    clinicians = Clinician.query.all()
-    result = []
-    for clinician in clinicians:
-        result.append({
-            "clinician_id": clinician.clinician_id,
-            "user_id": clinician.user_id,
-            "full_name": clinician.full_name,
-            "email": clinician.email,
-            "specialization": clinician.specialization,
-            "years_of_experience": clinician.years_of_experience,
-            "affiliated_hospitals": clinician.affiliated_hospitals
-            # Add other fields as needed
-        })
-    return jsonify(result)
+    try:
+        result, next_cursor = keyset_page(CLINICIAN_LIST_FIELDS, Clinician.clinician_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
 
 # Get all users
-@app.route('/api/users', methods=['GET'])
+@api.route('/api/users', methods=['GET'])
 def get_all_users():
-    users = User.query.all()
-    result = []
-    for user in users:
-        result.append({
-            "user_id": user.user_id,
-            "is_patient": user.is_patient,
-            "is_clinician": user.is_clinician
-            # Exclude password_hash for security reasons
-        })
-    return jsonify(result)
-
-# Get all queries
-@app.route('/api/queries', methods=['GET'])
-def get_all_queries():
-    queries = Query.query.all()
-    result = []
-    for query in queries:
-        result.append({
-            "query_id": query.query_id,
-            "chat_id": query.chat_id,
-            "patient_id": query.patient_id,
-            "clinician_id": query.clinician_id,
-            "query_text": query.query_text,
-            "response": query.response,
-            "query_status": query.query_status,
-            "created_at": query.created_at.isoformat() if query.created_at else None
-        })
-    return jsonify(result)
+    # password_hash is never selectable, for security reasons
+    try:
+        result, next_cursor = keyset_page(USER_LIST_FIELDS, User.user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
+
+# List queries. Takes the export filters (status, patient_id, clinician_id,
+# created_after, created_before). The patient dashboard asks for its history with
+# ?patientId=X and gets the PATIENT_QUERY_FIELDS projection.
+@api.route('/api/queries', methods=['GET'])
+def list_queries():
+    args = request.args.to_dict()
+    fields = QUERY_LIST_FIELDS
+    if args.get('patientId'):
+        args.setdefault('patient_id', args['patientId'])
+        fields = PATIENT_QUERY_FIELDS
+    try:
+        filters = parse_export_filters(args)
+        result, next_cursor = keyset_page(fields, Query.query_id, *query_filter_criteria(filters))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
+
+# Full-text search over query text and responses, backed by the queries_fts FTS5
+# table (migration 3). Matches in the question weigh twice as much as matches in
+# the answer. Results come best match first (order=rank) or newest first
+# (order=recent), paged with an opaque cursor; filters are the export ones.
+queries_fts = sa_table('queries_fts', sa_column('rowid'))
+FTS_TABLE = literal_column('queries_fts')
+SEARCH_SNIPPET_TOKENS = 16
+
+def fts_match_expression(text):
+    # Plain terms are ANDed, "quoted phrases" match exactly and a trailing * matches a prefix.
+    # Everything is quoted so user input can never be parsed as FTS5 syntax.
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        if phrase:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+            continue
+        prefix = word.endswith('*')
+        for part in re.findall(r'\w+', word):
+            terms.append(f'"{part}"')
+        if prefix and terms and re.search(r'\w', word):
+            terms[-1] += '*'
+    return ' AND '.join(terms)
+
+def search_snippet(column_index):
+    return func.snippet(FTS_TABLE, column_index, '<mark>', '</mark>', '…', SEARCH_SNIPPET_TOKENS)
+
+@api.route('/api/queries/search', methods=['GET'])
+def search_queries():
+    if db.engine.dialect.name != 'sqlite':
+        return jsonify({"error": "Full-text search needs the SQLite FTS5 index"}), 501
+
+    match = fts_match_expression(request.args.get('q', ''))
+    if not match:
+        return jsonify({"error": "q must contain at least one search term"}), 400
+
+    order = request.args.get('order', 'rank')
+    if order not in ('rank', 'recent'):
+        return jsonify({"error": "order must be rank or recent"}), 400
+
+    try:
+        limit = page_limit()
+        filters = parse_export_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    score = func.bm25(FTS_TABLE, 2.0, 1.0)
+    stmt = (
+        db.select(
+            Query.query_id, Query.chat_id, Query.patient_id, Query.clinician_id,
+            Query.query_status, Query.created_at, score.label('score'),
+            search_snippet(0).label('query_snippet'), search_snippet(1).label('response_snippet')
+        )
+        .select_from(queries_fts)
+        .join(Query, Query.query_id == queries_fts.c.rowid)
+        .where(FTS_TABLE.op('MATCH')(match))
+    )
+    stmt = stmt.where(*query_filter_criteria(filters))
 
-# Get database summary (counts of all entities)
-@app.route('/api/db-summary', methods=['GET'])
+    # Cursor: "<query_id>" for order=recent, "<score>:<query_id>" for order=rank
+    after = request.args.get('after')
+    try:
+        if order == 'recent':
+            if after:
+                stmt = stmt.where(queries_fts.c.rowid < int(after))
+            stmt = stmt.order_by(queries_fts.c.rowid.desc())
+        else:
+            if after:
+                after_score, after_id = after.rsplit(':', 1)
+                after_score, after_id = float(after_score), int(after_id)
+                stmt = stmt.where(or_(score > after_score, and_(score == after_score, queries_fts.c.rowid > after_id)))
+            stmt = stmt.order_by(score, queries_fts.c.rowid)
+    except ValueError:
+        return jsonify({"error": "after must be a cursor returned by a previous page"}), 400
+
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = str(last.query_id) if order == 'recent' else f"{last.score!r}:{last.query_id}"
+
+    result = [{
+        "query_id": row.query_id,
+        "chat_id": row.chat_id,
+        "patient_id": row.patient_id,
+        "clinician_id": row.clinician_id,
+        "query_status": row.query_status,
+        "created_at": to_json_value(row.created_at),
+        "score": -row.score,
+        "query_snippet": row.query_snippet,
+        "response_snippet": row.response_snippet
+    } for row in rows[:limit]]
+    return paged_response(result, next_cursor)
+
+# Get database summary (counts of all entities), read from the maintained counters
+@api.route('/api/db-summary', methods=['GET'])
 def get_db_summary():
+    counts = dict(db.session.execute(db.select(DbCounter.name, DbCounter.value)).all())
     return jsonify({
-        "total_users": User.query.count(),
-        "total_patients": Patient.query.count(),
-        "total_clinicians": Clinician.query.count(),
-        "total_queries": Query.query.count(),
-        "pending_queries": Query.query.filter_by(query_status='Pending').count(),
-        "completed_queries": Query.query.filter_by(query_status='Completed').count()
+        "total_users": counts.get('total_users', 0),
+        "total_patients": counts.get('total_patients', 0),
+        "total_clinicians": counts.get('total_clinicians', 0),
+        "total_queries": counts.get('total_queries', 0),
+        "pending_queries": counts.get(status_counter('Pending'), 0),
+        # Reviewed queries end up Verified; the dashboard counts them as completed too
+        "completed_queries": sum(counts.get(status_counter(status), 0) for status in ('Completed', 'Verified'))
     })
 
+# CLI: flask --app app reconcile-counters
+@api.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recount the /api/db-summary counters from the base tables."""
+    click.echo(json.dumps(reconcile_counters(), indent=2))
+
 # Get queries by patient ID
-@app.route('/api/patients/<int:patient_id>/queries', methods=['GET'])
+@api.route('/api/patients/<int:patient_id>/queries', methods=['GET'])
 def get_queries_by_patient_id(patient_id):  # Renamed function
     # Verify patient exists
-    patient = Patient.query.get_or_404(patient_id)
+    Patient.query.get_or_404(patient_id)
     
-    # Get all queries for this patient
-    queries = Query.query.filter_by(patient_id=patient_id).all()
-    result = []
-    for query in queries:
-        result.append({
-            "query_id": query.query_id,
-            "chat_id": query.chat_id,
-            "query_text": query.query_text,
-            "response": query.response,
-            "query_status": query.query_status,
-            "created_at": query.created_at.isoformat() if query.created_at else None
-        })
-    return jsonify(result)
+    # Get this patient's queries, one page at a time
+    fields = {name: column for name, column in QUERY_LIST_FIELDS.items() if name not in ('patient_id', 'clinician_id')}
+    try:
+        result, next_cursor = keyset_page(fields, Query.query_id, Query.patient_id == patient_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
 
 # Get queries by clinician ID
-@app.route('/api/clinicians/<int:clinician_id>/queries', methods=['GET'])
+@api.route('/api/clinicians/<int:clinician_id>/queries', methods=['GET'])
 def get_queries_by_clinician_id(clinician_id):  # Use a unique name here too
     # Verify clinician exists
-    clinician = Clinician.query.get_or_404(clinician_id)
+    Clinician.query.get_or_404(clinician_id)
     
-    # Get all queries assigned to this clinician
-    queries = Query.query.filter_by(clinician_id=clinician_id).all()
-    result = []
-    for query in queries:
-        result.append({
-            "query_id": query.query_id,
-            "chat_id": query.chat_id,
-            "patient_id": query.patient_id,
-            "query_text": query.query_text,
-            "response": query.response,
-            "query_status": query.query_status,
-            "created_at": query.created_at.isoformat() if query.created_at else None
-        })
-    return jsonify(result)
+    # Get the queries assigned to this clinician, one page at a time
+    fields = {name: column for name, column in QUERY_LIST_FIELDS.items() if name != 'clinician_id'}
+    try:
+        result, next_cursor = keyset_page(fields, Query.query_id, Query.clinician_id == clinician_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return paged_response(result, next_cursor)
+
+# Bulk export: stream rows from a server-side cursor as NDJSON or CSV so that
+# memory stays flat however large the table is
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def parse_export_filters(args):
+    filters = {}
+    for name in ('patient_id', 'clinician_id'):
+        if args.get(name) not in (None, ''):
+            try:
+                filters[name] = int(args.get(name))
+            except ValueError:
+                raise ValueError(f"{name} must be an integer")
+    if args.get('status'):
+        filters['status'] = args.get('status')
+    for name in ('created_after', 'created_before'):
+        if args.get(name):
+            try:
+                filters[name] = datetime.fromisoformat(args.get(name))
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    return filters
+
+def query_filter_criteria(filters):
+    criteria = []
+    if 'status' in filters:
+        criteria.append(Query.query_status == filters['status'])
+    if 'patient_id' in filters:
+        criteria.append(Query.patient_id == filters['patient_id'])
+    if 'clinician_id' in filters:
+        criteria.append(Query.clinician_id == filters['clinician_id'])
+    if 'created_after' in filters:
+        criteria.append(Query.created_at >= filters['created_after'])
+    if 'created_before' in filters:
+        criteria.append(Query.created_at < filters['created_before'])
+    return criteria
+
+def export_statement(table, filters):
+    if table == 'patients':
+        return db.select(*Patient.__table__.columns).order_by(Patient.patient_id)
+    if table != 'queries':
+        raise ValueError(f"Unknown export table: {table}")
+
+    stmt = db.select(*Query.__table__.columns).order_by(Query.query_id)
+    stmt = stmt.where(*query_filter_criteria(filters))
+    return stmt
+
+def export_rows(table, fmt, filters):
+    """Yield the export as text chunks of roughly one fetch batch each."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("format must be ndjson or csv")
+    stmt = export_statement(table, filters)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    for partition in result.partitions():
+        for row in partition:
+            if fmt == 'csv':
+                writer.writerow([to_json_value(value) for value in row])
+            else:
+                buffer.write(json.dumps({name: to_json_value(value) for name, value in zip(columns, row)}))
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@api.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        filters = parse_export_filters(request.args)
+        chunks = export_rows(table, fmt, filters)
+        # Run the query now so that bad parameters still get a 400 instead of a broken stream
+        first = next(chunks, '')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        yield first
+        yield from chunks
+
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+    return response
+
+# CLI: flask --app app export queries --format csv --status Pending -o queries.csv
+@api.cli.command('export')
+@click.argument('table', type=click.Choice(['queries', 'patients']))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson')
+@click.option('--status', help='Only queries with this query_status')
+@click.option('--patient-id', type=int)
+@click.option('--clinician-id', type=int)
+@click.option('--created-after', help='ISO date or datetime, inclusive')
+@click.option('--created-before', help='ISO date or datetime, exclusive')
+@click.option('-o', '--output', type=click.File('w'), default='-', help='Output file (default stdout)')
+def export_command(table, fmt, status, patient_id, clinician_id, created_after, created_before, output):
+    """Stream a table export as NDJSON or CSV."""
+    filters = parse_export_filters({
+        'status': status,
+        'patient_id': patient_id,
+        'clinician_id': clinician_id,
+        'created_after': created_after,
+        'created_before': created_before
+    })
+    for chunk in export_rows(table, fmt, filters):
+        output.write(chunk)
+
+# Bulk import: patients or clinicians streamed as NDJSON (one JSON object per line)
+# or CSV with a header row. Field names match POST /api/patients and /api/clinicians.
+# Rows are validated against the model's columns and inserted in batched transactions
+# with executemany-style inserts; the response lists every rejected row.
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+
+def coerce_import_value(column, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        if column.default is not None:
+            # Callable defaults (e.g. datetime.utcnow) take the execution context as their argument
+            return column.default.arg(None) if column.default.is_callable else column.default.arg
+        if not column.nullable:
+            raise ValueError(f"{column.name} is required")
+        return None
+
+    python_type = column.type.python_type
+    if python_type is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in TRUE_VALUES:
+            return True
+        if str(value).lower() in FALSE_VALUES:
+            return False
+        raise ValueError(f"{column.name} must be true or false")
+    if python_type is int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column.name} must be an integer")
+    if python_type is date:
+        try:
+            return datetime.strptime(str(value), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f"{column.name} must be a YYYY-MM-DD date")
+    value = str(value)
+    length = getattr(column.type, 'length', None)
+    if length and len(value) > length:
+        raise ValueError(f"{column.name} is longer than {length} characters")
+    return value
+
+class BulkImporter:
+    """Validates streamed rows for one profile model and inserts them in batches."""
+
+    def __init__(self, model):
+        self.model = model
+        self.is_patient = model is Patient
+        # updated_at is left to the column default, so imported rows count as modified now
+        self.columns = [column for column in model.__table__.columns
+                        if not column.primary_key and column.name not in ('user_id', 'password_hash', 'updated_at')]
+        self.unique_columns = [column for column in model.__table__.columns
+                               if column.unique and column.name != 'user_id']
+        self.seen = {column.name: set() for column in self.unique_columns}
+        self.batch = []
+        self.imported = 0
+        self.errors = []
+
+    def add(self, row_number, row):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("row must be a JSON object")
+            # Either a plaintext password, or a hash already in werkzeug format (e.g. from another system)
+            if row.get('password'):
+                credentials = {"password": str(row['password'])}
+            elif is_password_hash(row.get('password_hash')):
+                credentials = {"password_hash": row['password_hash']}
+            else:
+                raise ValueError("password is required")
+            values = {column.name: coerce_import_value(column, row.get(column.name)) for column in self.columns}
+            # Duplicates inside the upload itself
+            for column in self.unique_columns:
+                value = values.get(column.name)
+                if value is not None and value in self.seen[column.name]:
+                    raise ValueError(f"duplicate {column.name} {value!r} in upload")
+            for column in self.unique_columns:
+                if values.get(column.name) is not None:
+                    self.seen[column.name].add(values[column.name])
+        except ValueError as e:
+            self.errors.append({"row": row_number, "error": str(e)})
+            return
+        self.batch.append((row_number, values, credentials))
+        if len(self.batch) >= current_app.config['IMPORT_BATCH_SIZE']:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        # Duplicates against rows already in the database, one IN query per unique column
+        for column in self.unique_columns:
+            values = [values[column.name] for _, values, _ in batch if values.get(column.name) is not None]
+            if not values:
+                continue
+            existing = set(db.session.execute(db.select(column).where(column.in_(values))).scalars())
+            if existing:
+                kept = []
+                for row_number, values, credentials in batch:
+                    if values.get(column.name) in existing:
+                        self.errors.append({"row": row_number, "error": f"{column.name} {values[column.name]!r} already exists"})
+                    else:
+                        kept.append((row_number, values, credentials))
+                batch = kept
+        if not batch:
+            return
+
+        # Hash the plaintext passwords in parallel on the KDF pool; this dominates import time
+        hashes = iter(hash_passwords([credentials["password"] for _, _, credentials in batch if "password" in credentials]))
+        batch = [(row_number, values, credentials.get("password_hash") or next(hashes))
+                 for row_number, values, credentials in batch]
+
+        try:
+            self.insert(batch)
+            db.session.commit()
+            self.imported += len(batch)
+        except IntegrityError:
+            # Lost a race with another writer: retry row by row to find the culprits
+            db.session.rollback()
+            for item in batch:
+                try:
+                    with db.session.begin_nested():
+                        self.insert([item])
+                    self.imported += 1
+                except IntegrityError as e:
+                    self.errors.append({"row": item[0], "error": str(e.orig)})
+            db.session.commit()
+
+    def insert(self, batch):
+        users = User.__table__
+        user_ids = db.session.execute(
+            users.insert().returning(users.c.user_id, sort_by_parameter_order=True),
+            [{"is_patient": self.is_patient, "is_clinician": not self.is_patient, "password_hash": password_hash}
+             for _, _, password_hash in batch]
+        ).scalars().all()
+        rows = [dict(values, user_id=user_id) for (_, values, _), user_id in zip(batch, user_ids)]
+        if 'password_hash' in self.model.__table__.columns:
+            for row, (_, _, password_hash) in zip(rows, batch):
+                row['password_hash'] = password_hash
+        db.session.execute(self.model.__table__.insert(), rows)
+        # Core inserts skip the ORM flush hook, so count the rows here
+        bump_counters(db.session.connection(), {'total_users': len(rows), COUNTED_MODELS[self.model]: len(rows)})
+
+    def report(self):
+        return {
+            "success": not self.errors,
+            "imported": self.imported,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda error: error["row"])
+        }
+
+def iter_import_rows():
+    """Yield (row_number, row) pairs from the request body without buffering it."""
+    text = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    if request.mimetype == 'text/csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+def run_bulk_import(model):
+    importer = BulkImporter(model)
+    try:
+        for row_number, row in iter_import_rows():
+            if row is None:
+                importer.errors.append({"row": row_number, "error": "invalid JSON"})
+                continue
+            importer.add(row_number, row)
+        importer.flush()
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Error in bulk import")
+        report = importer.report()
+        report.update({"success": False, "message": f"Import stopped: {e}"})
+        return jsonify(report), 500
+    return jsonify(importer.report()), 200 if not importer.errors else 207
+
+@api.route('/api/patients/import', methods=['POST'])
+def import_patients():
+    return run_bulk_import(Patient)
+
+@api.route('/api/clinicians/import', methods=['POST'])
+def import_clinicians():
+    return run_bulk_import(Clinician)
+
+# Process-wide services built from the app's settings. They stay module globals so the
+# route functions can use them directly; create_app builds them.
+def init_services(config):
+    global llm_client, response_cache, llm_jobs, password_pool, session_serializer, session_cache
+    global patient_context_cache, verified_answers, transcriber, sql_profiler, write_behind, row_ids
+    global idempotency_keys, profile_cache, revoked_tokens, review_events, chat_summary_cache
+
+    llm_client = LLMClient(
+        create_llm_backend(
+            config['LLM_BACKEND'],
+            model_name=config['LLM_MODEL'],
+            api_key=config['GEMINI_API_KEY'],
+            fake_latency=config['LLM_FAKE_LATENCY'],
+            fake_error_rate=config['LLM_FAKE_ERROR_RATE'],
+            fake_jitter=config['LLM_FAKE_JITTER']
+        ),
+        max_concurrency=config['LLM_MAX_CONCURRENCY'],
+        rate_per_minute=config['LLM_RATE_PER_MINUTE'],
+        timeout=config['LLM_TIMEOUT'],
+        hedge_after=config['LLM_HEDGE_AFTER'],
+        stream_timeout=config['LLM_STREAM_TIMEOUT'],
+        breaker=CircuitBreaker(config['LLM_BREAKER_THRESHOLD'], config['LLM_BREAKER_RESET'])
+    )
+    response_cache = create_response_cache(
+        config['LLM_CACHE_BACKEND'],
+        path=config['LLM_CACHE_PATH'],
+        max_entries=config['LLM_CACHE_MAX_ENTRIES'],
+        max_bytes=config['LLM_CACHE_MAX_BYTES'],
+        ttl=config['LLM_CACHE_TTL']
+    )
+    llm_jobs = BoundedExecutor(config['LLM_WORKERS'], config['LLM_QUEUE_DEPTH'], name='llm-job')
+    password_pool = ThreadPoolExecutor(max_workers=config['PASSWORD_HASH_WORKERS'], thread_name_prefix='kdf')
+    session_serializer = URLSafeTimedSerializer(config['SECRET_KEY'], salt='caresync-session')
+    session_cache = TTLCache(max_entries=100000, ttl=config['SESSION_TOKEN_TTL'])
+    revoked_tokens = RevocationList(
+        RevokedToken.__table__,
+        lambda: db.engine,
+        refresh_interval=config['SESSION_REVOCATION_REFRESH']
+    )
+    patient_context_cache = TTLCache(max_entries=10000, ttl=config['PATIENT_CONTEXT_TTL'])
+    chat_summary_cache = TTLCache(max_entries=10000, ttl=3600)
+    # Entries are revalidated after PROFILE_CACHE_TTL; the TTL here only bounds idle ones
+    profile_cache = TTLCache(max_entries=10000, ttl=3600)
+    verified_answers = VerifiedAnswerIndex(
+        threshold=config['VERIFIED_MATCH_THRESHOLD'],
+        dim=config['VERIFIED_INDEX_DIM'],
+        refresh_interval=config['VERIFIED_INDEX_REFRESH']
+    )
+    transcriber = BatchingTranscriber(
+        create_transcriber(
+            config['TRANSCRIBE_BACKEND'],
+            model=config['TRANSCRIBE_MODEL'],
+            device=config['TRANSCRIBE_DEVICE'],
+            language=config['TRANSCRIBE_LANGUAGE'],
+            threads=config['TRANSCRIBE_THREADS'],
+            download_root=config['TRANSCRIBE_MODEL_DIR'],
+            fake_rtf=config['TRANSCRIBE_FAKE_RTF']
+        ),
+        max_batch=config['TRANSCRIBE_BATCH_SIZE'],
+        max_wait=config['TRANSCRIBE_BATCH_WAIT_MS'] / 1000,
+        max_queue=config['TRANSCRIBE_QUEUE_DEPTH']
+    )
+    write_behind = WriteBehind(
+        apply_writes,
+        log,
+        max_batch=config['WRITE_BEHIND_BATCH_SIZE'],
+        max_delay=config['WRITE_BEHIND_MAX_DELAY_MS'] / 1000,
+        max_pending=config['WRITE_BEHIND_MAX_PENDING']
+    )
+    review_events = EventBroker(
+        ReviewEvent.__table__,
+        lambda: db.engine,
+        log,
+        poll_interval=config['REVIEW_EVENTS_POLL'],
+        retention=config['REVIEW_EVENTS_RETENTION'],
+        max_subscribers=config['REVIEW_EVENTS_MAX_STREAMS']
+    )
+    row_ids = IdAllocator(reserve_ids, block_size=config['ID_BLOCK_SIZE'], ttl=config['ID_BLOCK_TTL'])
+    idempotency_keys = IdempotencyStore(
+        IdempotencyKey.__table__,
+        lambda: db.engine,
+        ttl=config['IDEMPOTENCY_TTL'],
+        lease=config['IDEMPOTENCY_LEASE']
+    )
+    # The cursor listeners are attached to the Engine class, so only once per process
+    if config['SQL_PROFILER'] and sql_profiler is None:
+        sql_profiler = SQLProfiler(
+            log,
+            slow_ms=config['SQL_SLOW_MS'],
+            repeat_threshold=config['SQL_REPEAT_THRESHOLD'],
+            explain=config['SQL_EXPLAIN']
+        )
+        sql_profiler.attach(Engine)
+
+# Preload mode: do the expensive one-time work in the parent process, so that workers
+# forked from it (e.g. gunicorn --preload) share the result copy-on-write instead of
+# each repeating it
+def preload_app(app):
+    started = time.perf_counter()
+    if app.config['LLM_BACKEND'] == 'gemini':
+        importlib.import_module('google.generativeai')
+    if app.config['TRANSCRIBE_PRELOAD']:
+        # Weights only: running the model here would start torch's thread pools, which don't survive a fork
+        try:
+            transcriber.backend.load()
+        except Exception as e:
+            log.warning("Transcription model not loaded: %s", e)
+
+    # Migrations, counters and the verified answer index
+    if not init_db(app):
+        raise RuntimeError("Database initialization failed")
+    with app.app_context():
+        # Each worker must open its own database connections
+        db.engine.dispose()
+
+    # Move everything loaded so far out of the collector's reach; otherwise every
+    # collection in a worker writes to those objects and un-shares their pages
+    gc.collect()
+    gc.freeze()
+    log.info("Preloaded in %.2fs", time.perf_counter() - started)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    CORS(app)  # Enable CORS for all routes
+
+    configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
+    init_services(app.config)
+    app.register_blueprint(api)
+    if app.config['SQL_PROFILER']:
+        app.before_request(begin_profiled_request)
+        app.teardown_request(end_profiled_request)
+
+    if app.config['PRELOAD']:
+        preload_app(app)
+    return app
 
-# Run the Flask App
 # Run the Flask App
 if __name__ == '__main__':
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+    app = create_app()
+
     # Initialize database
-    if not init_db():
-        print("Error: Could not initialize database. Exiting...")
+    if not init_db(app):
+        log.error("Could not initialize database. Exiting...")
         sys.exit(1)
         
-    # Initialize Gemini API
-    gemini_initialized = initialize_gemini()
+    # Check the Gemini API configuration
+    gemini_initialized = initialize_gemini(app.config)
     if gemini_initialized:
-        print("Gemini API initialized successfully")
+        log.info("Gemini API configured")
     else:
-        print("Warning: Gemini API not initialized. AI responses will be unavailable.")
+        log.warning("Gemini API not initialized. AI responses will be unavailable.")
+    
+    # Periodically correct any drift in the summary counters
+    start_counter_reconciler(app)
+
+    if app.config['TRANSCRIBE_PRELOAD']:
+        preload_transcriber()
     
     # Start Flask app
-    print("Starting Flask application...")
-    app.run(debug=True)
\ No newline at end of file
+    log.info("Starting Flask application...")
+    app.run(debug=True)
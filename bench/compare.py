@@ -0,0 +1,94 @@
+"""Compare two bench/loadtest.py result files and flag regressions.
+
+    python bench/compare.py results/base.json results/candidate.json --threshold 10
+
+For every operation present in both runs this prints p50/p95/p99 latency and
+throughput side by side with the relative change. An operation regresses when
+its p95 or p99 latency grows, or its throughput drops, by more than
+--threshold percent, or when its error rate rises; the exit status is 1 if
+any operation regressed, so the script can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+LATENCY_FIELDS = ('p50_ms', 'p95_ms', 'p99_ms')
+GATED_LATENCY_FIELDS = ('p95_ms', 'p99_ms')
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def error_rate(stats):
+    return stats['errors'] / stats['requests'] if stats['requests'] else 0.0
+
+
+def compare(base, candidate, threshold):
+    rows, regressions = [], []
+    names = [name for name in base['operations'] if name in candidate['operations']] + ['overall']
+    for name in names:
+        before = base['overall'] if name == 'overall' else base['operations'][name]
+        after = candidate['overall'] if name == 'overall' else candidate['operations'][name]
+        problems = []
+        for field in GATED_LATENCY_FIELDS:
+            delta = change(before[field], after[field])
+            if delta is not None and delta > threshold:
+                problems.append(f"{field} +{delta:.1f}%")
+        delta = change(before['throughput_rps'], after['throughput_rps'])
+        if delta is not None and delta < -threshold:
+            problems.append(f"throughput {delta:.1f}%")
+        if error_rate(after) > error_rate(before) + 0.001:
+            problems.append(f"error rate {error_rate(before):.2%} -> {error_rate(after):.2%}")
+        rows.append((name, before, after, problems))
+        if problems:
+            regressions.append((name, problems))
+    return rows, regressions
+
+
+def format_cell(before, after):
+    delta = change(before, after)
+    suffix = f" ({delta:+.1f}%)" if delta is not None else ''
+    return f"{before} -> {after}{suffix}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('base')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    for label, report in (('base', base), ('candidate', candidate)):
+        meta = report['meta']
+        print(f"{label:<10} {meta['workload']} c={meta['concurrency']} {meta['duration_s']}s "
+              f"commit={meta.get('git_commit')} {meta.get('label') or ''}".rstrip())
+    if (base['meta']['workload'], base['meta']['concurrency']) != (candidate['meta']['workload'],
+                                                                     candidate['meta']['concurrency']):
+        print("warning: the runs used different workloads or concurrency")
+    print()
+
+    rows, regressions = compare(base, candidate, args.threshold)
+    for name, before, after, problems in rows:
+        print(f"{name}{'  REGRESSION: ' + ', '.join(problems) if problems else ''}")
+        for field in LATENCY_FIELDS:
+            print(f"  {field:<15}{format_cell(before[field], after[field])}")
+        print(f"  {'throughput_rps':<15}{format_cell(before['throughput_rps'], after['throughput_rps'])}")
+        print(f"  {'errors':<15}{before['errors']} -> {after['errors']}")
+
+    if regressions:
+        print(f"\n{len(regressions)} operation(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold}%")
+
+
+if __name__ == '__main__':
+    main()
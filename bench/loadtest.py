@@ -0,0 +1,286 @@
+"""Closed-loop HTTP load generator for a running CareSync server.
+
+    LLM_BACKEND=fake LLM_FAKE_LATENCY=0.8 LLM_FAKE_JITTER=0.4 DATABASE_URL=sqlite:///bench.db python app.py
+    python bench/loadtest.py --workload mixed --concurrency 16 --duration 60 --output results/base.json
+
+Each worker thread keeps one HTTP/1.1 connection open and sends its next
+request as soon as the previous one returns. Per-operation latency
+percentiles and throughput are printed, and with --output written as JSON
+for bench/compare.py. Accounts and emails are the ones bench/seed.py creates.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+
+QUESTIONS = [
+    'What should I do if I miss a dose of Metformin?',
+    'Can I take Lisinopril with food?',
+    'What are the side effects of Atorvastatin?',
+    'Is it safe to exercise with asthma?',
+    'How often should I check my blood pressure?',
+    'What diet is recommended for diabetes?',
+]
+
+
+class Context:
+    """Shared, read-only inputs for the workloads."""
+
+    def __init__(self, args, patient_ids, clinician_ids):
+        self.args = args
+        self.patient_ids = patient_ids or [1]
+        self.clinician_ids = clinician_ids or [1]
+
+
+def op_login(ctx, rng):
+    if rng.random() < 0.8:
+        email = f"patient{rng.randint(1, ctx.args.patients)}@bench.local"
+    else:
+        email = f"clinician{rng.randint(1, ctx.args.clinicians)}@bench.local"
+    return 'login', 'POST', '/api/login', {"email": email, "password": ctx.args.password}
+
+
+def op_ai_query(ctx, rng):
+    question = rng.choice(QUESTIONS)
+    if rng.random() < ctx.args.unique_ratio:
+        # A question nobody asked before, so neither the answer cache nor reuse can serve it
+        question += f" (case {rng.getrandbits(48):x})"
+    return 'ai_query', 'POST', '/api/ai_query', {"query_text": question, "patient_id": rng.choice(ctx.patient_ids)}
+
+
+def op_list_patients(ctx, rng):
+    return 'list_patients', 'GET', '/api/patients?limit=50', None
+
+
+def op_list_clinicians(ctx, rng):
+    return 'list_clinicians', 'GET', '/api/clinicians?limit=50', None
+
+
+def op_patient_queries(ctx, rng):
+    return 'patient_queries', 'GET', f"/api/queries?patientId={rng.choice(ctx.patient_ids)}&limit=20&order=desc", None
+
+
+def op_clinician_queries(ctx, rng):
+    return 'clinician_queries', 'GET', f"/api/clinicians/{rng.choice(ctx.clinician_ids)}/queries?limit=20", None
+
+
+def op_db_summary(ctx, rng):
+    return 'db_summary', 'GET', '/api/db-summary', None
+
+
+# Workload name -> [(operation, weight)]
+WORKLOADS = {
+    'login': [(op_login, 1)],
+    'ai_query': [(op_ai_query, 1)],
+    'lists': [(op_list_patients, 1), (op_list_clinicians, 1), (op_patient_queries, 3), (op_clinician_queries, 2)],
+    'db_summary': [(op_db_summary, 1)],
+    'mixed': [(op_login, 1), (op_ai_query, 2), (op_patient_queries, 4), (op_clinician_queries, 2),
+              (op_list_patients, 1), (op_db_summary, 2)],
+}
+
+
+class Connection:
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        while True:
+            reused = self.conn is not None
+            if not reused:
+                factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                self.conn = factory(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                # Retry only when the server had closed an idle keep-alive connection
+                if not reused:
+                    raise
+
+
+def fetch_ids(url, path, field, timeout):
+    try:
+        status, body = Connection(url, timeout).request('GET', path, None)
+        return [row[field] for row in json.loads(body)] if status == 200 else []
+    except (OSError, http.client.HTTPException, ValueError, KeyError, TypeError):
+        return []
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies) + errors
+    return {
+        "requests": count,
+        "errors": errors + sum(n for status, n in statuses.items() if int(status) >= 500),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+
+
+def run(args):
+    ctx = Context(
+        args,
+        fetch_ids(args.url, '/api/patients?limit=1000&fields=patient_id&order=desc', 'patient_id', args.timeout),
+        fetch_ids(args.url, '/api/clinicians?limit=1000&fields=clinician_id&order=desc', 'clinician_id', args.timeout),
+    )
+    operations, weights = zip(*WORKLOADS[args.workload])
+    lock = threading.Lock()
+    results = {}  # operation -> [latencies, statuses, errors]
+    started = time.monotonic()
+    measure_from = started + args.warmup
+    stop_at = measure_from + args.duration
+    sent = [0]
+
+    def worker(number):
+        rng = random.Random(args.seed * 1000 + number)
+        conn = Connection(args.url, args.timeout)
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            if args.requests:
+                with lock:
+                    if sent[0] >= args.requests:
+                        return
+                    sent[0] += 1
+            name, method, path, body = rng.choices(operations, weights)[0](ctx, rng)
+            begin = time.perf_counter()
+            try:
+                status, _ = conn.request(method, path, body)
+            except Exception:
+                status = None
+            latency = time.perf_counter() - begin
+            if time.monotonic() < measure_from:
+                continue
+            with lock:
+                entry = results.setdefault(name, [[], {}, 0])
+                if status is None:
+                    entry[2] += 1
+                else:
+                    entry[0].append(latency)
+                    entry[1][str(status)] = entry[1].get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = max(0.001, min(time.monotonic(), stop_at) - measure_from)
+
+    all_latencies, all_statuses, all_errors = [], {}, 0
+    operations_report = {}
+    for name, (latencies, statuses, errors) in sorted(results.items()):
+        operations_report[name] = summarize(latencies, statuses, errors, elapsed)
+        all_latencies += latencies
+        all_errors += errors
+        for status, n in statuses.items():
+            all_statuses[status] = all_statuses.get(status, 0) + n
+
+    return {
+        "meta": {
+            "workload": args.workload,
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 2),
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "label": args.label
+        },
+        "overall": summarize(all_latencies, all_statuses, all_errors, elapsed),
+        "operations": operations_report
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"workload={meta['workload']} concurrency={meta['concurrency']} duration={meta['duration_s']}s "
+          f"commit={meta['git_commit']}")
+    header = f"{'operation':<20}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = list(report["operations"].items()) + [('overall', report["overall"])]
+    for name, stats in rows:
+        print(f"{name:<20}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{str(stats['p50_ms']):>10}{str(stats['p95_ms']):>10}{str(stats['p99_ms']):>10}{str(stats['max_ms']):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds (after the warm-up)')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests instead')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--patients', type=int, default=1000, help='seeded patient accounts (bench/seed.py)')
+    parser.add_argument('--clinicians', type=int, default=50, help='seeded clinician accounts (bench/seed.py)')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--unique-ratio', type=float, default=0.5,
+                        help='share of AI questions made unique so they miss every cache')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', help='free-form note stored with the results')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+    if args.requests:
+        args.warmup = 0
+        args.duration = float('inf')
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if report["overall"]["requests"] == 0:
+        sys.exit("No requests completed; is the server running at " + args.url + "?")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Seed a database with synthetic users, patients, clinicians, chats and queries.
+
+    DATABASE_URL=sqlite:///bench.db python bench/seed.py --patients 10000 --clinicians 200 --queries 200000
+
+Rows are generated from a fixed random seed, so two runs with the same
+arguments produce the same data. Every seeded account has the password given
+by --password (hashed once and shared), and uses emails of the form
+patient<N>@bench.local / clinician<N>@bench.local for N = 1..count, which is
+what bench/loadtest.py logs in with. Without DATABASE_URL this writes to the
+app's own caresync.db.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db, init_db, reconcile_counters, hash_password, User, Patient, Clinician, Chatbot, Query  # noqa: E402
+
+CONDITIONS = ['diabetes', 'hypertension', 'heart_disease', 'asthma', 'stroke']
+MEDICATIONS = ['Metformin', 'Lisinopril', 'Atorvastatin', 'Amlodipine', 'Salbutamol', 'Levothyroxine', 'Omeprazole']
+TOPICS = [
+    'What should I do if I miss a dose of {med}?',
+    'Can I take {med} with food?',
+    'What are the side effects of {med}?',
+    'Is it safe to exercise with {cond}?',
+    'How often should I check my blood pressure?',
+    'My {cond} symptoms got worse after running, what should I do?',
+    'Can I drink alcohol while taking {med}?',
+    'What diet is recommended for {cond}?',
+]
+SPECIALIZATIONS = ['General Physician', 'Cardiologist', 'Endocrinologist', 'Pulmonologist', 'Neurologist']
+STATUSES = ['Pending'] * 6 + ['Verified'] * 3 + ['Completed']
+
+
+def next_id(column):
+    return (db.session.execute(db.select(db.func.max(column))).scalar() or 0) + 1
+
+
+def insert_batches(table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+    db.session.commit()
+
+
+def seed(patients, clinicians, queries, password, batch_size, rng):
+    password_hash = hash_password(password)
+    user_id = next_id(User.user_id)
+    patient_id = next_id(Patient.patient_id)
+    clinician_id = next_id(Clinician.clinician_id)
+    chat_id = next_id(Chatbot.chat_id)
+    query_id = next_id(Query.query_id)
+    email_offset = db.session.execute(
+        db.select(db.func.count()).select_from(Patient).where(Patient.email.like('patient%@bench.local'))
+    ).scalar()
+
+    users, patient_rows, clinician_rows = [], [], []
+    for n in range(patients):
+        number = email_offset + n + 1
+        users.append({"user_id": user_id, "is_patient": True, "is_clinician": False, "password_hash": password_hash})
+        patient_rows.append({
+            "patient_id": patient_id + n, "user_id": user_id, "full_name": f"Bench Patient {number}",
+            "dob": date(1940, 1, 1) + timedelta(days=rng.randrange(365 * 65)),
+            "gender": rng.choice(['Male', 'Female']), "height": rng.randrange(150, 195), "weight": rng.randrange(45, 120),
+            "phone": f"9{number:09d}", "email": f"patient{number}@bench.local", "aadhar_number": f"P{number:011d}",
+            "current_medications": ', '.join(rng.sample(MEDICATIONS, rng.randrange(0, 3))),
+            **{condition: rng.random() < 0.2 for condition in CONDITIONS}
+        })
+        user_id += 1
+    clinician_offset = db.session.execute(
+        db.select(db.func.count()).select_from(Clinician).where(Clinician.email.like('clinician%@bench.local'))
+    ).scalar()
+    for n in range(clinicians):
+        number = clinician_offset + n + 1
+        users.append({"user_id": user_id, "is_patient": False, "is_clinician": True, "password_hash": password_hash})
+        clinician_rows.append({
+            "clinician_id": clinician_id + n, "user_id": user_id, "full_name": f"Bench Clinician {number}",
+            "email": f"clinician{number}@bench.local", "phone": f"8{number:09d}", "password_hash": password_hash,
+            "medical_reg_number": f"REG{number:08d}", "specialization": rng.choice(SPECIALIZATIONS),
+            "years_of_experience": rng.randrange(1, 40), "aadhar_number": f"C{number:011d}"
+        })
+        user_id += 1
+
+    insert_batches(User.__table__, users, batch_size)
+    insert_batches(Patient.__table__, patient_rows, batch_size)
+    insert_batches(Clinician.__table__, clinician_rows, batch_size)
+
+    # About five turns per chat, spread over the last year
+    now = datetime.utcnow()
+    chats, query_rows = [], []
+    turns_left = 0
+    current_chat = current_patient = None
+    for n in range(queries):
+        if turns_left == 0 and patients:
+            current_patient = patient_id + rng.randrange(patients)
+            current_chat = chat_id + len(chats)
+            chats.append({"chat_id": current_chat, "patient_id": current_patient,
+                          "created_at": now - timedelta(minutes=rng.randrange(525600))})
+            turns_left = rng.randrange(1, 10)
+        turns_left -= 1
+        status = rng.choice(STATUSES)
+        text = rng.choice(TOPICS).format(med=rng.choice(MEDICATIONS), cond=rng.choice(CONDITIONS).replace('_', ' '))
+        query_rows.append({
+            "query_id": query_id + n, "chat_id": current_chat, "patient_id": current_patient,
+            "clinician_id": clinician_id + rng.randrange(clinicians) if clinicians and status != 'Pending' else None,
+            "query_text": text, "response": f"Simulated answer to: {text}", "query_status": status,
+            "answer_source": 'generated', "created_at": now - timedelta(minutes=rng.randrange(525600))
+        })
+        if len(query_rows) >= batch_size * 10:
+            insert_batches(Chatbot.__table__, chats, batch_size)
+            insert_batches(Query.__table__, query_rows, batch_size)
+            chat_id += len(chats)
+            chats, query_rows = [], []
+    insert_batches(Chatbot.__table__, chats, batch_size)
+    insert_batches(Query.__table__, query_rows, batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--clinicians', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app()
+    if not init_db(app):
+        sys.exit("Could not initialize the database")
+    started = time.perf_counter()
+    with app.app_context():
+        seed(args.patients, args.clinicians, args.queries, args.password, args.batch_size, random.Random(args.seed))
+        # Bulk inserts bypass the ORM flush hooks, so recount the summary counters once
+        reconcile_counters()
+    print(f"Seeded {args.patients} patients, {args.clinicians} clinicians and {args.queries} queries "
+          f"into {app.config['SQLALCHEMY_DATABASE_URI']} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Measure the real-time factor of the transcription pipeline on this machine.
+
+    python bench/transcribe_rtf.py --audio samples/*.wav --batch-sizes 1 2 4 8 --threads 4
+
+Each audio file is decoded and chunked exactly as /api/voice_query does it,
+then the chunks are run through the backend directly in batches of each
+requested size. The real-time factor (RTF) is compute seconds per second of
+audio, so below 1.0 is faster than real time. Model load time and a warm-up
+batch are reported separately and excluded from the RTF. Without --audio a
+synthetic tone is used, which exercises the model but decodes few tokens, so
+real speech gives the more honest numbers.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcribe import create_transcriber, decode_audio, iter_chunks, SAMPLE_RATE  # noqa: E402
+
+
+def synthetic_chunks(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = (0.2 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)).astype(np.float32)
+    return list(iter_chunks(iter([audio])))
+
+
+def load_chunks(paths):
+    chunks = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            chunks.extend(iter_chunks(decode_audio(f)))
+    return chunks
+
+
+def measure(backend, chunks, batch_size, repeat):
+    audio_seconds = sum(len(chunk) for chunk in chunks) / SAMPLE_RATE * repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for start in range(0, len(chunks), batch_size):
+            backend.transcribe_batch(chunks[start:start + batch_size])
+    elapsed = time.perf_counter() - started
+    return {
+        "batch_size": batch_size,
+        "audio_seconds": round(audio_seconds, 2),
+        "compute_seconds": round(elapsed, 3),
+        "rtf": round(elapsed / audio_seconds, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--audio', nargs='*', default=[], help='audio files in any format ffmpeg reads')
+    parser.add_argument('--seconds', type=float, default=120, help='length of the synthetic audio without --audio')
+    parser.add_argument('--backend', default=os.getenv('TRANSCRIBE_BACKEND', 'whisper'))
+    parser.add_argument('--model', default=os.getenv('TRANSCRIBE_MODEL', 'base'), help='model name or checkpoint path')
+    parser.add_argument('--model-dir', default=os.getenv('TRANSCRIBE_MODEL_DIR'))
+    parser.add_argument('--device', default=os.getenv('TRANSCRIBE_DEVICE', 'cpu'))
+    parser.add_argument('--language', default=os.getenv('TRANSCRIBE_LANGUAGE', 'en'))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('TRANSCRIBE_THREADS', '0')))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=1, help='passes over the audio per batch size')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    backend = create_transcriber(args.backend, model=args.model, device=args.device, language=args.language,
+                                 threads=args.threads, download_root=args.model_dir)
+    started = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - started
+
+    chunks = load_chunks(args.audio) if args.audio else synthetic_chunks(args.seconds)
+    if not chunks:
+        sys.exit("No audio to transcribe")
+    started = time.perf_counter()
+    backend.transcribe_batch(chunks[:1])
+    warmup_seconds = time.perf_counter() - started
+
+    print(f"backend={args.backend} model={args.model} device={args.device} threads={args.threads or 'default'} "
+          f"chunks={len(chunks)} audio={sum(len(c) for c in chunks) / SAMPLE_RATE:.1f}s")
+    print(f"model load {load_seconds:.2f}s, first batch {warmup_seconds:.2f}s")
+    print(f"{'batch':>6}{'audio s':>10}{'compute s':>11}{'RTF':>8}{'x realtime':>12}")
+    results = []
+    for batch_size in args.batch_sizes:
+        result = measure(backend, chunks, batch_size, args.repeat)
+        results.append(result)
+        print(f"{batch_size:>6}{result['audio_seconds']:>10}{result['compute_seconds']:>11}{result['rtf']:>8}"
+              f"{1 / result['rtf'] if result['rtf'] else float('inf'):>12.1f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({
+                "meta": {"backend": args.backend, "model": args.model, "device": args.device,
+                         "threads": args.threads, "chunks": len(chunks), "audio_files": args.audio,
+                         "cpu_count": os.cpu_count(), "python": platform.python_version(), "host": platform.node()},
+                "load_seconds": round(load_seconds, 3),
+                "warmup_seconds": round(warmup_seconds, 3),
+                "results": results
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+
+
+class EventBroker:
+    """Fans events out to every connected subscriber (one queue per SSE stream).
+
+    Events are rows of `table` (event_id, event, data, created_at), inserted by
+    whichever worker process made the change, in the same transaction as the
+    change, so every process sees them and none announces a rolled-back write.
+    While this process has subscribers, one poller thread reads the new rows
+    every `poll_interval` seconds and hands them to each subscriber's queue;
+    with none it stops querying. Ids are assigned at insert but become visible
+    at commit, so a row can appear after one with a higher id; each poll also
+    rereads the rows created in the last `poll_slack` seconds and skips those
+    already published. `engine` returns the engine to use, inside the context
+    from start(). Rows older than `retention` seconds are purged.
+
+    Publishing never blocks: a subscriber whose queue is full has fallen too far
+    behind, so it is sent a final "resync" event and dropped. Each stream holds a
+    server thread, so at most `max_subscribers` are open per process (None for no
+    limit); subscribe() returns None beyond that.
+    """
+
+    def __init__(self, table, engine, log, max_pending=100, poll_interval=0.5, retention=3600,
+                 max_subscribers=None, purge_interval=60, poll_slack=10):
+        self.table = table
+        self.engine = engine
+        self.log = log
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_subscribers = max_subscribers
+        self.purge_interval = purge_interval
+        self.poll_slack = poll_slack
+        self._cond = threading.Condition()
+        self._subscribers = set()
+        self._context = None
+        self._poller = None
+        self._pid = None
+        self._next_purge = 0.0
+        self.counts = {"delivered": 0, "dropped_subscribers": 0, "rejected_subscribers": 0}
+
+    def start(self, context=None):
+        """Start this process's poller thread. `context` returns a context manager
+        that each poll runs in (e.g. app.app_context)."""
+        with self._cond:
+            if self._poller is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that had streams open: they are its to serve
+                self._subscribers = set()
+            self._context = context
+            self._pid = os.getpid()
+            self._poller = threading.Thread(target=self._run, name='review-events', daemon=True)
+            self._poller.start()
+
+    def subscribe(self):
+        with self._cond:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                self.counts["rejected_subscribers"] += 1
+                return None
+            subscriber = queue.Queue(self.max_pending)
+            self._subscribers.add(subscriber)
+            self._cond.notify_all()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def record(self, conn, event, data):
+        """Insert an event on `conn` (a connection or session), inside the caller's transaction."""
+        conn.execute(self.table.insert().values(event=event, data=data, created_at=datetime.utcnow()))
+
+    def publish(self, event_id, event, data):
+        message = (event_id, event, data)
+        with self._cond:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+                self.counts["delivered"] += 1
+            except queue.Full:
+                self.unsubscribe(subscriber)
+                self.counts["dropped_subscribers"] += 1
+                # Make room for the resync marker so the stream can end cleanly
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait((event_id, 'resync', {}))
+
+    def stream(self, subscriber, heartbeat=15.0):
+        """Yield Server-Sent Events for one subscriber, with comment heartbeats when idle."""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event_id, event, data = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == 'resync':
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    def subscriber_count(self):
+        with self._cond:
+            return len(self._subscribers)
+
+    def purge(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        with self.engine().begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.created_at < cutoff)).rowcount
+
+    def _window_start(self):
+        return datetime.utcnow() - timedelta(seconds=self.poll_slack)
+
+    def _latest(self):
+        """The newest id, and the rows inside the overlap window: treated as already published."""
+        since = self._window_start()
+        with self.engine().connect() as conn:
+            last_id = conn.execute(select(func.max(self.table.c.event_id))).scalar() or 0
+            seen = dict(conn.execute(
+                select(self.table.c.event_id, self.table.c.created_at).where(self.table.c.created_at >= since)
+            ).all())
+        return last_id, seen
+
+    def _poll(self, last_id, seen):
+        """Publish the rows not seen yet; `seen` maps the ids published within the window to created_at."""
+        now = time.monotonic()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self.purge()
+        since = self._window_start()
+        with self.engine().connect() as conn:
+            rows = conn.execute(
+                select(self.table.c.event_id, self.table.c.event, self.table.c.data, self.table.c.created_at)
+                .where(or_(self.table.c.event_id > last_id, self.table.c.created_at >= since))
+                .order_by(self.table.c.event_id)
+                .limit(self.max_pending + len(seen))
+            ).all()
+        for row in rows:
+            if row.event_id in seen:
+                continue
+            seen[row.event_id] = row.created_at
+            last_id = max(last_id, row.event_id)
+            self.publish(row.event_id, row.event, row.data)
+        for event_id, created_at in list(seen.items()):
+            if created_at < since:
+                del seen[event_id]
+        return last_id
+
+    def _run(self):
+        last_id = seen = None
+        while True:
+            with self._cond:
+                if not self._subscribers:
+                    # Idle: a new subscriber loads the queue itself, so start from the newest row again
+                    last_id = None
+                    self._cond.wait_for(lambda: self._subscribers)
+            try:
+                with self._context() if self._context is not None else contextlib.nullcontext():
+                    if last_id is None:
+                        last_id, seen = self._latest()
+                    else:
+                        last_id = self._poll(last_id, seen)
+            except Exception as e:
+                # Subscribers keep their streams and the poll is retried
+                self.log.warning("Polling review events failed: %s", e)
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counts)
+            stats["subscribers"] = len(self._subscribers)
+        return stats
@@ -0,0 +1,318 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Queries that differ only in case, spacing or trailing punctuation share a cache entry
+def normalize_query(text):
+    text = re.sub(r'\s+', ' ', (text or '').strip().lower())
+    return text.rstrip(' ?!.')
+
+
+def make_cache_key(query, patient_context=None, conversation=None):
+    raw = normalize_query(query) + '\x1f' + (patient_context or '') + '\x1f' + (conversation or '')
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class NullResponseCache(CacheStats):
+    """Cache that never stores anything, used when caching is switched off."""
+
+    backend = 'none'
+
+    def get(self, key):
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryResponseCache(CacheStats):
+    """In-process LRU cache with a TTL, an entry limit and a memory cap."""
+
+    backend = 'memory'
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=24 * 3600):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(key) + len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            # Evict least recently used entries until both limits hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"entries": len(self._entries), "bytes": self._bytes})
+        return stats
+
+
+class SQLiteResponseCache(CacheStats):
+    """Cache kept in a SQLite table, shared by worker processes and kept across restarts.
+
+    Entries are evicted by TTL and then least-recently-used first whenever the
+    table grows past its entry or byte limit.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, max_entries=100000, max_bytes=256 * 1024 * 1024, ttl=7 * 24 * 3600):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_response_cache_last_used ON llm_response_cache (last_used_at)")
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A process forked after the cache was opened must not reuse its parent's connection
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT response FROM llm_response_cache WHERE cache_key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        conn.execute("UPDATE llm_response_cache SET last_used_at = ? WHERE cache_key = ?", (now, key))
+        conn.commit()
+        self._count('hits')
+        return row[0]
+
+    def set(self, key, value):
+        size = len(key) + len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_response_cache (cache_key, response, size, expires_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, size, now + self.ttl, now)
+        )
+        self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn, now):
+        evicted = conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,)).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_response_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Walk the LRU index and drop the oldest rows until both limits hold
+            excess_rows, excess_bytes = count - self.max_entries, total - self.max_bytes
+            doomed = []
+            for cache_key, size in conn.execute(
+                "SELECT cache_key, size FROM llm_response_cache ORDER BY last_used_at"
+            ):
+                if excess_rows <= 0 and excess_bytes <= 0:
+                    break
+                doomed.append((cache_key,))
+                excess_rows -= 1
+                excess_bytes -= size
+            conn.executemany("DELETE FROM llm_response_cache WHERE cache_key = ?", doomed)
+            evicted += len(doomed)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute("DELETE FROM llm_response_cache")
+        conn.commit()
+
+    def stats(self):
+        stats = super().stats()
+        count, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_response_cache"
+        ).fetchone()
+        stats.update({"entries": count, "bytes": total})
+        return stats
+
+
+def create_response_cache(backend, path=None, max_entries=None, max_bytes=None, ttl=None):
+    options = {name: value for name, value in
+               (('max_entries', max_entries), ('max_bytes', max_bytes), ('ttl', ttl)) if value is not None}
+    if backend == 'memory':
+        return MemoryResponseCache(**options)
+    if backend == 'sqlite':
+        return SQLiteResponseCache(path, **options)
+    if backend in ('none', '', None):
+        return NullResponseCache()
+    raise ValueError(f"Unknown LLM cache backend: {backend}")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.saved = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.saved += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, "saved_calls": self.saved}
+
+
+class TTLCache:
+    """Small thread-safe mapping whose entries expire after `ttl` seconds.
+
+    The oldest entries are dropped once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
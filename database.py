@@ -0,0 +1,85 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+SQLITE_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SQLITE_SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def is_file_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database at `url`.
+
+    Both backends get a bounded connection pool sized for one worker process.
+    PostgreSQL connections are pinged on checkout and recycled, so restarts
+    and idle-connection reaping by the server or a proxy don't surface as
+    request errors. SQLite's busy timeout is also handed to the driver,
+    which waits that long for a lock before raising "database is locked".
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        if not is_file_sqlite(url):
+            return {}
+        return {
+            "pool_size": config['DB_POOL_SIZE'],
+            "max_overflow": config['DB_MAX_OVERFLOW'],
+            "pool_timeout": config['DB_POOL_TIMEOUT'],
+            "connect_args": {"timeout": config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+        }
+    options = {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+        "pool_recycle": config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": True
+    }
+    if backend == 'postgresql':
+        connect_args = {"application_name": 'caresync'}
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args["options"] = f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}"
+        options["connect_args"] = connect_args
+    return options
+
+
+def sqlite_pragmas(config):
+    journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if journal_mode and journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLITE_JOURNAL_MODE: {journal_mode}")
+    if synchronous and synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Unknown SQLITE_SYNCHRONOUS: {synchronous}")
+    pragmas = [f"busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}"]
+    if journal_mode:
+        pragmas.append(f"journal_mode = {journal_mode}")
+    if synchronous:
+        pragmas.append(f"synchronous = {synchronous}")
+    pragmas.append(f"mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    return pragmas
+
+
+def configure_engine(engine, config):
+    """Apply the SQLite PRAGMAs to every new connection of a file-backed SQLite engine.
+
+    WAL lets readers run alongside the single writer instead of blocking on
+    it, and NORMAL synchronous is durable under WAL except for the last
+    transactions before a power loss; busy_timeout makes a writer wait for
+    the lock rather than fail, and mmap_size serves reads from the page cache
+    without a copy.
+    """
+    if not is_file_sqlite(engine.url):
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(f"PRAGMA {pragma}")
+        finally:
+            cursor.close()
@@ -0,0 +1,55 @@
+# Production serving: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Several worker processes, each answering requests on a pool of threads (the
+# LLM calls and streamed responses spend most of their time waiting). By default
+# the app is preloaded in the master, so the workers share its imported modules,
+# model weights and verified-answer index copy-on-write, and the migrations run
+# once instead of racing in every worker.
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(2 * multiprocessing.cpu_count() + 1, 8))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Each open /api/review/events stream holds one of those threads for as long as the
+# dashboard stays open, so only a quarter of them may serve streams
+os.environ.setdefault('REVIEW_EVENTS_MAX_STREAMS', str(threads // 4))
+# Worker heartbeat timeout; requests themselves are bounded by LLM_TIMEOUT and LLM_MAX_WAIT
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+preload_app = os.getenv('PRELOAD', '1') == '1'
+# create_app reads the same switch to do its one-time work in the master
+os.environ['PRELOAD'] = '1' if preload_app else '0'
+
+
+def on_starting(server):
+    # Without preloading, run the migrations once here rather than in every worker at once
+    if not preload_app:
+        from app import create_app, init_db, db
+        app = create_app()
+        if not init_db(app):
+            raise RuntimeError("Database initialization failed")
+        with app.app_context():
+            db.engine.dispose()
+
+
+def post_worker_init(worker):
+    from app import db, start_counter_reconciler, preload_transcriber
+    app = worker.wsgi
+    with app.app_context():
+        # Drop (without closing) any connections the master opened; they belong to it
+        db.engine.dispose(close=False)
+    # Threads don't survive a fork, so each worker starts its own; the counter
+    # reconciler only recounts in the worker holding its database lock
+    start_counter_reconciler(app)
+    if app.config['TRANSCRIBE_PRELOAD']:
+        preload_transcriber()
+
+
+def worker_exit(server, worker):
+    # Commit the chat and query writes this worker still has queued
+    from app import write_behind
+    write_behind.close()
@@ -0,0 +1,139 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+
+CLAIMED = 'claimed'
+IN_FLIGHT = 'in_flight'
+COMPLETED = 'completed'
+MISMATCH = 'mismatch'
+
+
+class IdempotencyStore:
+    """Outcomes of requests sent with an Idempotency-Key, kept in a database table so
+    that every worker process sees them.
+
+    `table` needs the columns scope, key (together the primary key), fingerprint,
+    status, response_status, response_headers, response_body, created_at and
+    expires_at. The first request with a key claims it (an in_flight row that
+    expires after `lease` seconds, so a claim left by a crashed worker is taken
+    over) and stores its response with complete(), which keeps it for `ttl`
+    seconds; release() forgets a claim whose request failed, so a retry runs
+    again. `engine` returns the engine to use. Expired rows are purged at most
+    every `purge_interval` seconds per process.
+    """
+
+    def __init__(self, table, engine, ttl=86400, lease=120, poll_interval=0.1, purge_interval=300):
+        self.table = table
+        self.engine = engine
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        # Requests in flight in this process, so waiters here wake as soon as they finish
+        self._finished = {}
+        self._next_purge = 0.0
+        self.counts = {CLAIMED: 0, COMPLETED: 0, IN_FLIGHT: 0, MISMATCH: 0, "released": 0, "purged": 0}
+
+    def _where(self, scope, key):
+        return (self.table.c.scope == scope) & (self.table.c.key == key)
+
+    def claim(self, scope, key, fingerprint):
+        """Returns (CLAIMED, None) when the caller should run the request, else
+        (COMPLETED, row) to replay, (IN_FLIGHT, row) or (MISMATCH, row) when the key
+        was used for a different request."""
+        self._maybe_purge()
+        now = datetime.utcnow()
+        claim = {"fingerprint": fingerprint, "status": IN_FLIGHT, "response_status": None, "response_headers": None,
+                 "response_body": None, "created_at": now, "expires_at": now + timedelta(seconds=self.lease)}
+        try:
+            with self.engine().begin() as conn:
+                conn.execute(self.table.insert().values(scope=scope, key=key, **claim))
+            return self._claimed(scope, key)
+        except IntegrityError:
+            pass
+        with self.engine().begin() as conn:
+            # An expired outcome or an abandoned claim is free to take
+            taken = conn.execute(
+                self.table.update().where(self._where(scope, key), self.table.c.expires_at <= now).values(**claim)
+            ).rowcount
+            row = None if taken else conn.execute(self.table.select().where(self._where(scope, key))).first()
+        if taken or row is None:
+            return self._claimed(scope, key) if taken else self.claim(scope, key, fingerprint)
+        outcome = MISMATCH if row.fingerprint != fingerprint else row.status
+        with self._lock:
+            self.counts[outcome] += 1
+        return outcome, row
+
+    def _claimed(self, scope, key):
+        with self._lock:
+            self.counts[CLAIMED] += 1
+            self._finished.setdefault((scope, key), threading.Event())
+        return CLAIMED, None
+
+    def wait(self, scope, key, fingerprint, timeout):
+        """Wait up to `timeout` seconds for a request in flight elsewhere, then claim again.
+
+        Returns what claim() returns: usually COMPLETED with the stored response,
+        CLAIMED if the original failed and this request should run instead, or
+        IN_FLIGHT if it is still running.
+        """
+        deadline = time.monotonic() + timeout
+        delay = self.poll_interval
+        while True:
+            with self._lock:
+                finished = self._finished.get((scope, key))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return IN_FLIGHT, None
+            if finished is not None:
+                finished.wait(min(remaining, self.lease))
+            else:
+                # Running in another process: poll, backing off to half a second
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.5)
+            outcome, row = self.claim(scope, key, fingerprint)
+            if outcome != IN_FLIGHT:
+                return outcome, row
+
+    def complete(self, scope, key, status, headers, body):
+        now = datetime.utcnow()
+        with self.engine().begin() as conn:
+            conn.execute(self.table.update().where(self._where(scope, key)).values(
+                status=COMPLETED, response_status=status, response_headers=headers, response_body=body,
+                expires_at=now + timedelta(seconds=self.ttl)
+            ))
+        self._finish(scope, key)
+
+    def release(self, scope, key):
+        with self.engine().begin() as conn:
+            conn.execute(self.table.delete().where(self._where(scope, key), self.table.c.status == IN_FLIGHT))
+        with self._lock:
+            self.counts["released"] += 1
+        self._finish(scope, key)
+
+    def _finish(self, scope, key):
+        with self._lock:
+            finished = self._finished.pop((scope, key), None)
+        if finished is not None:
+            finished.set()
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        with self.engine().begin() as conn:
+            purged = conn.execute(self.table.delete().where(self.table.c.expires_at <= datetime.utcnow())).rowcount
+        with self._lock:
+            self.counts["purged"] += purged
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats["in_flight_here"] = len(self._finished)
+        return stats
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when the worker pool has no free slot for another job."""
+
+
+class BoundedExecutor:
+    """Thread pool with a hard cap on running + queued jobs.
+
+    A caller first reserves a slot (which fails fast with ``QueueFull`` when
+    the pool is saturated) and then submits the job under a key, so that
+    other requests can wait on the job while it is in flight.
+    """
+
+    def __init__(self, max_workers, max_queue, name='job'):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def reserve(self):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(f"{self.max_workers + self.max_queue} jobs already queued or running")
+
+    def release(self):
+        self._slots.release()
+
+    def submit(self, key, fn, *args, **kwargs):
+        # The caller must hold a slot from reserve(); it is returned when the job finishes
+        future = self._executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._jobs[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._jobs.get(key) is future:
+                del self._jobs[key]
+        self._slots.release()
+
+    def wait(self, key, timeout):
+        # Returns once the job is done or the timeout passes; unknown keys return at once
+        with self._lock:
+            future = self._jobs.get(key)
+        if future is None:
+            return True
+        try:
+            future.exception(timeout=timeout)
+        except Exception:
+            return False
+        return True
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,356 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class LLMError(Exception):
+    """Base class for failures raised by the LLM client."""
+
+
+class LLMTimeout(LLMError):
+    """The request did not finish within its deadline."""
+
+
+class CircuitOpen(LLMError):
+    """The upstream is marked unhealthy, so the call was not attempted."""
+
+
+class GeminiBackend:
+    """Holds one long-lived Gemini model (and with it one gRPC channel) for the process."""
+
+    def __init__(self, model_name='gemini-1.5-flash-latest', api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        # The SDK is imported and configured on first use; it is slow to import and
+        # processes that never call Gemini (CLI commands, tests) shouldn't pay for it
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    if self.api_key:
+                        genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    # `timeout` is the RPC deadline in seconds. Without one an abandoned call would keep
+    # its LLMClient slot until the upstream gave up on it.
+    def generate(self, prompt, timeout=None):
+        model = self._get_model()
+        from google.api_core.exceptions import DeadlineExceeded
+        try:
+            return model.generate_content(prompt, request_options=self._options(timeout))
+        except DeadlineExceeded as e:
+            raise LLMTimeout(str(e)) from e
+
+    def stream(self, prompt, timeout=None):
+        model = self._get_model()
+        from google.api_core.exceptions import DeadlineExceeded
+        try:
+            yield from model.generate_content(prompt, stream=True, request_options=self._options(timeout))
+        except DeadlineExceeded as e:
+            raise LLMTimeout(str(e)) from e
+
+    @staticmethod
+    def _options(timeout):
+        return {"timeout": timeout} if timeout is not None else None
+
+
+class FakeResponse:
+    def __init__(self, text, block_reason=None):
+        self.text = text
+        self.prompt_feedback = type('PromptFeedback', (), {'block_reason': block_reason})()
+
+
+class FakeBackend:
+    """Local stand-in for Gemini with configurable latency, jitter and error rate."""
+
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, text=None, chunk_size=20, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.text = text
+        self.chunk_size = chunk_size
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _answer(self, prompt):
+        if self.text is not None:
+            return self.text
+        question = prompt.rsplit('User query:', 1)[-1].strip()
+        return f"This is a simulated response to: {question}"
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self._random.random() < self.error_rate:
+            raise LLMError("Simulated upstream error")
+
+    def _wait(self, delay, deadline):
+        # Like the upstream, give up at the request deadline
+        if deadline is not None and time.monotonic() + delay > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            raise LLMTimeout("Simulated upstream deadline exceeded")
+        time.sleep(delay)
+
+    def generate(self, prompt, timeout=None):
+        self._maybe_fail()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self._wait(self.latency + self._random.uniform(0, self.jitter), deadline)
+        return FakeResponse(self._answer(prompt))
+
+    def stream(self, prompt, timeout=None):
+        self._maybe_fail()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        text = self._answer(prompt)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+        delay = (self.latency + self._random.uniform(0, self.jitter)) / len(chunks)
+        for chunk in chunks:
+            self._wait(delay, deadline)
+            yield FakeResponse(chunk)
+
+
+class TokenBucket:
+    """Allows `rate` calls per `per` seconds with bursts of up to `burst` calls."""
+
+    def __init__(self, rate, per=60.0, burst=None):
+        self.capacity = burst or max(1, int(rate))
+        self.fill_rate = rate / per
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.fill_rate
+            if now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds, then lets a single trial call through (half-open)."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+        raise CircuitOpen("LLM upstream is unhealthy; failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def cancel(self):
+        # The allowed call never reached the upstream, so it says nothing about its health
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class LLMClient:
+    """Calls an LLM backend under a concurrency cap, a rate limit, a per-request
+    deadline with one hedged retry, and a circuit breaker.
+
+    Each backend call is given what is left of the deadline (`stream_timeout` for
+    the whole of a stream) and holds its concurrency slot until it has returned,
+    so attempts the caller stopped waiting for still count against the cap, but
+    only until the upstream call is cut off.
+    """
+
+    def __init__(self, backend, max_concurrency=8, rate_per_minute=60, timeout=30.0,
+                 hedge_after=10.0, breaker=None, stream_timeout=120.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute) if rate_per_minute else None
+        # Room for a hedge per slot; attempts that miss their deadline keep their thread until they return
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix='llm-call')
+        self._stats_lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+        self.counts = {"calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0, "hedged": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.counts[name] += 1
+
+    def _acquire(self, deadline, blocking=True):
+        remaining = deadline - time.monotonic()
+        if not blocking:
+            if not self._slots.acquire(blocking=False):
+                return False
+        elif remaining <= 0 or not self._slots.acquire(timeout=remaining):
+            return False
+        if self._bucket and not self._bucket.acquire(max(0.0, deadline - time.monotonic()) if blocking else 0):
+            self._slots.release()
+            return False
+        return True
+
+    def _attempt(self, fn, prompt, deadline):
+        try:
+            return fn(prompt, timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt, timeout=None):
+        self.breaker.allow()
+        self._count('calls')
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if not self._acquire(deadline):
+            self.breaker.cancel()
+            self._count('timed_out')
+            raise LLMTimeout("Timed out waiting for an LLM slot")
+
+        start = time.monotonic()
+        hedge_at = start + self.hedge_after if self.hedge_after else None
+        attempts = {self._executor.submit(self._attempt, self.backend.generate, prompt, deadline)}
+        hedged = False
+        error = None
+        while attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline if hedged or hedge_at is None else min(deadline, hedge_at)
+            done, attempts = wait(attempts, timeout=wait_until - now, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    self.breaker.record_success()
+                    self._count('succeeded')
+                    return future.result()
+                error = future.exception()
+
+            # One hedged retry, fired when the first attempt is slow or has already failed
+            if hedge_at is not None and not hedged and (not attempts or time.monotonic() >= hedge_at):
+                hedged = True
+                if self._acquire(deadline, blocking=False):
+                    self._count('hedged')
+                    attempts.add(self._executor.submit(self._attempt, self.backend.generate, prompt, deadline))
+
+        if attempts or error is None or isinstance(error, LLMTimeout):
+            self._fail('timed_out')
+            raise LLMTimeout(f"No LLM response within {timeout or self.timeout}s")
+        self._fail('failed')
+        raise LLMError(str(error)) from error
+
+    def stream(self, prompt, timeout=None):
+        """Yields chunks from the backend; the deadline bounds the wait for every chunk."""
+        self.breaker.allow()
+        self._count('calls')
+        timeout = timeout or self.timeout
+        if not self._acquire(time.monotonic() + timeout):
+            self.breaker.cancel()
+            self._count('timed_out')
+            raise LLMTimeout("Timed out waiting for an LLM slot")
+
+        chunks = queue.Queue()
+        done = object()
+        abandoned = threading.Event()
+
+        def pump():
+            try:
+                for chunk in self.backend.stream(prompt, timeout=self.stream_timeout):
+                    if abandoned.is_set():
+                        break  # Stop reading, which ends the upstream call
+                    chunks.put(chunk)
+                chunks.put(done)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                self._slots.release()
+
+        self._executor.submit(pump)
+        finished = False
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    finished = True
+                    self._fail('timed_out')
+                    raise LLMTimeout(f"No LLM output within {timeout}s")
+                if item is done:
+                    finished = True
+                    self.breaker.record_success()
+                    self._count('succeeded')
+                    return
+                if isinstance(item, LLMTimeout):
+                    finished = True
+                    self._fail('timed_out')
+                    raise item
+                if isinstance(item, Exception):
+                    finished = True
+                    self._fail('failed')
+                    raise LLMError(str(item)) from item
+                yield item
+        finally:
+            # The consumer went away mid-stream (e.g. the client disconnected)
+            if not finished:
+                self.breaker.cancel()
+            abandoned.set()
+
+    def _fail(self, outcome):
+        self.breaker.record_failure()
+        self._count(outcome)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counts)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["circuit"] = self.breaker.stats()
+        return stats
+
+
+def create_llm_backend(name, model_name=None, api_key=None, fake_latency=0.5, fake_error_rate=0.0, fake_jitter=0.0):
+    if name == 'gemini':
+        return GeminiBackend(model_name or 'gemini-1.5-flash-latest', api_key=api_key)
+    if name == 'fake':
+        return FakeBackend(latency=fake_latency, jitter=fake_jitter, error_rate=fake_error_rate)
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+
+def add_column(table, column, ddl):
+    """Step that adds a column unless the table already has it (e.g. built by create_all)."""
+    def step(conn):
+        if column not in {info['name'] for info in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+def sqlite_only(*statements):
+    """Step for SQLite-specific objects such as FTS5 tables; other databases skip it."""
+    def step(conn):
+        if conn.dialect.name == 'sqlite':
+            for statement in statements:
+                conn.execute(text(statement))
+    return step
+
+
+# Versioned schema changes for databases created by earlier releases.
+# db.create_all() builds new tables with their current definition; these steps
+# bring existing tables up to date. Every step must be safe to re-run (IF NOT
+# EXISTS and friends) because a fresh database already has the current schema.
+# A step is either a SQL string or a callable taking the connection.
+MIGRATIONS = [
+    (1, "Composite indexes for the query access paths", [
+        "CREATE INDEX IF NOT EXISTS ix_queries_patient_id_query_id ON queries (patient_id, query_id)",
+        "CREATE INDEX IF NOT EXISTS ix_queries_clinician_id_query_id ON queries (clinician_id, query_id)",
+        "CREATE INDEX IF NOT EXISTS ix_queries_query_status_query_id ON queries (query_status, query_id)",
+        "CREATE INDEX IF NOT EXISTS ix_queries_chat_id_query_id ON queries (chat_id, query_id)",
+        "CREATE INDEX IF NOT EXISTS ix_queries_created_at ON queries (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_chatbot_patient_id ON chatbot (patient_id)",
+    ]),
+    (2, "Rolling conversation summary per chat", [
+        add_column('chatbot', 'context_summary', 'TEXT'),
+        add_column('chatbot', 'summary_through_query_id', 'INTEGER'),
+    ]),
+    # External-content FTS5 index over queries; the triggers keep it in step with
+    # every write path (ORM, Core and raw SQL) and 'rebuild' indexes existing rows.
+    (3, "Full-text search index over query text and responses", [
+        sqlite_only(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS queries_fts USING fts5("
+            "query_text, response, content='queries', content_rowid='query_id', tokenize='porter unicode61')",
+            "CREATE TRIGGER IF NOT EXISTS queries_fts_insert AFTER INSERT ON queries BEGIN "
+            "INSERT INTO queries_fts (rowid, query_text, response) VALUES (new.query_id, new.query_text, new.response); END",
+            "CREATE TRIGGER IF NOT EXISTS queries_fts_delete AFTER DELETE ON queries BEGIN "
+            "INSERT INTO queries_fts (queries_fts, rowid, query_text, response) "
+            "VALUES ('delete', old.query_id, old.query_text, old.response); END",
+            "CREATE TRIGGER IF NOT EXISTS queries_fts_update AFTER UPDATE OF query_text, response ON queries BEGIN "
+            "INSERT INTO queries_fts (queries_fts, rowid, query_text, response) "
+            "VALUES ('delete', old.query_id, old.query_text, old.response); "
+            "INSERT INTO queries_fts (rowid, query_text, response) VALUES (new.query_id, new.query_text, new.response); END",
+            "INSERT INTO queries_fts (queries_fts) VALUES ('rebuild')",
+        ),
+    ]),
+    (4, "Record where each answer came from", [
+        add_column('queries', 'answer_source', 'VARCHAR(20)'),
+        add_column('queries', 'source_query_id', 'INTEGER'),
+    ]),
+    (5, "Review leases on queries", [
+        add_column('queries', 'claimed_by', 'INTEGER'),
+        add_column('queries', 'lease_expires_at', 'DATETIME'),
+    ]),
+    # Last-Modified of the cached profiles; existing rows count as modified now
+    (6, "Modification times of patient and clinician profiles", [
+        add_column('patients', 'updated_at', 'DATETIME'),
+        add_column('clinicians', 'updated_at', 'DATETIME'),
+        "UPDATE patients SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL",
+        "UPDATE clinicians SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL",
+    ]),
+    # Verified answers are only reused for the patient they were written for
+    (7, "Patient scope of verified answers", [
+        add_column('verified_answers', 'patient_id', 'INTEGER'),
+        "UPDATE verified_answers SET patient_id = (SELECT queries.patient_id FROM queries "
+        "WHERE queries.query_id = verified_answers.query_id) WHERE patient_id IS NULL",
+    ]),
+    # Query ids are only roughly in time order across workers, so chat turns are read by time
+    (8, "Chat transcripts in turn order", [
+        "CREATE INDEX IF NOT EXISTS ix_queries_chat_id_created_at_query_id ON queries (chat_id, created_at, query_id)",
+        "DROP INDEX IF EXISTS ix_queries_chat_id_query_id",
+    ]),
+    # Verified answers are picked up by the time they were verified, not by id
+    (9, "Verified answers by verification time", [
+        "CREATE INDEX IF NOT EXISTS ix_verified_answers_verified_at ON verified_answers (verified_at)",
+    ]),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        ensure_migrations_table(conn)
+        return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def run_migrations(engine, migrations=MIGRATIONS):
+    """Apply pending migrations in version order, each in its own transaction.
+
+    Returns the versions applied by this call. When several workers start at
+    once, the loser of the race on the version row rolls back and moves on.
+    """
+    applied = applied_versions(engine)
+    newly_applied = []
+    for version, description, steps in sorted(migrations, key=lambda migration: migration[0]):
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(text(step))
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": version, "d": description, "t": datetime.utcnow()}
+                )
+        except IntegrityError:
+            continue
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,187 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """The statement with literals and IN-lists folded, so repeats of one query look alike."""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def is_full_scan(plan):
+    # SQLite: "SCAN queries" without an index (FTS lookups show as a virtual table scan);
+    # PostgreSQL: "Seq Scan on queries"
+    for line in plan:
+        if line.startswith('SCAN ') and ' USING ' not in line and 'VIRTUAL TABLE' not in line:
+            return True
+        if 'Seq Scan' in line:
+            return True
+    return False
+
+
+class SQLProfiler:
+    """Statement profiler built on SQLAlchemy cursor events.
+
+    * statements slower than `slow_ms` are logged with their query plan
+      (EXPLAIN QUERY PLAN on SQLite, EXPLAIN elsewhere), captured once per shape;
+      the plans and slow statement records of at most `max_shapes` shapes are kept;
+    * a request that runs one statement shape `repeat_threshold` times or more
+      is flagged as a likely N+1;
+    * per-endpoint totals are kept for report().
+
+    Requests are delimited with begin()/end() on the handling thread; statements
+    outside a request are attributed to "background".
+    """
+
+    def __init__(self, logger, slow_ms=100.0, repeat_threshold=10, explain=True, max_shapes=500):
+        self.log = logger
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.explain = explain
+        self.max_shapes = max_shapes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow = OrderedDict()  # shape -> slow statement record
+        self._plans = OrderedDict()  # shape -> plan, least recently used first
+
+    def attach(self, target):
+        event.listen(target, 'before_cursor_execute', self._before)
+        event.listen(target, 'after_cursor_execute', self._after)
+
+    def begin(self, endpoint):
+        self._local.request = {"endpoint": endpoint, "statements": 0, "sql_ms": 0.0, "shapes": {}}
+
+    def end(self):
+        current = getattr(self._local, 'request', None)
+        self._local.request = None
+        if current is None:
+            return
+        repeated = {shape: count for shape, count in current["shapes"].items() if count >= self.repeat_threshold}
+        for shape, count in repeated.items():
+            self.log.warning("Possible N+1 in %s: statement ran %d times", current["endpoint"], count,
+                             extra={"endpoint": current["endpoint"], "repeats": count, "statement": shape})
+        with self._lock:
+            stats = self._endpoint_stats(current["endpoint"])
+            stats["requests"] += 1
+            stats["statements"] += current["statements"]
+            stats["sql_ms"] += current["sql_ms"]
+            stats["max_statements"] = max(stats["max_statements"], current["statements"])
+            for shape, count in repeated.items():
+                incident = stats["n_plus_one"].setdefault(shape, {"statement": shape, "requests": 0, "max_repeats": 0})
+                incident["requests"] += 1
+                incident["max_repeats"] = max(incident["max_repeats"], count)
+
+    def _endpoint_stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = {
+                "requests": 0, "statements": 0, "sql_ms": 0.0, "max_statements": 0, "slow_statements": 0,
+                "n_plus_one": {}
+            }
+        return stats
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['profiler_started'].pop()) * 1000
+        shape = statement_shape(statement)
+        current = getattr(self._local, 'request', None)
+        endpoint = current["endpoint"] if current else 'background'
+        if current is not None:
+            current["statements"] += 1
+            current["sql_ms"] += elapsed_ms
+            current["shapes"][shape] = current["shapes"].get(shape, 0) + 1
+        if elapsed_ms >= self.slow_ms:
+            self._record_slow(conn, statement, parameters, executemany, shape, endpoint, elapsed_ms)
+
+    def _record_slow(self, conn, statement, parameters, executemany, shape, endpoint, elapsed_ms):
+        with self._lock:
+            plan = self._plans.get(shape)
+            if plan is not None:
+                self._plans.move_to_end(shape)
+        if plan is None and self.explain and not executemany:
+            plan = self._explain(conn, statement, parameters)
+            with self._lock:
+                self._plans[shape] = plan
+                while len(self._plans) > self.max_shapes:
+                    self._plans.popitem(last=False)
+        full_scan = is_full_scan(plan or [])
+        self.log.warning("Slow SQL (%.1f ms) in %s%s", elapsed_ms, endpoint, " [full scan]" if full_scan else "",
+                         extra={"endpoint": endpoint, "elapsed_ms": round(elapsed_ms, 2), "statement": shape,
+                                "plan": plan, "full_scan": full_scan})
+        with self._lock:
+            if endpoint in self._endpoints:
+                self._endpoints[endpoint]["slow_statements"] += 1
+            record = self._slow.pop(shape, None) or {
+                "statement": shape, "count": 0, "max_ms": 0.0, "total_ms": 0.0, "endpoints": [],
+                "plan": plan, "full_scan": full_scan
+            }
+            record["count"] += 1
+            record["total_ms"] += elapsed_ms
+            record["max_ms"] = max(record["max_ms"], elapsed_ms)
+            if endpoint not in record["endpoints"]:
+                record["endpoints"].append(endpoint)
+            self._slow[shape] = record
+            while len(self._slow) > self.max_shapes:
+                self._slow.popitem(last=False)
+
+    def _explain(self, conn, statement, parameters):
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+            return None
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        # A separate DBAPI cursor, so the result of the profiled statement is untouched
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            return [f"plan unavailable: {e}"]
+        finally:
+            cursor.close()
+        if conn.dialect.name == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+    def report(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                requests = stats["requests"] or 1
+                endpoints[endpoint] = {
+                    "requests": stats["requests"],
+                    "statements": stats["statements"],
+                    "avg_statements": round(stats["statements"] / requests, 2),
+                    "max_statements": stats["max_statements"],
+                    "sql_ms": round(stats["sql_ms"], 2),
+                    "avg_sql_ms": round(stats["sql_ms"] / requests, 2),
+                    "slow_statements": stats["slow_statements"],
+                    "n_plus_one": list(stats["n_plus_one"].values())
+                }
+            slow = sorted(({**record, "max_ms": round(record["max_ms"], 2), "total_ms": round(record["total_ms"], 2)}
+                           for record in self._slow.values()), key=lambda record: record["total_ms"], reverse=True)
+        return {
+            "slow_ms": self.slow_ms,
+            "repeat_threshold": self.repeat_threshold,
+            "endpoints": endpoints,
+            "slow_statements": slow
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slow.clear()
+            self._plans.clear()
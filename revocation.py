@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+
+def token_id(token):
+    """The id a token is revoked under: its SHA-256, so the table never holds a usable token."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RevocationList:
+    """Revoked session tokens, kept in a database table so that a logout holds in
+    every worker process and across restarts.
+
+    `table` needs the columns token_id (primary key), revoked_at and expires_at.
+    A row is kept until the token it revokes would have expired anyway. Each
+    process keeps the unexpired ids in memory and picks up rows revoked by other
+    processes at most every `refresh_interval` seconds (0 checks on every call),
+    so a token revoked elsewhere may still be accepted here for that long. Rows
+    are read back with an overlap of `refresh_slack` seconds, so a revocation
+    committed late is not missed. `engine` returns the engine to use. Expired rows
+    are purged at most every `purge_interval` seconds per process.
+    """
+
+    def __init__(self, table, engine, refresh_interval=2, refresh_slack=10, purge_interval=300):
+        self.table = table
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.refresh_slack = refresh_slack
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._loaded_since = None
+        self._next_refresh = 0.0
+        self._next_purge = 0.0
+
+    def revoke(self, token_id, expires_at):
+        now = datetime.utcnow()
+        if expires_at <= now:
+            return
+        try:
+            with self.engine().begin() as conn:
+                conn.execute(self.table.insert().values(token_id=token_id, revoked_at=now, expires_at=expires_at))
+        except IntegrityError:
+            pass  # Already revoked
+        with self._lock:
+            self._revoked[token_id] = expires_at
+
+    def is_revoked(self, token_id):
+        self._refresh()
+        with self._lock:
+            expires_at = self._revoked.get(token_id)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_interval
+            since = self._loaded_since
+        self._maybe_purge()
+        started = datetime.utcnow()
+        stmt = self.table.select().where(self.table.c.expires_at > started)
+        if since is not None:
+            stmt = stmt.where(self.table.c.revoked_at >= since)
+        with self.engine().connect() as conn:
+            rows = conn.execute(stmt).all()
+        with self._lock:
+            for row in rows:
+                self._revoked[row.token_id] = row.expires_at
+            self._revoked = {key: expires for key, expires in self._revoked.items() if expires > started}
+            self._loaded_since = started - timedelta(seconds=self.refresh_slack)
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        with self.engine().begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.expires_at <= datetime.utcnow()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._revoked)
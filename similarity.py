@@ -0,0 +1,186 @@
+import math
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from cache import normalize_query
+
+
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'be', 'can', 'do', 'does', 'for', 'how', 'i', 'if', 'in', 'is', 'it',
+    'me', 'my', 'of', 'on', 'or', 'should', 'the', 'to', 'what', 'when', 'with'
+))
+
+
+def text_features(text):
+    """Words plus the character trigrams inside each word.
+
+    The character n-grams let misspellings and inflections ("dose" / "dosing",
+    "asthama") still overlap with the verified question.
+    """
+    words = [word for word in re.findall(r'\w+', normalize_query(text)) if word not in STOP_WORDS]
+    features = ['w:' + word for word in words]
+    for word in words:
+        padded = f' {word} '
+        features += ['c:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+    return features
+
+
+class SimilarityIndex:
+    """Hashed n-gram TF-IDF vectors for a set of documents, searched by cosine similarity.
+
+    Each document is hashed into a fixed number of buckets (signed, so that
+    collisions tend to cancel out), so the index is a dense NumPy matrix with
+    one row per document. IDF weights are recomputed lazily after changes.
+    A document may belong to an integer group; a search in a group only
+    considers the documents in it, and documents without a group are group None.
+    """
+
+    NO_GROUP = -1
+
+    def __init__(self, dim=2048):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._keys = []
+        self._rows = {}  # key -> row number
+        self._payloads = {}
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        self._groups = np.zeros(0, dtype=np.int64)
+        self._weighted = None
+        self._idf = None
+
+    def vectorize(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in text_features(text):
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        # Sublinear term frequency, keeping each bucket's sign
+        return np.sign(vector) * np.log1p(np.abs(vector))
+
+    def add(self, key, text, payload=None, group=None):
+        vector = self.vectorize(text)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                if row >= len(self._tf):
+                    grown = np.zeros((max(16, len(self._tf) * 2), self.dim), dtype=np.float32)
+                    grown[:len(self._tf)] = self._tf
+                    self._tf = grown
+                    groups = np.full(len(grown), self.NO_GROUP, dtype=np.int64)
+                    groups[:len(self._groups)] = self._groups
+                    self._groups = groups
+            self._tf[row] = vector
+            self._groups[row] = self.NO_GROUP if group is None else group
+            self._payloads[key] = payload
+            self._weighted = None
+
+    def _reweight(self):
+        count = len(self._keys)
+        tf = self._tf[:count]
+        df = np.count_nonzero(tf, axis=0)
+        self._idf = (np.log((1.0 + count) / (1.0 + df)) + 1.0).astype(np.float32)
+        weighted = tf * self._idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._weighted = weighted / norms
+
+    def search(self, text, group=None):
+        """Return (key, score, payload) of the closest document in `group`, or None when it is empty."""
+        vector = self.vectorize(text)
+        with self._lock:
+            if not self._keys:
+                return None
+            if self._weighted is None:
+                self._reweight()
+            query = vector * self._idf
+            norm = float(np.linalg.norm(query))
+            if norm == 0:
+                return None
+            scores = self._weighted @ (query / norm)
+            in_group = self._groups[:len(self._keys)] == (self.NO_GROUP if group is None else group)
+            if not in_group.any():
+                return None
+            scores = np.where(in_group, scores, -np.inf)
+            best = int(np.argmax(scores))
+            key = self._keys[best]
+            return key, float(scores[best]), self._payloads[key]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class VerifiedAnswerIndex:
+    """Clinician-verified answers looked up by how close a new question is to the verified one.
+
+    Rows come from the verified_answers table. Every process loads them once and
+    then picks up rows added elsewhere (other workers) at most `refresh_interval`
+    seconds later; answers verified in this process are added immediately. Each
+    refresh reads back the rows verified since the previous one started, less
+    `refresh_slack` seconds, so a row whose transaction committed late (after a
+    row with a higher id) is not missed. Rows already loaded are skipped.
+
+    Each answer has a scope: the id of the patient whose question it answered, or
+    None for a question asked without a patient. An answer written for one
+    patient's conditions and medications is only ever matched for that patient.
+    """
+
+    def __init__(self, threshold=0.75, dim=2048, refresh_interval=30.0, refresh_slack=10.0):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.refresh_slack = refresh_slack
+        self.index = SimilarityIndex(dim)
+        self._answer_ids = {}  # query_id -> answer_id in the index
+        self._loaded_since = None
+        self._last_refresh = -math.inf
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, answer_id, query_id, question, answer, scope=None):
+        # Re-verifying a query replaces its row with a higher answer_id, so an older
+        # row read by a refresh that raced the re-verification is stale
+        with self._lock:
+            if self._answer_ids.get(query_id, -1) >= answer_id:
+                return
+            self._answer_ids[query_id] = answer_id
+            self.index.add(query_id, question, (query_id, answer), group=scope)
+
+    def refresh(self, load_since, now, force=False):
+        # load_since(since) returns (answer_id, query_id, question, answer, scope) rows
+        # verified at or after `since` (every row when it is None)
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=force):
+            return
+        try:
+            started = datetime.utcnow()
+            for answer_id, query_id, question, answer, scope in load_since(self._loaded_since):
+                self.add(answer_id, query_id, question, answer, scope)
+            self._loaded_since = started - timedelta(seconds=self.refresh_slack)
+            self._last_refresh = now
+        finally:
+            self._refresh_lock.release()
+
+    def match(self, question, scope=None):
+        """Return (query_id, answer, score) for the best match in `scope` at or above the threshold."""
+        found = self.index.search(question, group=scope)
+        if found is None or found[1] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        _, score, (query_id, answer) = found
+        return query_id, answer, score
+
+    def stats(self):
+        return {
+            "verified_answers": len(self.index),
+            "threshold": self.threshold,
+            "reused": self.hits,
+            "not_matched": self.misses
+        }
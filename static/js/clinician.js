@@ -2,73 +2,190 @@ document.addEventListener('DOMContentLoaded', () => {
     const pendingQueryList = document.getElementById('pendingQueryList');
     const verifiedQueryList = document.getElementById('verifiedQueryList');
     const selectedQueryText = document.getElementById('selectedQueryText');
+    const currentQueryResponse = document.getElementById('currentQueryResponse');
 
-    // Mock data for testing
-    const mockData = {
-        pending: [
-            { id: 1, text: 'What should I do if I miss a dose of Metformin?' },
-            { id: 2, text: 'Can I take Lisinopril with food?' }
-        ],
-        verified: [
-            { id: 3, text: 'How often should I check my blood pressure?' }
-        ]
-    };
-
-    // Load pending queries
-    function loadPendingQueries() {
-        pendingQueryList.innerHTML = '';
-        mockData.pending.forEach(query => {
-            const queryItem = document.createElement('div');
-            queryItem.classList.add('query-item');
-            queryItem.innerHTML = `
-                <p>${query.text}</p>
-                <div class="actions">
-                    <button class="btn-grad" onclick="selectQuery(${query.id}, '${query.text}')">Select</button>
-                </div>
-            `;
-            pendingQueryList.appendChild(queryItem);
+    // Clinician ID from localStorage (set during login)
+    const clinicianId = localStorage.getItem('clinicianId');
+
+    let selectedQueryId = null;
+    let renewTimer = null;
+
+    async function postJson(endpoint, body) {
+        const result = await fetch(endpoint, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ clinician_id: clinicianId, ...body })
         });
+        const data = result.status === 204 ? null : await result.json();
+        if (!result.ok) {
+            throw new Error((data && data.error) || 'Request failed');
+        }
+        return data;
+    }
+
+    function queryItem(query, withSelect) {
+        const item = document.createElement('div');
+        item.classList.add('query-item');
+        item.dataset.queryId = query.query_id;
+        const text = document.createElement('p');
+        text.textContent = query.query_text;
+        item.appendChild(text);
+        if (withSelect) {
+            const actions = document.createElement('div');
+            actions.classList.add('actions');
+            const button = document.createElement('button');
+            button.classList.add('btn-grad');
+            button.textContent = 'Select';
+            button.addEventListener('click', () => selectQuery(query.query_id));
+            actions.appendChild(button);
+            item.appendChild(actions);
+        }
+        return item;
+    }
+
+    function removeItem(list, queryId) {
+        const item = list.querySelector(`[data-query-id="${queryId}"]`);
+        if (item) {
+            item.remove();
+        }
     }
 
-    // Load verified queries
-    function loadVerifiedQueries() {
+    // Load pending queries from the review queue (unclaimed or with an expired lease)
+    async function loadPendingQueries() {
+        pendingQueryList.innerHTML = '';
+        try {
+            const response = await fetch('/api/review/queue?fields=query_id,query_text');
+            const queries = await response.json();
+            queries.forEach(query => pendingQueryList.appendChild(queryItem(query, true)));
+        } catch (error) {
+            console.error('Error loading pending queries:', error);
+        }
+    }
+
+    // Load the most recently verified queries
+    async function loadVerifiedQueries() {
         verifiedQueryList.innerHTML = '';
-        mockData.verified.forEach(query => {
-            const queryItem = document.createElement('div');
-            queryItem.classList.add('query-item');
-            queryItem.innerHTML = `
-                <p>${query.text}</p>
-            `;
-            verifiedQueryList.appendChild(queryItem);
-        });
+        try {
+            const response = await fetch('/api/review/queue?status=Verified&order=desc&limit=20&fields=query_id,query_text');
+            const queries = await response.json();
+            queries.forEach(query => verifiedQueryList.appendChild(queryItem(query, false)));
+        } catch (error) {
+            console.error('Error loading verified queries:', error);
+        }
     }
 
-    // Select a query from pending queries
-    window.selectQuery = function(id, text) {
-        selectedQueryText.textContent = text;
+    function clearSelection() {
+        clearInterval(renewTimer);
+        renewTimer = null;
+        selectedQueryId = null;
+        selectedQueryText.textContent = 'No query selected';
+        currentQueryResponse.value = '';
     }
 
-    // Verify the current query
-    window.verifyResponse = function() {
-        const response = document.getElementById('currentQueryResponse').value;
-        if (response.trim()) {
-            alert("Response verified successfully!");
+    // Claim a query from the queue; the lease is renewed while it stays selected
+    async function selectQuery(id) {
+        if (selectedQueryId && selectedQueryId !== id) {
+            await postJson(`/api/review/${selectedQueryId}/release`, {}).catch(() => {});
+        }
+        try {
+            const claim = await postJson('/api/review/claim', { query_id: id });
+            clearSelection();
+            selectedQueryId = claim.query_id;
+            selectedQueryText.textContent = claim.query_text;
+            currentQueryResponse.value = claim.response || '';
+            removeItem(pendingQueryList, claim.query_id);
+
+            const leaseMs = new Date(claim.lease_expires_at + 'Z') - Date.now();
+            renewTimer = setInterval(() => {
+                postJson(`/api/review/${selectedQueryId}/renew`, {}).catch(() => {
+                    alert('Your claim on this query has expired.');
+                    clearSelection();
+                });
+            }, Math.max(leaseMs / 2, 10000));
+        } catch (error) {
+            alert(`Could not claim this query: ${error.message}`);
+            removeItem(pendingQueryList, id);
+        }
+    }
+
+    async function saveReview(endpoint, action) {
+        const response = currentQueryResponse.value;
+        if (!selectedQueryId) {
+            alert("Please select a query first.");
+        } else if (response.trim()) {
+            try {
+                await postJson(endpoint, { query_id: selectedQueryId, response: response });
+                alert(`Response ${action} successfully!`);
+                clearSelection();
+            } catch (error) {
+                alert(`Could not save the response: ${error.message}`);
+            }
         } else {
-            alert("Please enter a response before verifying.");
+            alert(`Please enter a response before ${action === 'verified' ? 'verifying' : 'editing'}.`);
         }
     }
 
+    // Verify the current query
+    window.verifyResponse = function() {
+        saveReview('/api/verify_response', 'verified');
+    }
+
     // Edit the current query
     window.editResponse = function() {
-        const response = document.getElementById('currentQueryResponse').value;
-        if (response.trim()) {
-            alert("Response edited successfully!");
-        } else {
-            alert("Please enter a response before editing.");
-        }
+        saveReview('/api/edit_response', 'edited');
     }
 
+    // Live queue updates pushed by the server
+    function listenForUpdates() {
+        const events = new EventSource('/api/review/events');
+        events.addEventListener('pending', event => {
+            const query = JSON.parse(event.data);
+            removeItem(pendingQueryList, query.query_id);
+            pendingQueryList.appendChild(queryItem(query, true));
+        });
+        events.addEventListener('claimed', event => {
+            const query = JSON.parse(event.data);
+            if (query.query_id !== selectedQueryId) {
+                removeItem(pendingQueryList, query.query_id);
+            }
+        });
+        events.addEventListener('released', loadPendingQueries);
+        events.addEventListener('verified', event => {
+            const query = JSON.parse(event.data);
+            removeItem(pendingQueryList, query.query_id);
+            verifiedQueryList.prepend(queryItem(query, false));
+        });
+        events.addEventListener('resync', () => {
+            loadPendingQueries();
+            loadVerifiedQueries();
+        });
+        // The browser reconnects on its own; reload so nothing missed meanwhile is lost
+        events.addEventListener('open', loadPendingQueries);
+        // A busy worker refuses the stream (503) and the browser gives up on it:
+        // poll the queue for a minute, then try the stream again
+        events.addEventListener('error', () => {
+            if (events.readyState !== EventSource.CLOSED) {
+                return;
+            }
+            const poll = setInterval(() => {
+                loadPendingQueries();
+                loadVerifiedQueries();
+            }, 15000);
+            setTimeout(() => {
+                clearInterval(poll);
+                listenForUpdates();
+            }, 60000);
+        });
+    }
+
+    window.addEventListener('beforeunload', () => {
+        if (selectedQueryId) {
+            navigator.sendBeacon(`/api/review/${selectedQueryId}/release`,
+                new Blob([JSON.stringify({ clinician_id: clinicianId })], { type: 'application/json' }));
+        }
+    });
+
     // Load initial data
-    loadPendingQueries();
     loadVerifiedQueries();
-});
\ No newline at end of file
+    listenForUpdates();
+});
@@ -18,8 +18,8 @@ document.getElementById('queryForm').addEventListener('submit', async function (
         const patientId = localStorage.getItem('patientId');
         const chatId = localStorage.getItem('currentChatId'); // Optional, can be null for new chat
         
-        // Send the query to the backend for AI processing
-        const response = await fetch('/api/ai_query', {
+        // Send the query to the backend and stream the AI response as it is generated
+        const response = await fetch('/api/ai_query/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -31,23 +31,43 @@ document.getElementById('queryForm').addEventListener('submit', async function (
             }),
         });
         
-        const data = await response.json();
+        if (!response.ok) {
+            const data = await response.json();
+            aiResponseElement.value = "Error: " + data.message;
+            console.error("Error from server:", data.message);
+            return;
+        }
         
-        if (data.success) {
-            // Display the AI response
-            aiResponseElement.value = data.response;
+        // Each line of the body is one JSON event: meta, chunk or done
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let started = false;
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
             
-            // Store the chat ID for future queries in the same conversation
-            if (data.chat_id) {
-                localStorage.setItem('currentChatId', data.chat_id);
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                
+                if (event.type === 'meta' && event.chat_id) {
+                    // Store the chat ID for future queries in the same conversation
+                    localStorage.setItem('currentChatId', event.chat_id);
+                } else if (event.type === 'chunk') {
+                    // Replace the loading text with the first chunk, then append
+                    aiResponseElement.value = started ? aiResponseElement.value + event.text : event.text;
+                    started = true;
+                }
             }
-            
-            // Update the query list
-            displayQueries(patientId);
-        } else {
-            aiResponseElement.value = "Error: " + data.message;
-            console.error("Error from server:", data.message);
         }
+        
+        // Update the query list
+        displayQueries(patientId);
     } catch (error) {
         aiResponseElement.value = "Error connecting to the server. Please try again.";
         console.error('Error submitting query:', error);
@@ -61,7 +81,7 @@ async function displayQueries(patientId) {
     
     try {
         // Fetch queries from our backend
-        const response = await fetch(`/api/queries?patientId=${patientId}`);
+        const response = await fetch(`/api/queries?patientId=${patientId}&order=desc`);
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as caresync  # noqa: E402
+from app import create_app, init_db, db  # noqa: E402
+
+# A fresh SQLite file per test, the fake LLM and transcription backends, and a cheap KDF
+TEST_CONFIG = {
+    "LLM_BACKEND": 'fake',
+    "LLM_FAKE_LATENCY": 0,
+    "LLM_CACHE_BACKEND": 'memory',
+    "TRANSCRIBE_BACKEND": 'fake',
+    "TRANSCRIBE_PRELOAD": False,
+    "PASSWORD_HASH_METHOD": 'pbkdf2:sha256:1000',
+    "COUNTER_RECONCILE_INTERVAL": 0,
+    "SECRET_KEY": 'test-secret',
+    "SQL_PROFILER": False,
+    "PRELOAD": False,
+    "LOG_LEVEL": 'WARNING'
+}
+
+
+@pytest.fixture
+def app_config():
+    """Overrides for a test module's app; override this fixture to change them."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app({**TEST_CONFIG, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'caresync.db'}", **app_config})
+    assert init_db(app)
+    yield app
+    caresync.write_behind.close()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def patient_id(client):
+    response = client.post('/api/patients', json={
+        "full_name": 'Asha Rao', "dob": '1980-05-17', "gender": 'Female', "password": 'pw',
+        "email": 'asha@example.com', "aadhar_number": '111122223333', "diabetes": True,
+        "current_medications": 'Metformin'
+    })
+    assert response.status_code == 201
+    return response.get_json()["patient_id"]
+
+
+def create_clinician(client, number):
+    response = client.post('/api/clinicians', json={
+        "full_name": f'Dr. Clinician {number}', "email": f'clinician{number}@example.com', "phone": '555-0100',
+        "password": 'pw', "medical_reg_number": f'REG-{number}', "specialization": 'General Physician',
+        "years_of_experience": 10, "aadhar_number": f'99990000{number:04d}'
+    })
+    assert response.status_code == 201
+    return response.get_json()["clinician_id"]
+
+
+@pytest.fixture
+def clinician_ids(client):
+    return create_clinician(client, 1), create_clinician(client, 2)
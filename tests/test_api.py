@@ -0,0 +1,105 @@
+import json
+from datetime import datetime
+
+import app as caresync
+from revocation import RevocationList, token_id
+
+
+def ask(client, patient_id, text, **extra):
+    response = client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id, **extra})
+    assert response.status_code in (200, 202), response.get_json()
+    return response
+
+
+def test_ai_query_answers_and_saves_the_query(client, patient_id):
+    body = ask(client, patient_id, 'Can I take Metformin with food?').get_json()
+    assert body["answer_source"] == 'generated'
+    assert body["response"] == "This is a simulated response to: Can I take Metformin with food?"
+
+    saved = client.get(f"/api/queries/{body['query_id']}").get_json()
+    assert saved["chat_id"] == body["chat_id"]
+    assert saved["response"] == body["response"]
+    assert saved["query_status"] == 'Pending'
+
+
+def test_patient_context_reaches_the_prompt(app, client, patient_id):
+    prompts = []
+    backend = caresync.llm_client.backend
+    generate = backend.generate
+    backend.generate = lambda prompt, **kwargs: prompts.append(prompt) or generate(prompt, **kwargs)
+    ask(client, patient_id, 'What diet is recommended?')
+    assert 'Patient: Asha Rao, Female' in prompts[0]
+    assert 'Conditions: diabetes.' in prompts[0] and 'Medications: Metformin.' in prompts[0]
+
+
+def test_async_query_is_answered_in_the_background(client, patient_id):
+    accepted = ask(client, patient_id, 'Is it safe to exercise with asthma?', **{"async": True})
+    assert accepted.status_code == 202
+    location = accepted.headers['Location']
+    polled = client.get(f"{location}?wait=5").get_json()
+    assert polled["status"] == 'completed'
+    assert polled["response"].endswith('Is it safe to exercise with asthma?')
+
+
+def test_returned_query_ids_are_committed(app, client, patient_id):
+    # Read as another worker would: straight from the database, without this process's queue
+    def committed(query_id):
+        with app.app_context(), caresync.db.engine.connect() as conn:
+            return conn.execute(caresync.db.select(caresync.Query.query_id)
+                                .where(caresync.Query.query_id == query_id)).scalar() is not None
+
+    accepted = ask(client, patient_id, 'Is it safe to exercise with asthma?', **{"async": True}).get_json()
+    assert committed(accepted["query_id"])
+    assert committed(ask(client, patient_id, 'Can I take Metformin with food?').get_json()["query_id"])
+
+
+def test_stream_sends_meta_chunks_and_done(client, patient_id):
+    response = client.post('/api/ai_query/stream', json={"query_text": 'Stream me an answer', "patient_id": patient_id})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[0]["type"] == 'meta' and events[-1]["type"] == 'done'
+    text = "".join(event["text"] for event in events if event["type"] == 'chunk')
+    assert text == "This is a simulated response to: Stream me an answer"
+
+    saved = client.get(f"/api/queries/{events[0]['query_id']}").get_json()
+    assert saved["response"] == text
+
+
+def test_abandoned_stream_saves_no_answer(app, patient_id):
+    with app.test_request_context():
+        query_id, chat_id, events = caresync.start_answer_stream('Stream me an answer', patient_id, None)
+        assert json.loads(next(events))["type"] == 'meta'
+        events.close()  # The client disconnected before the first chunk
+        caresync.write_behind.sync()
+
+        query = caresync.db.session.get(caresync.Query, query_id)
+        assert query.response is None and query.query_status == 'Interrupted'
+        assert caresync.serialize_ai_query(query)["status"] == 'interrupted'
+        assert caresync.db.session.query(caresync.ReviewEvent).count() == 0
+        assert caresync.db.session.query(caresync.Query).filter(*caresync.claimable_criteria(datetime.utcnow())).count() == 0
+        summary = caresync.get_db_summary().get_json()
+        assert summary["total_queries"] == 1 and summary["pending_queries"] == 0
+
+
+def test_login_issues_a_session_token(client, patient_id):
+    assert client.post('/api/login', json={"email": 'asha@example.com', "password": 'wrong'}).status_code == 401
+    login = client.post('/api/login', json={"email": 'asha@example.com', "password": 'pw'}).get_json()
+    assert login["patient_id"] == patient_id
+    headers = {"Authorization": f"Bearer {login['token']}"}
+    me = client.get('/api/me', headers=headers).get_json()
+    assert me["role"] == 'patient' and me["patient_id"] == patient_id
+
+    client.post('/api/logout', headers=headers)
+    assert client.get('/api/me', headers=headers).status_code == 401
+
+
+def test_logout_outlives_the_token_cache(app, client, patient_id):
+    token = client.post('/api/login', json={"email": 'asha@example.com', "password": 'pw'}).get_json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post('/api/logout', headers=headers)
+    caresync.session_cache.clear()
+    assert client.get('/api/me', headers=headers).status_code == 401
+
+    # Another worker, or this one after a restart, reads the revocation from the table
+    with app.app_context():
+        other = RevocationList(caresync.RevokedToken.__table__, lambda: caresync.db.engine, refresh_interval=0)
+        assert other.is_revoked(token_id(token))
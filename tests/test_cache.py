@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from cache import MemoryResponseCache, SQLiteResponseCache, SingleFlight, TTLCache, make_cache_key
+
+
+def test_cache_key_ignores_case_spacing_and_punctuation():
+    assert make_cache_key("Can I take  Metformin?", "ctx") == make_cache_key("can i take metformin", "ctx")
+    assert make_cache_key("Can I take Metformin?", "ctx") != make_cache_key("Can I take Metformin?", "other")
+
+
+def test_ttl_cache_expires_and_bounds_entries():
+    cache = TTLCache(max_entries=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2 and len(cache) == 2
+    cache.set('d', 4, ttl=10)
+    time.sleep(0.06)
+    assert cache.get('c') is None
+    assert cache.get('d') == 4
+    cache.delete('d')
+    assert cache.get('d', 'gone') == 'gone'
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryResponseCache(max_entries=2, ttl=60)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_sqlite_cache_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'llm_cache.db')
+    SQLiteResponseCache(path).set('k', 'answer')
+    assert SQLiteResponseCache(path).get('k') == 'answer'
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('key', work))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["saved_calls"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert calls == [1]
+    assert results == ['result'] * 5
+    assert flight.stats() == {"in_flight": 0, "saved_calls": 4}
+
+
+def test_single_flight_shares_the_error():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        flight.do('key', fail)
+    # Nothing is left behind for the next caller
+    assert flight.do('key', lambda: 'ok') == 'ok'
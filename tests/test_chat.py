@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import app as caresync
+from app import Chatbot, db
+
+
+def ask(client, patient_id, text, **extra):
+    response = client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id, **extra})
+    assert response.status_code == 200, response.get_json()
+    return response
+
+
+def test_follow_up_sees_the_conversation(client, patient_id):
+    first = ask(client, patient_id, 'I have a headache').get_json()
+    follow_up = ask(client, patient_id, 'Should I worry?', chat_id=first["chat_id"]).get_json()
+    assert follow_up["chat_id"] == first["chat_id"]
+
+    history = client.get(f"/api/chat_history?chat_id={first['chat_id']}").get_json()["history"]
+    assert [turn["parts"][0]["text"] for turn in history if turn["role"] == 'user'] == \
+        ['I have a headache', 'Should I worry?']
+
+
+def test_chat_turns_follow_time_not_id(app, client, patient_id):
+    # Another worker's id block can give a later turn a lower id
+    chat_id = ask(client, patient_id, 'Hello').get_json()["chat_id"]
+    caresync.write_behind.sync()
+    start = datetime.utcnow() + timedelta(seconds=1)
+    with app.app_context():
+        for n, (query_id, text) in enumerate([(900, 'First question'), (300, 'Second question'), (600, 'Third question')]):
+            caresync.db.session.execute(caresync.Query.__table__.insert().values(
+                query_id=query_id, chat_id=chat_id, patient_id=patient_id, query_text=text,
+                response=f'Answer to {text}', query_status='Pending', created_at=start + timedelta(seconds=n)
+            ))
+        caresync.db.session.commit()
+
+    history = client.get(f'/api/chat_history?chat_id={chat_id}&limit=2').get_json()
+    assert [turn["parts"][0]["text"] for turn in history["history"] if turn["role"] == 'user'] == \
+        ['Hello', 'First question']
+    rest = client.get(f'/api/chat_history?chat_id={chat_id}&after={history["next_cursor"]}').get_json()
+    assert [turn["parts"][0]["text"] for turn in rest["history"] if turn["role"] == 'user'] == \
+        ['Second question', 'Third question']
+
+    app.config['CHAT_CONTEXT_MAX_TURNS'] = 2
+    with app.app_context():
+        context = caresync.build_chat_context(chat_id)
+    summary, recent = context.split("Recent conversation:\n")
+    assert 'Hello' in summary and 'First question' in summary
+    assert recent.index('Second question') < recent.index('Third question')
+
+def test_older_turns_are_summarized_once(app, client, patient_id, monkeypatch):
+    # Room for about two turns verbatim; older ones go to the rolling summary
+    app.config.update(CHAT_CONTEXT_TOKENS=100, CHAT_SUMMARY_TOKENS=60)
+    folded = []
+    summarize_turns = caresync.summarize_turns
+    monkeypatch.setattr(caresync, 'summarize_turns', lambda summary, turns: (
+        folded.append([turn.query_text for turn in turns]) or summarize_turns(summary, turns)))
+
+    chat_id = ask(client, patient_id, 'Question 0').get_json()["chat_id"]
+    for n in range(1, 5):
+        ask(client, patient_id, f'Question {n}', chat_id=chat_id)
+    caresync.write_behind.sync()
+    with app.app_context():
+        context = caresync.build_chat_context(chat_id)
+        summary, recent = context.split("Recent conversation:\n")
+        assert 'Question 0' in summary and 'Question 2' in summary and 'Question 3' not in summary
+        assert 'Patient: Question 3' in recent and 'Patient: Question 4' in recent
+        saved = db.session.get(Chatbot, chat_id)
+        assert saved.context_summary == summary.split("\n", 1)[1].rstrip("\n")
+
+    # Each turn was folded in once, when it slid out of the window
+    assert [text for turns in folded for text in turns] == ['Question 0', 'Question 1', 'Question 2']
+
+
+def test_chat_history_parameters(client, patient_id):
+    assert client.get('/api/chat_history').status_code == 400
+    chat_id = ask(client, patient_id, 'Hello').get_json()["chat_id"]
+    assert client.get(f'/api/chat_history?chat_id={chat_id}&after=12345').status_code == 400
+    history = client.get(f'/api/chat_history?session_id={chat_id}').get_json()
+    assert [turn["role"] for turn in history["history"]] == ['user', 'assistant']
+    assert history["next_cursor"] is None
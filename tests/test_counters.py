@@ -0,0 +1,98 @@
+import threading
+
+import app as caresync
+from app import DbCounter, Query, db
+
+
+def ask(client, patient_id, text):
+    response = client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def counters():
+    return dict(db.session.execute(db.select(DbCounter.name, DbCounter.value)).all())
+
+
+def test_summary_counters_follow_writes(client, patient_id):
+    ask(client, patient_id, 'First question')
+    ask(client, patient_id, 'Second question')
+    caresync.write_behind.sync()
+    summary = client.get('/api/db-summary').get_json()
+    assert summary["total_patients"] == 1 and summary["total_users"] == 1
+    assert summary["total_queries"] == 2 and summary["pending_queries"] == 2
+
+    with client.application.app_context():
+        assert caresync.reconcile_counters()['total_queries'] == 2
+
+
+def test_only_one_worker_holds_the_reconciler_lock(app):
+    with app.app_context():
+        assert caresync.hold_maintenance_lock('reconcile-counters', 'worker-1', ttl=60)
+        assert not caresync.hold_maintenance_lock('reconcile-counters', 'worker-2', ttl=60)
+        # The holder renews its lease
+        assert caresync.hold_maintenance_lock('reconcile-counters', 'worker-1', ttl=0)
+        # Once it lapses another worker takes over
+        assert caresync.hold_maintenance_lock('reconcile-counters', 'worker-2', ttl=60)
+        assert not caresync.hold_maintenance_lock('reconcile-counters', 'worker-1', ttl=60)
+
+
+def test_reconcile_waits_for_a_write_in_progress(app, client, patient_id):
+    with app.app_context():
+        conn = caresync.db.engine.connect()
+        writer = conn.begin()
+        conn.execute(caresync.User.__table__.insert().values(is_patient=False, is_clinician=False, password_hash='x'))
+        caresync.bump_counters(conn, {"total_users": 1})
+
+    counts = []
+
+    def reconcile():
+        with app.app_context():
+            counts.append(caresync.reconcile_counters())
+
+    thread = threading.Thread(target=reconcile)
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+    writer.commit()
+    conn.close()
+    thread.join(5)
+    assert counts[0]["total_users"] == 2
+    assert client.get('/api/db-summary').get_json()["total_users"] == 2
+
+def test_session_writes_move_the_counters(app, client, patient_id):
+    query_id = ask(client, patient_id, 'First question')["query_id"]
+    with app.app_context():
+        query = db.session.get(Query, query_id)
+        query.query_status = 'Verified'
+        db.session.commit()
+        assert counters()['status:Pending'] == 0 and counters()['status:Verified'] == 1
+
+        db.session.delete(query)
+        db.session.commit()
+        assert counters()['total_queries'] == 0 and counters()['status:Verified'] == 0
+
+        # A rolled-back flush leaves them as they were
+        db.session.add(Query(query_text='Never saved', patient_id=patient_id))
+        db.session.flush()
+        db.session.rollback()
+        assert counters()['total_queries'] == 0 and counters()['status:Pending'] == 0
+
+
+def test_reconcile_corrects_drift(app, patient_id):
+    with app.app_context():
+        db.session.execute(DbCounter.__table__.update().where(DbCounter.name == 'total_patients').values(value=40))
+        db.session.add(DbCounter(name='status:Gone', value=3))
+        db.session.commit()
+        caresync.reconcile_counters()
+        assert counters()['total_patients'] == 1 and 'status:Gone' not in counters()
+
+
+def test_reconcile_counters_command(app, patient_id):
+    with app.app_context():
+        db.session.execute(DbCounter.__table__.update().values(value=0))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['reconcile-counters'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert counters()['total_patients'] == 1 and counters()['total_users'] == 1
@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+
+import pytest
+
+import app as caresync
+
+
+@pytest.fixture
+def app_config():
+    # Several fetch batches even for a handful of rows
+    return {"EXPORT_BATCH_SIZE": 2}
+
+
+@pytest.fixture
+def query_ids(client, patient_id):
+    ids = [client.post('/api/ai_query', json={"query_text": f'Question {n}', "patient_id": patient_id})
+           .get_json()["query_id"] for n in range(5)]
+    caresync.write_behind.sync()
+    return ids
+
+
+def test_queries_export_as_ndjson(client, patient_id, query_ids):
+    response = client.get(f'/api/export/queries?patient_id={patient_id}&status=Pending')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=queries.ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["query_id"] for row in rows] == query_ids
+    assert rows[0]["query_text"] == 'Question 0' and rows[0]["created_at"]
+
+    assert client.get('/api/export/queries?status=Verified').get_data(as_text=True) == ''
+    assert client.get(f'/api/export/queries?patient_id={patient_id + 1}').get_data(as_text=True) == ''
+
+
+def test_queries_export_as_csv(client, query_ids):
+    response = client.get('/api/export/queries?format=csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row["query_id"]) for row in rows] == query_ids
+    assert rows[-1]["query_text"] == 'Question 4'
+
+
+def test_patients_export(client, patient_id):
+    rows = [json.loads(line) for line in client.get('/api/export/patients').get_data(as_text=True).splitlines()]
+    assert [(row["patient_id"], row["full_name"]) for row in rows] == [(patient_id, 'Asha Rao')]
+
+
+def test_bad_export_parameters_are_rejected(client):
+    for url in ('/api/export/users', '/api/export/queries?format=xml',
+                '/api/export/queries?created_after=yesterday', '/api/export/queries?patient_id=abc'):
+        response = client.get(url)
+        assert response.status_code == 400, url
+        assert response.get_json()["error"]
+
+
+def test_cli_export(app, patient_id, query_ids, tmp_path):
+    output = tmp_path / 'pending.csv'
+    result = app.test_cli_runner().invoke(args=['export', 'queries', '--format', 'csv', '--status', 'Pending',
+                                                '-o', str(output)])
+    assert result.exit_code == 0, result.output
+    assert len(output.read_text().splitlines()) == len(query_ids) + 1
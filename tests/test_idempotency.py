@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+import app as caresync
+from app import IdempotencyKey
+from idempotency import CLAIMED, COMPLETED, IN_FLIGHT, MISMATCH, IdempotencyStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    IdempotencyKey.__table__.create(engine)
+    yield IdempotencyStore(IdempotencyKey.__table__, lambda: engine, ttl=60, lease=60, poll_interval=0.01)
+    engine.dispose()
+
+
+def test_first_request_claims_and_retries_replay(store):
+    assert store.claim('scope', 'key', 'body') == (CLAIMED, None)
+    assert store.claim('scope', 'key', 'body')[0] == IN_FLIGHT
+    store.complete('scope', 'key', 201, {"Content-Type": 'application/json'}, b'{"id": 1}')
+    outcome, row = store.claim('scope', 'key', 'body')
+    assert outcome == COMPLETED
+    assert (row.response_status, row.response_body) == (201, b'{"id": 1}')
+
+
+def test_key_reused_for_another_body_is_a_mismatch(store):
+    store.claim('scope', 'key', 'body')
+    assert store.claim('scope', 'key', 'other body')[0] == MISMATCH
+    # Keys are per scope
+    assert store.claim('other scope', 'key', 'other body')[0] == CLAIMED
+
+
+def test_released_claim_runs_again(store):
+    store.claim('scope', 'key', 'body')
+    store.release('scope', 'key')
+    assert store.claim('scope', 'key', 'body')[0] == CLAIMED
+
+
+def test_abandoned_claim_is_taken_over_after_its_lease(store):
+    store.lease = 0.05
+    store.claim('scope', 'key', 'body')
+    time.sleep(0.1)
+    assert store.claim('scope', 'key', 'body')[0] == CLAIMED
+
+
+def test_waiter_gets_the_completed_response(store):
+    store.claim('scope', 'key', 'body')
+    finisher = threading.Timer(0.05, store.complete, ('scope', 'key', 200, {}, b'done'))
+    finisher.start()
+    outcome, row = store.wait('scope', 'key', 'body', timeout=2)
+    finisher.join()
+    assert outcome == COMPLETED and row.response_body == b'done'
+
+
+def test_wait_gives_up_while_still_in_flight(store):
+    store.claim('scope', 'key', 'body')
+    assert store.wait('scope', 'key', 'body', timeout=0.05)[0] == IN_FLIGHT
+
+
+def test_ai_query_retry_is_replayed(client, patient_id):
+    body = {"query_text": 'Can I take Metformin with food?', "patient_id": patient_id}
+    headers = {"Idempotency-Key": 'retry-1'}
+    first = client.post('/api/ai_query', json=body, headers=headers)
+    calls = caresync.llm_client.backend.calls
+    caresync.response_cache.clear()
+    retry = client.post('/api/ai_query', json=body, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json()["query_id"] == first.get_json()["query_id"]
+    assert caresync.llm_client.backend.calls == calls
+
+    changed = client.post('/api/ai_query', json={**body, "query_text": 'Something else'}, headers=headers)
+    assert changed.status_code == 422
+    assert client.post('/api/ai_query', json=body, headers={"Idempotency-Key": ''}).status_code == 400
@@ -0,0 +1,77 @@
+import json
+from datetime import date
+
+import app as caresync
+from app import Patient, User, db
+
+PATIENTS_CSV = """full_name,dob,gender,email,password,aadhar_number,diabetes
+Meera Iyer,1990-02-03,Female,meera@example.com,pw1,222233334444,true
+Karan Shah,1985-11-30,Male,karan@example.com,pw2,333344445555,false
+No Password,1970-01-01,Male,nopw@example.com,,444455556666,false
+"""
+
+
+def test_csv_import_inserts_valid_rows_and_reports_the_rest(client):
+    response = client.post('/api/patients/import', data=PATIENTS_CSV, content_type='text/csv')
+    assert response.status_code == 207
+    report = response.get_json()
+    assert report["imported"] == 2
+    assert report["errors"] == [{"row": 4, "error": 'password is required'}]
+
+    patients = client.get('/api/patients?fields=patient_id,email').get_json()["patients"]
+    assert [patient["email"] for patient in patients] == ['meera@example.com', 'karan@example.com']
+    assert client.get('/api/db-summary').get_json()["total_patients"] == 2
+
+    # The profile carries a Last-Modified from the defaulted updated_at
+    profile = client.get(f"/api/patients/{patients[0]['patient_id']}")
+    assert profile.status_code == 200 and profile.headers['Last-Modified']
+
+    # Importing the same file again rejects every row as a duplicate
+    again = client.post('/api/patients/import', data=PATIENTS_CSV, content_type='text/csv').get_json()
+    assert again["imported"] == 0 and again["failed"] == 3
+
+
+def test_ndjson_import_of_clinicians(client):
+    rows = [
+        {"full_name": 'Dr. Rao', "email": 'rao@example.com', "phone": '555-0101', "password": 'pw',
+         "medical_reg_number": 'MRN-1', "specialization": 'Cardiology', "years_of_experience": 12,
+         "aadhar_number": '555566667777'},
+        {"full_name": 'Dr. Das', "email": 'das@example.com', "phone": '555-0102', "password": 'pw',
+         "medical_reg_number": 'MRN-2', "specialization": 'Oncology', "years_of_experience": 'many',
+         "aadhar_number": '666677778888'},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+    response = client.post('/api/clinicians/import', data=body, content_type='application/x-ndjson')
+    report = response.get_json()
+    assert response.status_code == 207 and report["imported"] == 1
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+    assert client.post('/api/login', json={"email": 'rao@example.com', "password": 'pw'}).get_json()["success"]
+
+
+def test_row_that_loses_a_race_is_reported_and_the_rest_imported(app, client, monkeypatch):
+    hash_passwords = caresync.hash_passwords
+
+    def hash_while_another_writer_commits(passwords):
+        # Another request takes Karan's email after the batch's duplicate check passed
+        with app.app_context(), db.engine.begin() as conn:
+            user_id = conn.execute(User.__table__.insert().values(
+                is_patient=True, is_clinician=False, password_hash='x')).inserted_primary_key[0]
+            conn.execute(Patient.__table__.insert().values(
+                user_id=user_id, full_name='Karan S.', dob=date(1985, 11, 30), gender='Male',
+                email='karan@example.com'))
+        return hash_passwords(passwords)
+
+    monkeypatch.setattr(caresync, 'hash_passwords', hash_while_another_writer_commits)
+    response = client.post('/api/patients/import', data=PATIENTS_CSV, content_type='text/csv')
+    report = response.get_json()
+    assert response.status_code == 207 and report["imported"] == 1
+    assert [error["row"] for error in report["errors"]] == [3, 4]
+    assert 'UNIQUE' in report["errors"][0]["error"]
+
+    with app.app_context():
+        emails = db.session.execute(db.select(Patient.email).order_by(Patient.patient_id)).scalars().all()
+        assert emails == ['karan@example.com', 'meera@example.com']
+        # The failed row's user was rolled back with its savepoint
+        assert db.session.query(User).count() == 2
+    # Only the imported row was counted (the racing insert bypassed the counters)
+    assert client.get('/api/db-summary').get_json()["total_patients"] == 1
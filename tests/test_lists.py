@@ -0,0 +1,74 @@
+import app as caresync
+
+
+def ask(client, patient_id, text):
+    response = client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def add_patient(client, number):
+    response = client.post('/api/patients', json={
+        "full_name": f'Patient {number}', "dob": '1990-01-01', "gender": 'Female', "password": 'pw',
+        "email": f'patient{number}@example.com', "aadhar_number": f'55550000{number:04d}'
+    })
+    assert response.status_code == 201
+    return response.get_json()["patient_id"]
+
+
+def test_list_endpoints_page_with_a_cursor(client, patient_id):
+    for n in range(5):
+        ask(client, patient_id, f'Question {n}')
+    caresync.write_behind.sync()
+    first = client.get(f'/api/patients/{patient_id}/queries?limit=2&fields=query_id,query_text')
+    assert [row["query_text"] for row in first.get_json()] == ['Question 0', 'Question 1']
+    assert set(first.get_json()[0]) == {'query_id', 'query_text'}
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'/api/patients/{patient_id}/queries?limit=2&fields=query_text&after={cursor}')
+    assert [row["query_text"] for row in second.get_json()] == ['Question 2', 'Question 3']
+    assert client.get(f'/api/patients/{patient_id}/queries?fields=password').status_code == 400
+
+
+def test_query_list_filters_and_dashboard_view(client, patient_id):
+    ask(client, patient_id, 'First question')
+    ask(client, patient_id, 'Second question')
+    caresync.write_behind.sync()
+
+    everything = client.get('/api/queries').get_json()
+    assert len(everything) == 2 and 'query_status' in everything[0]
+
+    history = client.get(f'/api/queries?patientId={patient_id}&order=desc').get_json()
+    assert [row["query_text"] for row in history] == ['Second question', 'First question']
+    assert set(history[0]) == {'query_id', 'query_text', 'response', 'status', 'created_at'}
+
+    assert client.get(f'/api/queries?patient_id={patient_id + 1}').get_json() == []
+    assert len(client.get('/api/queries?status=Pending').get_json()) == 2
+    assert client.get('/api/queries?patientId=abc').status_code == 400
+
+def test_pages_cover_every_row_once_in_either_order(client):
+    ids = [add_patient(client, n) for n in range(5)]
+    for order, expected in (('asc', ids), ('desc', ids[::-1])):
+        seen, url = [], f'/api/patients?limit=2&order={order}&fields=patient_id'
+        while url:
+            page = client.get(url)
+            body = page.get_json()
+            seen += [row["patient_id"] for row in body["patients"]]
+            assert body["next_cursor"] == page.headers.get('X-Next-Cursor')
+            url = page.headers['Link'].split('>')[0].lstrip('<') if body["next_cursor"] else None
+        assert seen == expected
+
+
+def test_projection_selects_only_the_requested_columns(client, clinician_ids):
+    rows = client.get('/api/clinicians?fields=clinician_id, full_name').get_json()
+    assert [set(row) for row in rows] == [{'clinician_id', 'full_name'}] * 2
+    users = client.get('/api/users').get_json()
+    assert users and all('password_hash' not in row for row in users)
+
+
+def test_bad_list_parameters_are_rejected(client, patient_id):
+    for args in ('fields=password_hash', 'fields=patient_id,nope', 'limit=0', 'limit=x', 'order=sideways',
+                 'after=abc'):
+        response = client.get(f'/api/patients?{args}')
+        assert response.status_code == 400, args
+        assert response.get_json()["error"]
+    assert client.get('/api/users?fields=password_hash').status_code == 400
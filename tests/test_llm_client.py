@@ -0,0 +1,172 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import (CircuitBreaker, CircuitOpen, FakeBackend, LLMClient, LLMError, LLMTimeout, TokenBucket,
+                        create_llm_backend)
+
+
+class TrackingBackend(FakeBackend):
+    """FakeBackend that records how many calls run at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def generate(self, prompt, timeout=None):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            return super().generate(prompt, timeout)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class SlowFirstBackend(FakeBackend):
+    """The first call hangs for `first_latency` seconds, later ones answer at once."""
+
+    def __init__(self, first_latency):
+        super().__init__(latency=0)
+        self.first_latency = first_latency
+
+    def generate(self, prompt, timeout=None):
+        if self.calls == 0:
+            self.calls += 1
+            time.sleep(self.first_latency)
+            return super().generate(prompt, timeout)
+        return super().generate(prompt, timeout)
+
+
+def test_fake_backend_answers_the_user_query():
+    client = LLMClient(create_llm_backend('fake', fake_latency=0), hedge_after=0)
+    response = client.generate("You are a medical assistant.\nUser query: Can I take Metformin with food?")
+    assert response.text == "This is a simulated response to: Can I take Metformin with food?"
+    assert client.stats()["succeeded"] == 1
+
+
+def test_concurrency_is_capped():
+    backend = TrackingBackend(latency=0.05)
+    client = LLMClient(backend, max_concurrency=2, rate_per_minute=0, timeout=5, hedge_after=0)
+    threads = [threading.Thread(target=client.generate, args=(f"User query: {n}",)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.calls == 8
+    assert backend.peak == 2
+    assert client.stats()["succeeded"] == 8
+
+
+def test_deadline_raises_timeout():
+    client = LLMClient(FakeBackend(latency=0.5), rate_per_minute=0, timeout=0.1, hedge_after=0)
+    started = time.monotonic()
+    with pytest.raises(LLMTimeout):
+        client.generate("User query: slow")
+    assert time.monotonic() - started < 0.4
+    assert client.stats()["timed_out"] == 1
+
+
+def test_slow_call_is_hedged():
+    backend = SlowFirstBackend(first_latency=1.0)
+    client = LLMClient(backend, rate_per_minute=0, timeout=5, hedge_after=0.05)
+    started = time.monotonic()
+    response = client.generate("User query: hedge me")
+    assert time.monotonic() - started < 0.5
+    assert response.text.endswith("hedge me")
+    assert client.stats()["hedged"] == 1
+
+
+def test_abandoned_attempt_gives_back_its_slot_at_the_deadline():
+    backend = TrackingBackend(latency=5)
+    client = LLMClient(backend, max_concurrency=1, rate_per_minute=0, timeout=0.1, hedge_after=0)
+    with pytest.raises(LLMTimeout):
+        client.generate("User query: hangs")
+    # The backend call was given the deadline, so it ends and frees the only slot
+    time.sleep(0.1)
+    assert backend.running == 0
+    backend.latency = 0
+    assert client.generate("User query: next").text.endswith("next")
+
+
+def test_backend_call_gets_the_remaining_deadline():
+    timeouts = []
+    backend = FakeBackend(latency=0)
+    generate = backend.generate
+    backend.generate = lambda prompt, timeout=None: timeouts.append(timeout) or generate(prompt, timeout)
+    LLMClient(backend, rate_per_minute=0, timeout=2, hedge_after=0).generate("User query: hi")
+    assert 1.5 < timeouts[0] <= 2
+
+
+def test_rate_limit_bounds_calls():
+    bucket = TokenBucket(2, per=60)
+    assert bucket.acquire(0) and bucket.acquire(0)
+    assert not bucket.acquire(0)
+
+    client = LLMClient(FakeBackend(latency=0), rate_per_minute=1, timeout=0.1, hedge_after=0)
+    client.generate("User query: first")
+    with pytest.raises(LLMTimeout):
+        client.generate("User query: second")
+
+
+def test_circuit_breaker_opens_and_recovers():
+    backend = FakeBackend(latency=0, error_rate=1.0)
+    client = LLMClient(backend, rate_per_minute=0, timeout=1, hedge_after=0,
+                       breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.1))
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.generate("User query: fail")
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Open: rejected without reaching the upstream
+    with pytest.raises(CircuitOpen):
+        client.generate("User query: rejected")
+    assert backend.calls == 2
+
+    # After the reset timeout one trial call goes through and closes the circuit
+    time.sleep(0.15)
+    backend.error_rate = 0.0
+    assert client.generate("User query: trial").text.endswith("trial")
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_stream_yields_chunks():
+    backend = FakeBackend(latency=0, chunk_size=5)
+    client = LLMClient(backend, rate_per_minute=0, timeout=1)
+    chunks = [chunk.text for chunk in client.stream("User query: stream this")]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "This is a simulated response to: stream this"
+    assert client.stats()["succeeded"] == 1
+
+
+def test_abandoned_stream_stops_reading_the_upstream():
+    backend = FakeBackend(latency=0.5, chunk_size=5)
+    client = LLMClient(backend, max_concurrency=1, rate_per_minute=0, timeout=1)
+    stream = client.stream("User query: stream this")
+    next(stream)
+    stream.close()
+    time.sleep(0.15)
+    # The pump gave up after at most one more chunk and released the slot
+    assert client._slots.acquire(blocking=False)
+
+
+def test_stream_error_is_raised_and_counted():
+    client = LLMClient(FakeBackend(latency=0, error_rate=1.0), rate_per_minute=0, timeout=1)
+    with pytest.raises(LLMError):
+        list(client.stream("User query: broken"))
+    assert client.stats()["failed"] == 1
+    assert client.breaker.failures == 1
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, text
+
+import app as caresync
+from app import create_app, db, init_db
+from migrations import MIGRATIONS, run_migrations
+
+from conftest import TEST_CONFIG
+
+# Tables as an earlier release created them: without the columns later migrations add
+LEGACY_TABLES = {
+    'users': (),
+    'patients': ('updated_at',),
+    'clinicians': ('updated_at',),
+    'chatbot': ('context_summary', 'summary_through_query_id'),
+    'queries': ('answer_source', 'source_query_id', 'claimed_by', 'lease_expires_at'),
+    'verified_answers': ('patient_id',),
+}
+
+
+def create_legacy_database(url):
+    engine = create_engine(url)
+    legacy = MetaData()
+    for name, added in LEGACY_TABLES.items():
+        Table(name, legacy, *[Column(column.name, column.type, primary_key=column.primary_key)
+                              for column in db.metadata.tables[name].columns if column.name not in added])
+    legacy.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO patients (patient_id, full_name, dob, gender) "
+                          "VALUES (7, 'Asha Rao', '1980-05-17', 'Female')"))
+        conn.execute(text("INSERT INTO queries (query_id, patient_id, query_text, response, query_status, created_at) "
+                          "VALUES (1, 7, 'I have asthma, can I run?', 'Warm up first.', 'Verified', :now)"),
+                     {"now": datetime.utcnow()})
+        conn.execute(text("INSERT INTO verified_answers (answer_id, query_id, question, answer, verified_at) "
+                          "VALUES (1, 1, 'I have asthma, can I run?', 'Warm up first.', :now)"),
+                     {"now": datetime.utcnow()})
+    engine.dispose()
+
+
+def test_existing_database_is_brought_up_to_date(tmp_path):
+    url = f"sqlite:///{tmp_path / 'caresync.db'}"
+    create_legacy_database(url)
+    app = create_app({**TEST_CONFIG, "SQLALCHEMY_DATABASE_URI": url})
+    try:
+        assert init_db(app)
+        with app.app_context():
+            inspector = inspect(db.engine)
+            assert {'answer_source', 'claimed_by', 'lease_expires_at'} <= \
+                {column['name'] for column in inspector.get_columns('queries')}
+            assert 'updated_at' in {column['name'] for column in inspector.get_columns('patients')}
+            indexes = {index['name'] for index in inspector.get_indexes('queries')}
+            assert 'ix_queries_chat_id_created_at_query_id' in indexes and 'ix_queries_chat_id_query_id' not in indexes
+            assert 'ix_verified_answers_verified_at' in {index['name'] for index in inspector.get_indexes('verified_answers')}
+
+            versions = db.session.execute(text("SELECT version FROM schema_migrations")).scalars().all()
+            assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+            # Backfilled from the existing rows
+            assert db.session.execute(text("SELECT patient_id FROM verified_answers")).scalar() == 7
+            assert db.session.execute(text("SELECT updated_at FROM patients")).scalar() is not None
+            # Running them again does nothing
+            assert run_migrations(db.engine) == []
+
+        client = app.test_client()
+        assert client.get('/api/db-summary').get_json()["total_queries"] == 1
+        assert [row["query_id"] for row in client.get('/api/queries/search?q=asthma').get_json()] == [1]
+        assert caresync.verified_answers.match('I have asthma, can I run?', scope=7)[1] == 'Warm up first.'
+    finally:
+        caresync.write_behind.close()
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
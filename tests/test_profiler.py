@@ -0,0 +1,43 @@
+import logging
+
+from sqlalchemy import create_engine, text
+
+from profiler import SQLProfiler, is_full_scan, statement_shape
+
+
+def profiled_engine(**kwargs):
+    engine = create_engine('sqlite://')
+    profiler = SQLProfiler(logging.getLogger('test-profiler'), **kwargs)
+    profiler.attach(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE queries (query_id INTEGER PRIMARY KEY, patient_id INTEGER, query_text TEXT)"))
+    return engine, profiler
+
+
+def test_statement_shape_folds_literals():
+    assert statement_shape("SELECT * FROM queries WHERE query_id IN (?, ?, ?) AND query_text = 'x'") == \
+        "SELECT * FROM queries WHERE query_id IN (...) AND query_text = ?"
+    assert is_full_scan(['SCAN queries']) and not is_full_scan(['SEARCH queries USING INTEGER PRIMARY KEY (rowid=?)'])
+
+
+def test_repeated_statement_is_flagged_as_n_plus_one():
+    engine, profiler = profiled_engine(slow_ms=1000, repeat_threshold=3)
+    profiler.begin('list_queries')
+    with engine.connect() as conn:
+        for query_id in range(3):
+            conn.execute(text("SELECT query_text FROM queries WHERE query_id = :id"), {"id": query_id})
+    profiler.end()
+    report = profiler.report()["endpoints"]["list_queries"]
+    assert report["requests"] == 1 and report["statements"] == 3
+    assert report["n_plus_one"][0]["max_repeats"] == 3
+
+
+def test_slow_statements_keep_their_plan_for_at_most_max_shapes():
+    engine, profiler = profiled_engine(slow_ms=0, max_shapes=2)
+    with engine.connect() as conn:
+        for column in ('query_id', 'patient_id', 'query_text'):
+            conn.execute(text(f"SELECT * FROM queries WHERE {column} = 1"))
+    slow = profiler.report()["slow_statements"]
+    assert len(slow) == 2 and len(profiler._plans) == 2
+    assert any(record["full_scan"] for record in slow)
+    assert all("query_id" not in record["statement"].split('WHERE')[1] for record in slow)
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import app as caresync
+from app import Clinician, Patient, db
+
+
+def test_profile_304_and_invalidation_after_commit(app, client, patient_id):
+    first = client.get(f'/api/patients/{patient_id}')
+    assert first.get_json()["full_name"] == 'Asha Rao'
+    assert client.get(f'/api/patients/{patient_id}', headers={"If-None-Match": first.headers['ETag']}).status_code == 304
+
+    with app.app_context():
+        patient = db.session.get(Patient, patient_id)
+        patient.full_name = 'Asha R. Rao'
+        db.session.flush()
+        # Flushed but not committed: the cached profile is still the committed one
+        assert caresync.profile_cache.get(('patients', patient_id)) is not None
+        db.session.commit()
+        assert caresync.profile_cache.get(('patients', patient_id)) is None
+
+    second = client.get(f'/api/patients/{patient_id}')
+    assert second.get_json()["full_name"] == 'Asha R. Rao'
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_rolled_back_write_keeps_the_cached_profile(app, client, patient_id):
+    client.get(f'/api/patients/{patient_id}')
+    with app.app_context():
+        db.session.get(Patient, patient_id).full_name = 'Never saved'
+        db.session.flush()
+        db.session.rollback()
+    assert caresync.profile_cache.get(('patients', patient_id)) is not None
+    assert client.get(f'/api/patients/{patient_id}').get_json()["full_name"] == 'Asha Rao'
+
+
+def test_other_workers_writes_are_seen_after_revalidation(app, client, patient_id):
+    client.get(f'/api/patients/{patient_id}')
+    # A write by another worker process: this one's cache never hears about it
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(Patient.__table__.update().where(Patient.patient_id == patient_id)
+                     .values(full_name='Changed elsewhere', updated_at=datetime(2030, 1, 1)))
+    assert client.get(f'/api/patients/{patient_id}').get_json()["full_name"] == 'Asha Rao'
+
+    app.config['PROFILE_CACHE_TTL'] = 0
+    refreshed = client.get(f'/api/patients/{patient_id}')
+    assert refreshed.get_json()["full_name"] == 'Changed elsewhere'
+    assert refreshed.headers['Last-Modified'] == 'Tue, 01 Jan 2030 00:00:00 GMT'
+
+
+def test_load_that_races_an_invalidation_is_not_cached(app, client, patient_id, monkeypatch):
+    load_profile = caresync.load_profile
+
+    def racing_load(*args):
+        profile = load_profile(*args)
+        caresync.invalidate_profile(('patients', patient_id))
+        return profile
+
+    monkeypatch.setattr(caresync, 'load_profile', racing_load)
+    assert client.get(f'/api/patients/{patient_id}').status_code == 200
+    assert caresync.profile_cache.get(('patients', patient_id)) is None
+
+
+def test_clinician_profile_revalidation(app, client, clinician_ids):
+    first_id, _ = clinician_ids
+    url = f'/api/clinicians/{first_id}'
+    first = client.get(url)
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    assert 'password_hash' not in first.get_json()
+    assert client.get(url).headers['ETag'] == first.headers['ETag']
+    assert client.get(url, headers={"If-Modified-Since": first.headers['Last-Modified']}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    with app.app_context():
+        db.session.get(Clinician, first_id).specialization = 'Cardiology'
+        db.session.commit()
+    changed = client.get(url, headers={"If-None-Match": first.headers['ETag']})
+    assert changed.status_code == 200 and changed.get_json()["specialization"] == 'Cardiology'
+    assert client.get('/api/clinicians/999').status_code == 404
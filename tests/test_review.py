@@ -0,0 +1,79 @@
+import app as caresync
+
+
+def answered_query(client, patient_id, text='Can I take Metformin with food?'):
+    body = client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id}).get_json()
+    caresync.write_behind.sync()
+    return body["query_id"]
+
+
+def test_claim_is_exclusive_until_released(client, patient_id, clinician_ids):
+    first, second = clinician_ids
+    query_id = answered_query(client, patient_id)
+
+    claim = client.post('/api/review/claim', json={"clinician_id": first})
+    assert claim.status_code == 200 and claim.get_json()["query_id"] == query_id
+    assert client.post('/api/review/claim', json={"clinician_id": second, "query_id": query_id}).status_code == 409
+    assert client.post('/api/review/claim', json={"clinician_id": second}).status_code == 204
+    assert client.post('/api/verify_response', json={"query_id": query_id, "clinician_id": second}).status_code == 409
+
+    assert client.post(f'/api/review/{query_id}/renew', json={"clinician_id": first}).status_code == 200
+    assert client.post(f'/api/review/{query_id}/renew', json={"clinician_id": second}).status_code == 409
+    assert client.post(f'/api/review/{query_id}/release', json={"clinician_id": first}).status_code == 200
+    assert client.post('/api/review/claim', json={"clinician_id": second}).get_json()["query_id"] == query_id
+
+
+def test_expired_lease_can_be_claimed_by_someone_else(app, client, patient_id, clinician_ids):
+    first, second = clinician_ids
+    query_id = answered_query(client, patient_id)
+    app.config['REVIEW_LEASE_SECONDS'] = 0
+    assert client.post('/api/review/claim', json={"clinician_id": first}).status_code == 200
+    claim = client.post('/api/review/claim', json={"clinician_id": second, "query_id": query_id})
+    assert claim.status_code == 200 and claim.get_json()["claimed_by"] == second
+
+
+def test_verified_answer_leaves_the_queue(client, patient_id, clinician_ids):
+    first, _ = clinician_ids
+    query_id = answered_query(client, patient_id)
+    client.post('/api/review/claim', json={"clinician_id": first, "query_id": query_id})
+    verified = client.post('/api/edit_response', json={
+        "query_id": query_id, "clinician_id": first, "response": 'Yes, take it with meals.'
+    })
+    assert verified.get_json()["query_status"] == 'Verified'
+    assert client.get('/api/review/queue').get_json() == []
+    reviewed = client.get('/api/review/queue?status=Verified').get_json()
+    assert [(row["query_id"], row["answer_source"]) for row in reviewed] == [(query_id, 'edited')]
+
+    summary = client.get('/api/db-summary').get_json()
+    assert summary["pending_queries"] == 0 and summary["completed_queries"] == 1
+
+
+def test_verified_answer_is_reused_for_the_same_patient_only(client, patient_id, clinician_ids):
+    first, _ = clinician_ids
+    query_id = answered_query(client, patient_id, 'Can I take Metformin with food?')
+    client.post('/api/edit_response', json={
+        "query_id": query_id, "clinician_id": first, "response": 'Yes, with your meals, as Asha takes 500 mg.'
+    })
+
+    again = client.post('/api/ai_query', json={"query_text": 'can i take metformin with food', "patient_id": patient_id})
+    assert again.get_json()["answer_source"] == 'reused'
+
+    other = client.post('/api/patients', json={
+        "full_name": 'Ravi Kumar', "dob": '1975-01-02', "gender": 'Male', "password": 'pw', "email": 'ravi@example.com'
+    }).get_json()["patient_id"]
+    for patient in (other, None):
+        body = client.post('/api/ai_query', json={"query_text": 'can i take metformin with food', "patient_id": patient})
+        assert body.get_json()["answer_source"] == 'generated'
+
+
+def test_release_needs_the_lease_holder(client, patient_id, clinician_ids):
+    first, second = clinician_ids
+    unclaimed = answered_query(client, patient_id)
+    assert client.post(f'/api/review/{unclaimed}/release', json={}).status_code == 400
+    assert client.post(f'/api/review/{unclaimed}/renew', json={}).status_code == 400
+    assert client.post(f'/api/review/{unclaimed}/release', json={"clinician_id": first}).status_code == 409
+
+    client.post('/api/review/claim', json={"clinician_id": first, "query_id": unclaimed})
+    assert client.post(f'/api/review/{unclaimed}/release', json={"clinician_id": second}).status_code == 409
+    client.post('/api/verify_response', json={"query_id": unclaimed, "clinician_id": first})
+    assert client.post(f'/api/review/{unclaimed}/release', json={"clinician_id": first}).status_code == 409
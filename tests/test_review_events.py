@@ -0,0 +1,84 @@
+import logging
+import queue
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as caresync
+from app import ReviewEvent, db
+from broadcast import EventBroker
+
+
+@pytest.fixture
+def app_config():
+    return {"REVIEW_EVENTS_MAX_STREAMS": 1}
+
+
+@pytest.fixture
+def other_worker(app):
+    """A second broker over the same table, standing in for another worker process."""
+    broker = EventBroker(ReviewEvent.__table__, lambda: db.engine, logging.getLogger('test'), poll_interval=0.01)
+    broker.start(app.app_context)
+    subscriber = broker.subscribe()
+    # Let the poller find the newest event before anything happens
+    time.sleep(0.1)
+    yield subscriber
+    broker.unsubscribe(subscriber)
+
+
+def next_events(subscriber, count):
+    return [subscriber.get(timeout=2)[1:] for _ in range(count)]
+
+
+def test_events_reach_streams_in_other_workers(client, patient_id, clinician_ids, other_worker):
+    first, _ = clinician_ids
+    query_id = client.post('/api/ai_query', json={"query_text": 'Is ibuprofen safe?', "patient_id": patient_id}) \
+        .get_json()["query_id"]
+    caresync.write_behind.sync()
+    client.post('/api/review/claim', json={"clinician_id": first, "query_id": query_id})
+    client.post(f'/api/review/{query_id}/release', json={"clinician_id": first})
+    client.post('/api/verify_response', json={"query_id": query_id, "clinician_id": first})
+
+    assert next_events(other_worker, 4) == [
+        ('pending', {"query_id": query_id, "query_text": 'Is ibuprofen safe?'}),
+        ('claimed', {"query_id": query_id, "claimed_by": first}),
+        ('released', {"query_id": query_id}),
+        ('verified', {"query_id": query_id, "query_text": 'Is ibuprofen safe?'}),
+    ]
+
+
+def test_failed_release_announces_nothing(client, patient_id, clinician_ids, other_worker):
+    first, _ = clinician_ids
+    query_id = client.post('/api/ai_query', json={"query_text": 'Is ibuprofen safe?', "patient_id": patient_id}) \
+        .get_json()["query_id"]
+    caresync.write_behind.sync()
+    assert next_events(other_worker, 1)[0][0] == 'pending'
+    assert client.post(f'/api/review/{query_id}/release', json={"clinician_id": first}).status_code == 409
+    with pytest.raises(queue.Empty):
+        other_worker.get(timeout=0.2)
+
+
+def test_streams_per_worker_are_capped(client):
+    subscriber = caresync.review_events.subscribe()
+    try:
+        refused = client.get('/api/review/events')
+        assert refused.status_code == 503 and refused.headers['Retry-After']
+    finally:
+        caresync.review_events.unsubscribe(subscriber)
+
+
+def test_event_committed_after_a_higher_id_is_still_delivered(app, other_worker):
+    with app.app_context():
+        # Two workers' transactions took ids 5 and 6; the one holding 5 commits last
+        db.session.execute(ReviewEvent.__table__.insert().values(
+            event_id=6, event='pending', data={"query_id": 2}, created_at=datetime.utcnow()))
+        db.session.commit()
+        assert next_events(other_worker, 1) == [('pending', {"query_id": 2})]
+        db.session.execute(ReviewEvent.__table__.insert().values(
+            event_id=5, event='pending', data={"query_id": 1}, created_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        assert next_events(other_worker, 1) == [('pending', {"query_id": 1})]
+    # Each event is published once, however many polls reread it
+    with pytest.raises(queue.Empty):
+        other_worker.get(timeout=0.2)
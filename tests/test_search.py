@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from app import Query, db
+
+
+def add_queries(*rows):
+    db.session.execute(Query.__table__.insert(), [
+        {"query_text": text, "response": response, "query_status": 'Pending', "created_at": datetime.utcnow()}
+        for text, response in rows
+    ])
+    db.session.commit()
+
+
+def ids(response):
+    assert response.status_code == 200, response.get_json()
+    return [row["query_id"] for row in response.get_json()]
+
+
+@pytest.fixture
+def searchable(app):
+    with app.app_context():
+        add_queries(
+            ('Is it safe to run with asthma?', 'Warm up first and carry your inhaler.'),   # 1
+            ('What should I eat before exercise?', 'Runners with asthma should eat light.'),  # 2
+            ('Can I take Metformin with food?', 'Yes, take it with meals.'),                # 3
+        )
+
+
+def test_question_matches_rank_above_answer_matches(client, searchable):
+    assert ids(client.get('/api/queries/search?q=asthma')) == [1, 2]
+    row = client.get('/api/queries/search?q=asthma').get_json()[0]
+    assert '<mark>asthma</mark>' in row["query_snippet"] and row["score"] > 0
+
+
+def test_terms_are_stemmed_anded_and_quoted(client, searchable):
+    assert ids(client.get('/api/queries/search?q=running')) == [1]
+    assert ids(client.get('/api/queries/search?q=asthma inhaler')) == [1]
+    assert ids(client.get('/api/queries/search?q="take it with meals"')) == [3]
+    assert ids(client.get('/api/queries/search?q=metf*')) == [3]
+    # FTS5 syntax in the input is searched for as words, never parsed
+    assert ids(client.get('/api/queries/search?q=asthma OR NEAR("')) == []
+
+
+def test_pages_follow_the_cursor_in_both_orders(client, app):
+    with app.app_context():
+        add_queries(*[(f'Asthma question {n}', 'Answer') for n in range(5)])
+    for order in ('rank', 'recent'):
+        seen, url = [], f'/api/queries/search?q=asthma&limit=2&order={order}'
+        while url:
+            page = client.get(url)
+            seen += ids(page)
+            cursor = page.headers.get('X-Next-Cursor')
+            url = f'/api/queries/search?q=asthma&limit=2&order={order}&after={cursor}' if cursor else None
+        assert sorted(seen) == [1, 2, 3, 4, 5]
+        if order == 'recent':
+            assert seen == [5, 4, 3, 2, 1]
+
+
+def test_index_follows_answer_updates(client, app, searchable):
+    with app.app_context():
+        db.session.get(Query, 3).response = 'Take it with breakfast.'
+        db.session.commit()
+    assert ids(client.get('/api/queries/search?q=breakfast')) == [3]
+    assert ids(client.get('/api/queries/search?q=meals')) == []
+
+
+def test_bad_search_parameters_are_rejected(client, searchable):
+    for args in ('q=', 'q=%22%22', 'q=asthma&order=best', 'q=asthma&after=x', 'q=asthma&order=recent&after=x',
+                 'q=asthma&status=Pending&patient_id=abc'):
+        assert client.get(f'/api/queries/search?{args}').status_code == 400, args
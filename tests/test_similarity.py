@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import app as caresync
+from app import Query, VerifiedAnswer, db, load_verified_answers
+from similarity import SimilarityIndex, VerifiedAnswerIndex
+
+
+def test_similar_question_matches_within_its_group():
+    index = SimilarityIndex(dim=512)
+    index.add(1, 'Can I take Metformin with food?', 'with meals', group=7)
+    index.add(2, 'Is ibuprofen safe with asthma?', 'ask first')
+    key, score, payload = index.search('can i take metformin with my food', group=7)
+    assert (key, payload) == (1, 'with meals') and score > 0.75
+    assert index.search('Can I take Metformin with food?')[0] == 2
+    assert index.search('Can I take Metformin with food?', group=8) is None
+
+
+def test_workers_pick_up_answers_committed_out_of_id_order(app):
+    with app.app_context():
+        queries = [Query(query_text=text, query_status='Verified') for text in
+                   ('Can I take Metformin with food?', 'Is ibuprofen safe with asthma?')]
+        db.session.add_all(queries)
+        db.session.commit()
+        here, there = VerifiedAnswerIndex(refresh_interval=0), VerifiedAnswerIndex(refresh_interval=0)
+        for index in (here, there):
+            index.refresh(load_verified_answers, 0)
+
+        # This worker verifies with answer_id 2 while another worker's answer 1 is still uncommitted
+        mine = VerifiedAnswer(answer_id=2, query_id=queries[0].query_id, question=queries[0].query_text,
+                              answer='Yes, with meals.')
+        db.session.add(mine)
+        db.session.commit()
+        here.add(2, mine.query_id, mine.question, mine.answer)
+        db.session.add(VerifiedAnswer(answer_id=1, query_id=queries[1].query_id, question=queries[1].query_text,
+                                      answer='Ask your doctor first.',
+                                      verified_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        for index in (here, there):
+            index.refresh(load_verified_answers, 1)
+            assert index.match('Is ibuprofen safe with asthma?')[1] == 'Ask your doctor first.'
+            assert index.match('Can I take Metformin with food?')[1] == 'Yes, with meals.'
+
+
+def test_refresh_keeps_a_newer_answer_to_the_same_query(app):
+    with app.app_context():
+        query = Query(query_text='Can I take Metformin with food?', query_status='Verified')
+        db.session.add(query)
+        db.session.commit()
+        db.session.add(VerifiedAnswer(answer_id=1, query_id=query.query_id, question=query.query_text,
+                                      answer='Yes.'))
+        db.session.commit()
+
+        # The query was re-verified here after a refresh elsewhere had read the old row
+        index = VerifiedAnswerIndex(refresh_interval=0)
+        index.add(5, query.query_id, query.query_text, 'Yes, with meals.')
+        index.refresh(load_verified_answers, 0)
+        assert index.match(query.query_text)[1] == 'Yes, with meals.'
+        assert index.stats()["verified_answers"] == 1
+
+
+def test_close_question_is_answered_from_the_verified_answer(app, client, patient_id, clinician_ids):
+    def ask(text, **extra):
+        return client.post('/api/ai_query', json={"query_text": text, "patient_id": patient_id, **extra}).get_json()
+
+    first = ask('Can I take Metformin with food?')
+    caresync.write_behind.sync()
+    client.post('/api/verify_response', json={"query_id": first["query_id"], "clinician_id": clinician_ids[0]})
+
+    calls = caresync.llm_client.backend.calls
+    reused = ask('can I take metformin with my food?')
+    assert reused["answer_source"] == 'reused' and reused["response"] == first["response"]
+    assert caresync.llm_client.backend.calls == calls
+    caresync.write_behind.sync()
+    with app.app_context():
+        assert db.session.get(Query, reused["query_id"]).source_query_id == first["query_id"]
+
+    # Unrelated questions and follow-ups, which depend on the conversation, go to the LLM
+    assert ask('Is ibuprofen safe with asthma?')["answer_source"] == 'generated'
+    assert ask('Can I take Metformin with food?', chat_id=first["chat_id"])["answer_source"] == 'generated'
+    caresync.verified_answers.threshold = 0
+    assert ask('Can I take Metformin with food?')["answer_source"] == 'generated'
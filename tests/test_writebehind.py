@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from writebehind import IdAllocator, Insert, Update, WriteBehind
+
+log = logging.getLogger('test')
+QUERIES = SimpleNamespace(name='queries')
+
+
+class Recorder:
+    """apply() for WriteBehind that records each batch; writes marked bad make it fail."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, writes):
+        if any(write.values.get('bad') for write in writes):
+            raise ValueError("constraint failed")
+        self.batches.append([(write.kind, write.key, dict(write.values)) for write in writes])
+
+
+def insert(row_id, **values):
+    return Insert(QUERIES, ('queries', row_id), {"query_id": row_id, **values})
+
+
+def test_disabled_queue_writes_through():
+    apply = Recorder()
+    queue = WriteBehind(apply, log, max_delay=0)
+    queue.start()
+    queue.submit(insert(1))
+    assert apply.batches == [[('insert', ('queries', 1), {"query_id": 1})]]
+    assert queue.sync(('queries', 1))
+
+
+def test_writes_are_grouped_into_one_commit():
+    apply = Recorder()
+    queue = WriteBehind(apply, log, max_delay=0.05)
+    queue.start()
+    try:
+        for row_id in range(1, 6):
+            queue.submit(insert(row_id))
+        assert queue.sync(('queries', 5), timeout=2)
+        assert [len(batch) for batch in apply.batches] == [5]
+        assert queue.stats()["batches"] == 1
+    finally:
+        queue.close()
+
+
+def test_update_is_folded_into_a_queued_insert():
+    apply = Recorder()
+    committed = []
+    queue = WriteBehind(apply, log, max_delay=0.2)
+    queue.start()
+    try:
+        queue.submit(insert(1, response=None))
+        queue.submit(Update(QUERIES, 'query_id', 1, {"response": 'answer'}, on_commit=[lambda: committed.append(1)]))
+        assert queue.sync(('queries', 1), timeout=2)
+    finally:
+        queue.close()
+    assert apply.batches == [[('insert', ('queries', 1), {"query_id": 1, "response": 'answer'})]]
+    assert committed == [1]
+    assert queue.stats()["merged"] == 1
+
+
+def test_failing_write_is_isolated_and_dropped():
+    apply = Recorder()
+    queue = WriteBehind(apply, log, max_delay=0.05, retries=1)
+    queue.start()
+    try:
+        queue.submit(insert(1), insert(2, bad=True), insert(3))
+        assert queue.sync(timeout=5)
+    finally:
+        queue.close()
+    applied = [key for batch in apply.batches for _, key, _ in batch]
+    assert applied == [('queries', 1), ('queries', 3)]
+    assert queue.stats()["dropped"] == 1
+
+
+def test_close_commits_everything_queued():
+    apply = Recorder()
+    queue = WriteBehind(apply, log, max_delay=10)
+    queue.start()
+    queue.submit(insert(1), insert(2))
+    queue.close()
+    assert sum(len(batch) for batch in apply.batches) == 2
+    assert not queue.running()
+    # After close, writes go straight through
+    queue.submit(insert(3))
+    assert apply.batches[-1][0][1] == ('queries', 3)
+
+
+def test_full_queue_blocks_until_the_writer_catches_up():
+    apply = Recorder()
+    queue = WriteBehind(apply, log, max_delay=0.05, max_batch=2, max_pending=2)
+    queue.start()
+    try:
+        for row_id in range(1, 11):
+            queue.submit(insert(row_id))
+        assert queue.pending() <= 2
+        assert queue.sync(timeout=2)
+    finally:
+        queue.close()
+    assert sum(len(batch) for batch in apply.batches) == 10
+    assert max(len(batch) for batch in apply.batches) <= 2
+
+
+def test_id_allocator_hands_out_unique_ids():
+    lock = threading.Lock()
+    last = {"queries": 0}
+    reserved = []
+
+    def reserve(key, count):
+        with lock:
+            last[key] += count
+            reserved.append(count)
+            return last[key]
+
+    allocator = IdAllocator(reserve, block_size=10, ttl=60)
+    ids = []
+
+    def take():
+        for _ in range(25):
+            value = allocator.next('queries')
+            with lock:
+                ids.append(value)
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == list(range(1, 101))
+    assert len(reserved) == 10
+
+
+def test_id_allocator_abandons_stale_blocks():
+    last = [0]
+
+    def reserve(key, count):
+        last[0] += count
+        return last[0]
+
+    allocator = IdAllocator(reserve, block_size=10, ttl=0.01)
+    assert allocator.next('queries') == 1
+    assert allocator.next('queries') == 2
+    time.sleep(0.02)
+    # The block has expired, so the next id comes from a new one
+    assert allocator.next('queries') == 11
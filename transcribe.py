@@ -0,0 +1,329 @@
+import io
+import itertools
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import Future
+
+import numpy as np
+
+from jobs import QueueFull
+
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30  # Whisper's input window
+READ_SIZE = 64 * 1024
+
+
+class TranscriptionError(Exception):
+    """The audio could not be decoded or transcribed."""
+
+
+class WhisperBackend:
+    """One openai-whisper model kept in memory for the life of the process.
+
+    `model` is a model name ("base", "small.en", ...) or the path of a local
+    checkpoint, so deployments without internet access can ship the weights.
+    """
+
+    def __init__(self, model='base', device='cpu', language='en', threads=0, download_root=None):
+        self.model_name = model
+        self.device = device
+        self.language = language or None  # None detects the language per chunk
+        self.threads = threads
+        self.download_root = download_root
+        self.load_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import torch
+                    import whisper
+                    if self.threads:
+                        torch.set_num_threads(self.threads)
+                    started = time.perf_counter()
+                    model = whisper.load_model(self.model_name, device=self.device, download_root=self.download_root)
+                    self.load_seconds = time.perf_counter() - started
+                    self._model = model
+        return self._model
+
+    def transcribe_batch(self, chunks):
+        import torch
+        import whisper
+        model = self.load()
+        # Every chunk is padded to the 30 s window, so the batch is one (n, n_mels, 3000) tensor
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(chunk)), n_mels=model.dims.n_mels)
+            for chunk in chunks
+        ]).to(model.device)
+        options = whisper.DecodingOptions(language=self.language, without_timestamps=True,
+                                          fp16=self.device != 'cpu')
+        with torch.inference_mode():
+            results = whisper.decode(model, mels, options)
+        # The same no-speech test whisper.transcribe() uses, so silent chunks don't produce hallucinated text
+        return ['' if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0 else result.text.strip()
+                for result in results]
+
+
+class FakeTranscriber:
+    """Local stand-in for Whisper that spends `rtf` seconds per second of audio."""
+
+    def __init__(self, rtf=0.05, text=None):
+        self.rtf = rtf
+        self.text = text
+        self.load_seconds = 0.0
+        self.loaded = True
+
+    def load(self):
+        return self
+
+    def transcribe_batch(self, chunks):
+        time.sleep(self.rtf * sum(len(chunk) for chunk in chunks) / SAMPLE_RATE)
+        return [self.text or f"Simulated transcript of {len(chunk) / SAMPLE_RATE:.1f} seconds of audio"
+                for chunk in chunks]
+
+
+def create_transcriber(name, model='base', device='cpu', language='en', threads=0, download_root=None,
+                       fake_rtf=0.05, fake_text=None):
+    if name == 'whisper':
+        return WhisperBackend(model, device=device, language=language, threads=threads, download_root=download_root)
+    if name == 'fake':
+        return FakeTranscriber(rtf=fake_rtf, text=fake_text)
+    raise ValueError(f"Unknown transcription backend: {name}")
+
+
+class BatchingTranscriber:
+    """Runs backend.transcribe_batch on one worker thread, batching chunks from concurrent uploads.
+
+    submit() queues one chunk and returns a Future for its text. The worker
+    takes the oldest chunk and waits up to `max_wait` seconds for more to
+    arrive, up to `max_batch`, so a lone request pays at most `max_wait` extra
+    while concurrent requests share one forward pass. At most `max_queue`
+    chunks wait at a time.
+    """
+
+    def __init__(self, backend, max_batch=8, max_wait=0.05, max_queue=64):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._worker = None
+        self.counts = {"chunks": 0, "batches": 0, "failed_batches": 0, "audio_seconds": 0.0, "compute_seconds": 0.0}
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='transcribe', daemon=True)
+                    self._worker.start()
+
+    def saturated(self):
+        return self._queue.full()
+
+    def submit(self, audio, timeout=None):
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put((audio, future), timeout=timeout)
+        except queue.Full:
+            raise QueueFull(f"{self.max_queue} audio chunks already waiting for transcription")
+        return future
+
+    def warm_up(self):
+        # Loads the model and runs one small batch so the first real request doesn't pay for either
+        self.backend.load()
+        self.submit(np.zeros(SAMPLE_RATE, dtype=np.float32)).result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [(audio, future) for audio, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                texts = self.backend.transcribe_batch([audio for audio, _ in batch])
+            except Exception as e:
+                with self._lock:
+                    self.counts["failed_batches"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.counts["batches"] += 1
+                self.counts["chunks"] += len(batch)
+                self.counts["audio_seconds"] += sum(len(audio) for audio, _ in batch) / SAMPLE_RATE
+                self.counts["compute_seconds"] += time.perf_counter() - started
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_batch_size"] = round(stats["chunks"] / stats["batches"], 2) if stats["batches"] else None
+        # Real-time factor: seconds of compute per second of audio
+        stats["rtf"] = round(stats["compute_seconds"] / stats["audio_seconds"], 4) if stats["audio_seconds"] else None
+        stats["model_loaded"] = self.backend.loaded
+        stats["load_seconds"] = self.backend.load_seconds
+        return stats
+
+
+def read_blocks(stream, read_size=READ_SIZE):
+    while True:
+        block = stream.read(read_size)
+        if not block:
+            return
+        yield block
+
+
+def wav_pcm(header, stream, read_size=READ_SIZE):
+    """16-bit PCM bytes of a 16 kHz WAV upload, or None when the file needs resampling or transcoding."""
+    try:
+        buffer = io.BytesIO(header)
+        reader = wave.open(buffer)
+    except (wave.Error, EOFError):
+        return None
+    if reader.getsampwidth() != 2 or reader.getframerate() != SAMPLE_RATE or reader.getnchannels() > 2:
+        return None
+    channels = reader.getnchannels()
+    # wave.open leaves the buffer at the first byte of the data chunk. Writers that stream
+    # WAV leave the size at 0 or 0xFFFFFFFF, in which case everything that follows is audio.
+    start = buffer.tell()
+    remaining = reader.getnframes() * channels * 2
+    if remaining == 0 or remaining >= 0xFFFFFFFF - start:
+        remaining = None
+
+    def blocks():
+        nonlocal remaining
+        for data in itertools.chain([header[start:]], read_blocks(stream, read_size)):
+            if remaining is not None:
+                data = data[:remaining]
+                remaining -= len(data)
+            if data:
+                yield data
+            if remaining == 0:
+                return
+
+    return channels, blocks()
+
+
+def ffmpeg_pcm(header, stream, read_size=READ_SIZE):
+    """Decode any container ffmpeg understands to mono 16 kHz 16-bit PCM while the upload is still arriving."""
+    import ffmpeg
+    process = (
+        ffmpeg.input('pipe:0')
+        .output('pipe:1', format='s16le', acodec='pcm_s16le', ac=1, ar=SAMPLE_RATE)
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+
+    def feed():
+        try:
+            process.stdin.write(header)
+            for block in read_blocks(stream, read_size):
+                process.stdin.write(block)
+        except (BrokenPipeError, OSError, ValueError):
+            # ffmpeg gave up on the input (its error is on stderr) or the generator was closed
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name='ffmpeg-feed', daemon=True)
+    feeder.start()
+
+    def blocks():
+        finished = False
+        try:
+            for block in read_blocks(process.stdout, read_size):
+                yield block
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.wait()
+            feeder.join()
+            if finished and process.returncode != 0:
+                message = process.stderr.read().decode(errors='replace').strip()
+                raise TranscriptionError(f"Could not decode audio: {message or 'ffmpeg failed'}")
+
+    return 1, blocks()
+
+
+def decode_audio(stream, read_size=READ_SIZE):
+    """Yield float32 mono 16 kHz blocks decoded from an upload stream.
+
+    16 kHz 16-bit WAV is read directly; anything else is piped through ffmpeg.
+    """
+    header = stream.read(READ_SIZE)
+    if not header:
+        raise TranscriptionError("The audio upload is empty")
+    decoded = wav_pcm(header, stream, read_size) if header[:4] == b'RIFF' and header[8:12] == b'WAVE' else None
+    channels, blocks = decoded or ffmpeg_pcm(header, stream, read_size)
+    frame_bytes = 2 * channels
+    leftover = b''
+    for block in blocks:
+        data = leftover + block
+        usable = len(data) - len(data) % frame_bytes
+        leftover = data[usable:]
+        if usable:
+            samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+            yield samples.reshape(-1, channels).mean(axis=1) if channels > 1 else samples
+
+
+def quiet_point(samples, frame=SAMPLE_RATE // 10):
+    # Middle of the lowest-energy 100 ms frame, so cuts fall between words where possible
+    frames = len(samples) // frame
+    if frames == 0:
+        return len(samples)
+    energy = np.square(samples[:frames * frame].reshape(frames, frame)).mean(axis=1)
+    return int(energy.argmin()) * frame + frame // 2
+
+
+def iter_chunks(blocks, chunk_seconds=CHUNK_SECONDS, max_seconds=None, search_seconds=5):
+    """Group decoded blocks into chunks of at most `chunk_seconds`, cut at the quietest
+    point of each window's last `search_seconds`. Chunks are yielded as soon as they
+    are complete, so transcription starts before the whole upload is decoded."""
+    window = chunk_seconds * SAMPLE_RATE
+    search = min(search_seconds * SAMPLE_RATE, window // 4)
+    pending, pending_samples, total = [], 0, 0
+    for block in blocks:
+        total += len(block)
+        if max_seconds and total > max_seconds * SAMPLE_RATE:
+            raise TranscriptionError(f"Audio is longer than {max_seconds} seconds")
+        pending.append(block)
+        pending_samples += len(block)
+        if pending_samples < window:
+            continue
+        buffer = np.concatenate(pending)
+        while len(buffer) >= window:
+            cut = window - search + quiet_point(buffer[window - search:window])
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+        pending, pending_samples = [buffer], len(buffer)
+    # A trailing fragment under 100 ms holds no speech worth a forward pass
+    if pending_samples >= SAMPLE_RATE // 10:
+        yield np.concatenate(pending)
@@ -0,0 +1,287 @@
+import atexit
+import itertools
+import os
+import threading
+import time
+
+
+class Insert:
+    """A row to insert into `table`. `key` identifies the row, so an Update queued
+    while the insert is still buffered is folded into its values. The `on_commit`
+    callbacks run once the row is committed. `events` are (name, data) pairs for
+    apply() to record in the same transaction as the row."""
+
+    kind = 'insert'
+
+    def __init__(self, table, key, values, sync_keys=(), on_commit=(), events=()):
+        self.table = table
+        self.key = key
+        self.values = values
+        self.sync_keys = (key, *sync_keys)
+        self.on_commit = list(on_commit)
+        self.events = list(events)
+        self.seq = None
+
+
+class Update:
+    """New values for the row `table.c[pk] == id`."""
+
+    kind = 'update'
+
+    def __init__(self, table, pk, id, values, sync_keys=(), on_commit=(), events=()):
+        self.table = table
+        self.pk = pk
+        self.id = id
+        self.key = (table.name, id)
+        self.values = values
+        self.sync_keys = (self.key, *sync_keys)
+        self.on_commit = list(on_commit)
+        self.events = list(events)
+        self.seq = None
+
+
+class WriteBehind:
+    """Buffers row writes and applies them on one thread in group commits.
+
+    submit() returns as soon as the writes are queued. The writer thread takes
+    everything queued, up to `max_batch` writes, once the oldest has waited
+    `max_delay` seconds (or at once when the batch is full or a reader is
+    waiting) and hands it to `apply(writes)`, which must apply them in one
+    transaction, so a burst of requests pays for one commit instead of one
+    each. At most `max_pending` writes wait; beyond that submit() blocks until
+    the writer catches up.
+
+    Durability: a write is committed when its batch is, normally within
+    `max_delay` of submit(). close() (also run at interpreter exit) commits
+    everything queued before returning, so graceful shutdowns lose nothing;
+    a process that is killed or crashes loses the writes still queued. A batch
+    that fails is retried, then each write is retried on its own; one that
+    still fails is logged and dropped. With `max_delay` 0 there is no thread
+    and submit() applies the writes before returning.
+
+    sync(key) waits until every write touching `key` (a (table, id) tuple or
+    any other key the write listed) is committed, for reads that must see them.
+    """
+
+    def __init__(self, apply, log, max_batch=200, max_delay=0.02, max_pending=5000, retries=3):
+        self.apply = apply
+        self.log = log
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retries = retries
+        self._cond = threading.Condition()
+        self._queue = []
+        self._buffered_inserts = {}
+        self._last_seq = {}
+        self._seq = itertools.count(1)
+        self._committed = 0
+        self._last_submitted = 0
+        self._flush_requested = False
+        self._closing = False
+        self._context = None
+        self._worker = None
+        self._pid = None
+        self.counts = {"writes": 0, "merged": 0, "applied": 0, "batches": 0, "failed_batches": 0, "dropped": 0,
+                       "commit_seconds": 0.0, "largest_batch": 0}
+
+    @property
+    def enabled(self):
+        return self.max_delay > 0
+
+    def start(self, context=None):
+        """Start the writer thread of this process. `context` returns a context manager
+        that each batch is applied in (e.g. app.app_context)."""
+        if not self.enabled or (self._worker is not None and self._pid == os.getpid()):
+            return
+        with self._cond:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked from a process that had already queued writes: they are its to commit
+                self._queue, self._buffered_inserts, self._last_seq = [], {}, {}
+            self._context = context
+            self._closing = False
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._worker.start()
+        atexit.register(self.close)
+
+    def running(self):
+        return self._worker is not None and self._pid == os.getpid() and not self._closing
+
+    def submit(self, *writes):
+        if not self.running():
+            # Disabled, not started in this process or shutting down: write through
+            self._apply(list(writes))
+            return
+        with self._cond:
+            while len(self._queue) >= self.max_pending:
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait()
+            for write in writes:
+                write.seq = self._last_submitted = next(self._seq)
+                for key in write.sync_keys:
+                    self._last_seq[key] = write.seq
+                buffered = self._buffered_inserts.get(write.key) if write.kind == 'update' else None
+                if buffered is not None:
+                    buffered.values.update(write.values)
+                    buffered.on_commit.extend(write.on_commit)
+                    buffered.events.extend(write.events)
+                    self.counts["merged"] += 1
+                    continue
+                if write.kind == 'insert':
+                    self._buffered_inserts[write.key] = write
+                self._queue.append(write)
+            self.counts["writes"] += len(writes)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def sync(self, key=None, timeout=None):
+        """Wait until the writes touching `key` (or all queued writes) are committed."""
+        if not self.enabled:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._last_seq.get(key) if key is not None else max(self._last_seq.values(), default=None)
+            while target is not None and self._committed < target:
+                if self._worker is None or not self._worker.is_alive():
+                    return False
+                self._flush_requested = True
+                self._cond.notify_all()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Commit everything queued and stop the writer thread."""
+        if not self.enabled or self._worker is None or self._pid != os.getpid():
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            self.log.error("Write-behind queue not drained after %ss, %d writes lost", timeout, self.pending())
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                if self._closing:
+                    return None
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._queue) < self.max_batch and not self._flush_requested and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            for write in batch:
+                if write.kind == 'insert':
+                    self._buffered_inserts.pop(write.key, None)
+            if not self._queue:
+                self._flush_requested = False
+            # Submitters blocked on a full queue can continue
+            self._cond.notify_all()
+            return batch
+
+    def _apply(self, writes):
+        if self._context is None:
+            self.apply(writes)
+        else:
+            with self._context():
+                self.apply(writes)
+        for write in writes:
+            for callback in write.on_commit:
+                try:
+                    callback()
+                except Exception:
+                    self.log.exception("Write-behind commit callback failed")
+
+    def _commit(self, batch):
+        for attempt in range(self.retries):
+            try:
+                self._apply(batch)
+                return
+            except Exception as e:
+                self.log.warning("Write-behind batch of %d failed (attempt %d): %s", len(batch), attempt + 1, e)
+                with self._cond:
+                    self.counts["failed_batches"] += 1
+                time.sleep(0.05 * 2 ** attempt)
+        # Isolate the writes that cannot be applied so the rest still commit
+        for write in batch:
+            try:
+                self._apply([write])
+            except Exception:
+                self.log.exception("Dropping write to %s %s after %d failed batches",
+                                   write.table.name, write.key, self.retries)
+                with self._cond:
+                    self.counts["dropped"] += 1
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            self._commit(batch)
+            with self._cond:
+                self.counts["batches"] += 1
+                self.counts["applied"] += len(batch)
+                self.counts["largest_batch"] = max(self.counts["largest_batch"], len(batch))
+                self.counts["commit_seconds"] += time.perf_counter() - started
+                # Every write older than the oldest one still queued is committed (merged
+                # updates carry a later seq than the insert they were folded into)
+                self._committed = self._queue[0].seq - 1 if self._queue else self._last_submitted
+                for key in [key for key, seq in self._last_seq.items() if seq <= self._committed]:
+                    del self._last_seq[key]
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counts)
+            stats["pending"] = len(self._queue)
+        stats["enabled"] = self.enabled
+        stats["avg_batch_size"] = round(stats["applied"] / stats["batches"], 2) if stats["batches"] else None
+        return stats
+
+
+class IdAllocator:
+    """Hands out primary keys from blocks reserved in the database, so a row's id is
+    known before the row is written.
+
+    reserve(key, count) must atomically claim `count` ids and return the last of
+    them. Ids are unique across processes and increase within one; a block older
+    than `ttl` seconds is abandoned, so ids from different worker processes stay
+    roughly in time order. Unused ids of abandoned blocks are skipped.
+    """
+
+    def __init__(self, reserve, block_size=50, ttl=1.0):
+        self.reserve = reserve
+        self.block_size = block_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def next(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not hand out the ids of its parent's blocks
+                self._blocks, self._pid = {}, os.getpid()
+            block = self._blocks.get(key)
+            now = time.monotonic()
+            if block is None or block[0] > block[1] or now - block[2] > self.ttl:
+                last = self.reserve(key, self.block_size)
+                block = [last - self.block_size + 1, last, now]
+                self._blocks[key] = block
+            block[0] += 1
+            return block[0] - 1